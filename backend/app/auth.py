@@ -1,11 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from . import models, database
+from . import models, database, metrics
+import asyncio
+import os
+import threading
+import time
 
 # Change this in production!
 SECRET_KEY = "change_this_secret_key_in_production"
@@ -15,9 +21,25 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# bcrypt takes 100-300 ms per call; a small dedicated pool keeps logins (and brute-force
+# attempts) off the event loop and from exhausting the default thread pool used by read routes
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+# How long a token subject's User row is reused without a SELECT
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 30))
+PRINCIPAL_CACHE_MAX_ENTRIES = 256
+
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    """
+    Verify a password on the bounded hashing pool instead of the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_pool, verify_password, plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -31,7 +53,44 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+def get_user(db: Session, username: str) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.username == username).first()
+
+# Token subject -> (expires_at, detached User); only found users are cached
+_principals: Dict[str, Tuple[float, models.User]] = {}
+_principals_lock = threading.Lock()
+principal_hits = 0
+principal_misses = 0
+metrics.register_cache_metrics("principal_cache", lambda: (principal_hits, principal_misses))
+
+def _cached_principal(username: str) -> Optional[models.User]:
+    with _principals_lock:
+        entry = _principals.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+def _cache_principal(username: str, user: models.User):
+    with _principals_lock:
+        if len(_principals) >= PRINCIPAL_CACHE_MAX_ENTRIES:
+            _principals.clear()
+        _principals[username] = (time.monotonic() + PRINCIPAL_CACHE_TTL_SECONDS, user)
+
+def invalidate_principals():
+    """
+    Drop cached users; called automatically whenever a User row is written in this process.
+    Other workers pick up changes within PRINCIPAL_CACHE_TTL_SECONDS.
+    """
+    with _principals_lock:
+        _principals.clear()
+
+@event.listens_for(models.User, "after_insert")
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target):
+    invalidate_principals()
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -44,7 +103,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
+    global principal_hits, principal_misses
+    user = _cached_principal(username)
+    if user is not None:
+        principal_hits += 1
+        return user
+    principal_misses += 1
+    # Look the user up off the event loop
+    user = await database.run_read(get_user, username)
     if user is None:
         raise credentials_exception
+    _cache_principal(username, user)
     return user
@@ -0,0 +1,58 @@
+import logging
+import os
+import secrets
+import string
+from . import models, database, auth, catalog, migrations, search, serving
+from .leader import FileLock
+
+logger = logging.getLogger(__name__)
+
+# 多个 worker 同时启动时串行执行初始化，第一个进程完成后其余进程只做检查
+BOOTSTRAP_LOCK_PATH = os.getenv("BOOTSTRAP_LOCK_PATH", "data/bootstrap.lock")
+INITIAL_USERNAME = "Labyrinth"
+
+def create_initial_user(db):
+    """
+    没有任何用户时创建管理员账户并打印随机密码（幂等）
+    """
+    if db.query(models.User).first() is not None:
+        return
+    # Generate a strong random password: 16 characters with letters, digits and symbols
+    alphabet = string.ascii_letters + string.digits + "!@#$%^&*"
+    random_password = ''.join(secrets.choice(alphabet) for i in range(16))
+
+    hashed_password = auth.get_password_hash(random_password)
+    db.add(models.User(username=INITIAL_USERNAME, hashed_password=hashed_password))
+    db.commit()
+
+    # Print credentials for first-time setup
+    print("=" * 60)
+    print("🔐 初始管理员账户已创建:")
+    print(f"   用户名: {INITIAL_USERNAME}")
+    print(f"   密码: {random_password}")
+    print("   ⚠️  请立即登录并妥善保存此密码！")
+    print("=" * 60)
+
+def run():
+    """
+    幂等的启动初始化：建表、执行迁移、建立全文索引、创建初始用户、初始化统计行和分面计数、预压缩静态文件。
+    gunicorn 在 fork worker 之前于 master 中执行一次，每个 worker 启动时再执行一次（此时只做检查），
+    单进程 uvicorn 部署时由 startup 事件执行。
+    """
+    os.makedirs("data/images", exist_ok=True)
+    with FileLock(BOOTSTRAP_LOCK_PATH):
+        models.Base.metadata.create_all(bind=database.engine)
+        migrations.upgrade(database.engine)
+        # 新建的索引要有统计信息，规划器才会按排序选择索引
+        database.analyze()
+        # 同时设置本进程的 FTS_ENABLED 标志，因此每个进程都要执行
+        search.ensure_index()
+        db = database.SessionLocal()
+        try:
+            create_initial_user(db)
+            catalog.init_stats(db)
+            catalog.init_facets(db)
+        finally:
+            db.close()
+        # 前端构建产物的 .br / .gz（构建镜像时已生成的会被跳过）
+        serving.precompress_assets()
@@ -0,0 +1,247 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models, database, schemas, catalog, storage, similarity
+
+logger = logging.getLogger(__name__)
+
+# 单次批量操作最多涉及的图片数，防止一个过宽的过滤条件锁住数据库太久
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 5000))
+# 删除文件的后台线程数：提交后异步删除，不阻塞请求
+BULK_FILE_WORKERS = int(os.getenv("BULK_FILE_WORKERS", 4))
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 500
+# 导入结果中最多返回的错误条数
+IMPORT_MAX_ERRORS = 100
+
+_file_pool = ThreadPoolExecutor(max_workers=BULK_FILE_WORKERS, thread_name_prefix="bulk-unlink")
+
+class SelectionError(Exception):
+    pass
+
+def select_images(db: Session, selection: schemas.BulkSelection) -> Tuple[List[models.Image], List[schemas.BulkItemResult]]:
+    """
+    按 id 列表和/或过滤条件选出图片，返回 (图片列表, 未找到的 id 的失败结果)。
+    没有任何条件或匹配数超过 BULK_MAX_ITEMS 时抛出 SelectionError
+    """
+    has_filter = selection.title_contains or selection.remote_id_min is not None or selection.remote_id_max is not None
+    if not selection.ids and not has_filter:
+        raise SelectionError("Specify ids or a filter")
+    if len(selection.ids) > BULK_MAX_ITEMS:
+        raise SelectionError(f"At most {BULK_MAX_ITEMS} ids per request")
+
+    query = db.query(models.Image)
+    if selection.ids:
+        query = query.filter(models.Image.id.in_(selection.ids))
+    if selection.title_contains:
+        query = query.filter(models.Image.title.contains(selection.title_contains, autoescape=True))
+    if selection.remote_id_min is not None:
+        query = query.filter(models.Image.remote_id >= selection.remote_id_min)
+    if selection.remote_id_max is not None:
+        query = query.filter(models.Image.remote_id <= selection.remote_id_max)
+
+    images = query.order_by(models.Image.id).limit(BULK_MAX_ITEMS + 1).all()
+    if len(images) > BULK_MAX_ITEMS:
+        raise SelectionError(f"Filter matches more than {BULK_MAX_ITEMS} images, narrow it down")
+
+    found = {image.id for image in images}
+    missing = [
+        schemas.BulkItemResult(id=image_id, ok=False, error="Image not found")
+        for image_id in dict.fromkeys(selection.ids) if image_id not in found
+    ]
+    return images, missing
+
+def _summary(images: List[models.Image], results: List[schemas.BulkItemResult]) -> schemas.BulkResult:
+    succeeded = sum(1 for result in results if result.ok)
+    return schemas.BulkResult(
+        matched=len(images), succeeded=succeeded, failed=len(results) - succeeded, results=results
+    )
+
+def _unlink(image: models.Image):
+    try:
+        storage.unlink_blob(image)
+    except Exception as e:
+        logger.error(f"Error deleting files of image {image.id}: {e}")
+
+def delete_images(db: Session, selection: schemas.BulkSelection) -> schemas.BulkResult:
+    """
+    在一个事务中删除选中的图片；提交后把最后一个引用已释放的文件交给后台线程池删除
+    """
+    images, results = select_images(db, selection)
+    orphaned = []
+    for image in images:
+        if storage.release(db, image):
+            orphaned.append(image)
+        db.delete(image)
+        results.append(schemas.BulkItemResult(id=image.id, ok=True))
+    catalog.adjust_image_count(db, -len(images))
+    db.commit()
+
+    for image in orphaned:
+        _file_pool.submit(_unlink, image)
+    return _summary(images, results)
+
+def rename_images(db: Session, request: schemas.BulkRename) -> schemas.BulkResult:
+    """
+    在一个事务中重命名：统一设置 title，或在标题中把 find 替换为 replace
+    """
+    if (request.title is None) == (request.find is None):
+        raise SelectionError("Specify exactly one of title or find")
+    images, results = select_images(db, request)
+    for image in images:
+        title = request.title if request.title is not None else (image.title or "").replace(request.find, request.replace)
+        if not title.strip():
+            results.append(schemas.BulkItemResult(id=image.id, ok=False, error="Title would be empty"))
+            continue
+        image.title = title
+        results.append(schemas.BulkItemResult(id=image.id, ok=True))
+    catalog.bump_version(db)
+    db.commit()
+    return _summary(images, results)
+
+def retag_images(db: Session, request: schemas.BulkRetag) -> schemas.BulkResult:
+    """
+    在一个事务中修改类型标签（image_type / duration）
+    """
+    if request.image_type is None and request.duration is None:
+        raise SelectionError("Specify image_type and/or duration")
+    images, results = select_images(db, request)
+    for image in images:
+        if request.image_type is not None:
+            image.image_type = request.image_type
+        if request.duration is not None:
+            image.duration = request.duration
+        results.append(schemas.BulkItemResult(id=image.id, ok=True))
+    catalog.bump_version(db)
+    db.commit()
+    return _summary(images, results)
+
+def export_ndjson() -> Iterator[bytes]:
+    """
+    逐批导出 images 表，每行一个 JSON 对象（按 id 键集分页，内存占用与总量无关）
+    """
+    db = database.SessionLocal()
+    last_id = 0
+    try:
+        while True:
+            images = db.query(models.Image).filter(
+                models.Image.id > last_id
+            ).order_by(models.Image.id).limit(EXPORT_BATCH_SIZE).all()
+            if not images:
+                break
+            last_id = images[-1].id
+            yield b"".join(
+                schemas.ImageRecord.model_validate(image).model_dump_json().encode() + b"\n"
+                for image in images
+            )
+            # 每批之后释放已导出的对象
+            db.expunge_all()
+    finally:
+        db.close()
+
+_RECORD_FIELDS = ("title", "view_count", "download_count", "duration", "image_type", "mtime")
+
+def fill_content_hashes(records: List[schemas.ImageRecord]):
+    """
+    为缺少 content_hash 的记录计算文件哈希（在线程池中调用，不占用数据库写线程）
+    """
+    for record in records:
+        file_path = os.path.join(storage.IMAGE_DIR, record.local_path)
+        if not record.content_hash and os.path.isfile(file_path):
+            record.content_hash = storage.hash_file(file_path)
+
+def _label(record: schemas.ImageRecord) -> str:
+    return f"remote_id {record.remote_id}" if record.source_id is not None else f"upload {record.local_path}"
+
+def _import_batch(db: Session, records: List[schemas.ImageRecord]) -> Tuple[List[models.Image], int, List[str]]:
+    """
+    抓取的图片按 (source_id, remote_id) 匹配；上传的图片（source_id 为空）的负数 remote_id 只在导出它的库中有意义，
+    改按 content_hash 匹配，新建时重新分配 remote_id，不会覆盖或撞上本库中无关的上传图片
+    """
+    crawled_ids = [r.remote_id for r in records if r.source_id is not None]
+    existing: Dict[tuple, models.Image] = {
+        (image.source_id, image.remote_id): image
+        for image in db.query(models.Image).filter(
+            models.Image.source_id.isnot(None), models.Image.remote_id.in_(crawled_ids)
+        )
+    } if crawled_ids else {}
+    upload_hashes = [r.content_hash for r in records if r.source_id is None and r.content_hash]
+    uploads: Dict[str, List[models.Image]] = {}
+    if upload_hashes:
+        for image in db.query(models.Image).filter(
+            models.Image.source_id.is_(None), models.Image.content_hash.in_(upload_hashes)
+        ).order_by(models.Image.id):
+            uploads.setdefault(image.content_hash, []).append(image)
+
+    created: List[models.Image] = []
+    updated = 0
+    errors = []
+    for record in records:
+        if record.source_id is not None:
+            image = existing.get((record.source_id, record.remote_id))
+        else:
+            # 同一内容上传过多次时逐个对应，重复导入同一份文件不会新增行
+            matches = uploads.get(record.content_hash) if record.content_hash else None
+            image = matches.pop(0) if matches else None
+        if image is not None:
+            for field in _RECORD_FIELDS:
+                setattr(image, field, getattr(record, field))
+            updated += 1
+            continue
+
+        file_path = os.path.join(storage.IMAGE_DIR, record.local_path)
+        if not os.path.isfile(file_path):
+            errors.append(f"{_label(record)}: file {record.local_path} not found")
+            continue
+        image = models.Image(**record.model_dump(exclude={"phash", "created_at"}, exclude_none=True))
+        # 每个新行都持有 blob 引用，删除共享同一文件的其他图片时不会把文件删掉
+        image.content_hash = record.content_hash or storage.hash_file(file_path)
+        if record.source_id is None:
+            image.remote_id = catalog.allocate_upload_remote_id(db)
+        if record.created_at is not None:
+            image.created_at = record.created_at
+        if record.phash is not None:
+            similarity.set_hash(image, similarity.to_unsigned(record.phash))
+        db.add(image)
+        storage.acquire(db, image.local_path, image.content_hash)
+        if record.source_id is not None:
+            existing[(record.source_id, record.remote_id)] = image
+        created.append(image)
+
+    if created or updated:
+        catalog.adjust_image_count(db, len(created))
+        catalog.bump_version(db)
+    db.flush()
+    return created, updated, errors
+
+def import_records(db: Session, records: List[schemas.ImageRecord]) -> Tuple[int, int, List[int], List[str]]:
+    """
+    导入一批记录（由调用方提交）：已存在的图片只更新元数据，新图片要求文件已在 data/images 中。
+    整批写入冲突时回滚并逐行重试，冲突行记入错误。返回 (新增数, 更新数, 新增图片 id, 错误信息)
+    """
+    try:
+        created, updated, errors = _import_batch(db, records)
+        return len(created), updated, [image.id for image in created], errors
+    except IntegrityError:
+        # 例如与并发抓取写入的 (source_id, remote_id) 冲突
+        db.rollback()
+
+    created_count = updated = 0
+    new_ids = []
+    errors = []
+    for record in records:
+        try:
+            created, record_updated, record_errors = _import_batch(db, [record])
+            new_ids.extend(image.id for image in created)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            errors.append(f"{_label(record)}: conflicts with an existing image")
+            continue
+        created_count += len(created)
+        updated += record_updated
+        errors.extend(record_errors)
+    return created_count, updated, new_ids, errors
@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+from . import catalog, metrics, serving
+
+logger = logging.getLogger(__name__)
+
+# 公开读接口（/api/images、/api/search）的响应缓存。
+# 缓存键包含目录版本号：任何写入都会递增版本号，旧条目不再被命中，随 TTL / LRU 自然淘汰。
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 2048))
+# 可选的共享后端，例如 redis://localhost:6379/0（需要安装 redis 包），多个 worker 共用缓存
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "")
+
+# 客户端每次都要用 If-None-Match 重新验证，命中时返回 304
+RESPONSE_CACHE_CONTROL = "no-cache"
+
+class MemoryBackend:
+    """
+    进程内 TTL + LRU 缓存，值为 (响应体, ETag)
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Tuple[bytes, str]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class RedisBackend:
+    """
+    基于 Redis 的共享缓存（可选依赖），条目由 Redis 按 TTL 过期
+    """
+
+    PREFIX = "pighub:response:"
+
+    def __init__(self, url: str, ttl: int):
+        import redis  # 可选依赖，仅在配置了 RESPONSE_CACHE_URL 时需要
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        raw = self.client.get(self.PREFIX + key)
+        if raw is None:
+            return None
+        etag, _, body = raw.partition(b"\n")
+        return body, etag.decode()
+
+    def set(self, key: str, value: Tuple[bytes, str]):
+        body, etag = value
+        self.client.set(self.PREFIX + key, etag.encode() + b"\n" + body, ex=self.ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.PREFIX + "*"):
+            self.client.delete(key)
+
+def _create_backend():
+    if RESPONSE_CACHE_URL.startswith(("redis://", "rediss://")):
+        try:
+            return RedisBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL_SECONDS)
+        except ImportError:
+            logger.warning("redis is not installed, falling back to the in-process response cache")
+    return MemoryBackend(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+
+backend = _create_backend()
+hits = 0
+misses = 0
+metrics.register_cache_metrics("response_cache", lambda: (hits, misses))
+
+def set_backend(new_backend):
+    """
+    替换缓存后端（需实现 get / set / clear）
+    """
+    global backend
+    backend = new_backend
+
+def _request_key(request: Request) -> str:
+    params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{params}"
+
+def cached_json(request: Request, db: Session, build: Callable[[], bytes], by_counters: bool = False) -> Response:
+    """
+    返回缓存的 JSON 响应；未命中时调用 build() 生成响应体。
+    ETag 由目录版本号和请求参数决定，If-None-Match 命中时无需查询和序列化，直接返回 304。
+    by_counters=True 的响应（按浏览 / 下载数排序）同时以计数版本号为键，计数写回后失效
+    """
+    global hits, misses
+    version = str(catalog.get_version(db))
+    if by_counters:
+        version += f".{catalog.get_version(db, catalog.COUNTER_VERSION)}"
+    request_key = _request_key(request)
+    key = f"{version}:{request_key}"
+    etag = f'"{version}-{hashlib.sha1(request_key.encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": RESPONSE_CACHE_CONTROL}
+    if serving.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    cached = backend.get(key)
+    if cached is not None:
+        hits += 1
+        body = cached[0]
+    else:
+        misses += 1
+        body = build()
+        backend.set(key, (body, etag))
+    return Response(body, headers=headers, media_type="application/json")
@@ -0,0 +1,143 @@
+from typing import Dict
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from . import models
+
+# catalog_stats 表中的计数键
+IMAGE_COUNT = "image_count"
+# 目录版本号：任何影响公开读接口结果的写入都会加一，用于响应缓存失效
+CATALOG_VERSION = "catalog_version"
+# 浏览 / 下载计数版本号：计数写回时加一，只有按计数排序的列表以它作为缓存键，
+# 其他响应中的计数允许稍有滞后，不会因为计数写回而整体失效
+COUNTER_VERSION = "counter_version"
+# 最近分配给上传图片的 remote_id（负数，每次减一）
+UPLOAD_REMOTE_ID = "upload_remote_id"
+
+def _seed_stat(db: Session, key: str) -> models.CatalogStat:
+    """
+    首次使用时根据现有数据初始化统计值（只会执行一次全表 COUNT）
+    """
+    # SessionLocal 关闭了 autoflush，先 flush 以便 COUNT 包含本事务中的改动
+    db.flush()
+    value = db.query(models.Image).count() if key == IMAGE_COUNT else 0
+    stat = models.CatalogStat(key=key, value=value)
+    db.add(stat)
+    return stat
+
+# 可筛选的分面列；facet_counts 表由触发器在每次写入时维护，读取分面计数无需 GROUP BY
+FACETS = ("image_type", "duration")
+
+def _facet_trigger_sql(facet: str) -> list:
+    upsert = (
+        "INSERT INTO facet_counts (facet, value, count) VALUES ('{facet}', coalesce({row}.{facet}, ''), {delta}) "
+        "ON CONFLICT (facet, value) DO UPDATE SET count = count + {delta};"
+    )
+    increment = upsert.format(facet=facet, row="new", delta=1)
+    decrement = upsert.format(facet=facet, row="old", delta=-1)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS facet_{facet}_ai AFTER INSERT ON images BEGIN {increment} END",
+        f"CREATE TRIGGER IF NOT EXISTS facet_{facet}_ad AFTER DELETE ON images BEGIN {decrement} END",
+        f"""CREATE TRIGGER IF NOT EXISTS facet_{facet}_au AFTER UPDATE OF {facet} ON images
+            WHEN old.{facet} IS NOT new.{facet} BEGIN {decrement} {increment} END""",
+    ]
+
+def init_facets(db: Session):
+    """
+    创建维护 facet_counts 的触发器；触发器新建时按现有数据重建计数（幂等，启动时调用）
+    """
+    for facet in FACETS:
+        exists = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = :name"),
+            {"name": f"facet_{facet}_ai"}
+        ).first() is not None
+        for ddl in _facet_trigger_sql(facet):
+            db.execute(text(ddl))
+        if not exists:
+            db.query(models.FacetCount).filter(models.FacetCount.facet == facet).delete()
+            db.execute(text(
+                f"INSERT INTO facet_counts (facet, value, count) "
+                f"SELECT '{facet}', coalesce({facet}, ''), COUNT(*) FROM images GROUP BY coalesce({facet}, '')"
+            ))
+    db.commit()
+
+def get_facet_counts(db: Session) -> Dict[str, Dict[str, int]]:
+    """
+    读取各分面取值的图片数（只含计数大于 0 的取值）
+    """
+    facets = {facet: {} for facet in FACETS}
+    for row in db.query(models.FacetCount).filter(models.FacetCount.count > 0):
+        facets.setdefault(row.facet, {})[row.value] = row.count
+    return facets
+
+def init_stats(db: Session):
+    """
+    确保统计行存在（启动时调用，幂等）
+    """
+    for key in (IMAGE_COUNT, CATALOG_VERSION, COUNTER_VERSION):
+        if db.get(models.CatalogStat, key) is None:
+            _seed_stat(db, key)
+    db.commit()
+
+def get_image_count(db: Session) -> int:
+    """
+    读取维护中的图片总数，O(1) 主键查询代替 COUNT(*)
+    """
+    stat = db.get(models.CatalogStat, IMAGE_COUNT)
+    if stat is None:
+        stat = _seed_stat(db, IMAGE_COUNT)
+        db.commit()
+    return stat.value
+
+def _increment(db: Session, key: str, delta: int) -> bool:
+    """
+    原地增减统计值；统计行不存在时返回 False
+    """
+    for _ in range(2):
+        updated = db.query(models.CatalogStat).filter(
+            models.CatalogStat.key == key
+        ).update(
+            {models.CatalogStat.value: models.CatalogStat.value + delta},
+            synchronize_session=False
+        )
+        if updated:
+            return True
+        # 统计行可能刚在本事务中添加、尚未 flush
+        db.flush()
+    return False
+
+def adjust_image_count(db: Session, delta: int):
+    """
+    在调用方的事务内增减图片总数，随调用方一起提交（同时递增目录版本号）
+    """
+    if not delta:
+        return
+    if not _increment(db, IMAGE_COUNT, delta):
+        # 统计行尚不存在：初始化时的 COUNT 已包含本次改动
+        _seed_stat(db, IMAGE_COUNT)
+    bump_version(db)
+
+def allocate_upload_remote_id(db: Session) -> int:
+    """
+    在调用方事务中为上传图片分配一个新的负数 remote_id。读取和递减在一条 UPSERT ... RETURNING 中完成，
+    多个 worker 并发上传也不会拿到相同的值；计数行首次使用时从现有最小的 remote_id 开始
+    """
+    return db.execute(text(
+        "INSERT INTO catalog_stats (key, value) "
+        "VALUES (:key, (SELECT min(coalesce(min(remote_id), 0), 0) - 1 FROM images)) "
+        "ON CONFLICT (key) DO UPDATE SET value = value - 1 RETURNING value"
+    ), {"key": UPLOAD_REMOTE_ID}).scalar()
+
+def get_version(db: Session, key: str = CATALOG_VERSION) -> int:
+    """
+    读取目录版本号（或 key 指定的计数版本号）；响应缓存以它作为键的一部分
+    """
+    stat = db.get(models.CatalogStat, key)
+    return stat.value if stat is not None else 0
+
+def bump_version(db: Session, key: str = CATALOG_VERSION):
+    """
+    在调用方的事务内递增目录版本号。所有修改图片列表、标题、衍生图等公开数据的写入路径都必须调用，
+    提交后旧版本的缓存响应自然失效（多进程部署时同样有效）。计数写回只递增 COUNTER_VERSION
+    """
+    if not _increment(db, key, 1):
+        db.add(models.CatalogStat(key=key, value=1))
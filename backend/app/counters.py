@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+from . import models, database, catalog, metrics
+
+logger = logging.getLogger(__name__)
+
+# 本站的浏览 / 下载计数：请求只在内存中累加，由后台任务定期批量写回 images 表，请求路径上没有写操作。
+# 每个 worker 各自累加、各自写回（UPDATE 为增量，多进程不会互相覆盖）。
+COUNTER_FLUSH_SECONDS = int(os.getenv("COUNTER_FLUSH_SECONDS", 30))
+# 待写回的不同图片数上限，超过后新图片的计数被丢弃，防止伪造 id 撑爆内存
+COUNTER_MAX_PENDING = int(os.getenv("COUNTER_MAX_PENDING", 100000))
+
+# image_id -> [浏览增量, 下载增量]
+_pending: Dict[int, List[int]] = {}
+_lock = threading.Lock()
+_task: Optional[asyncio.Task] = None
+
+COUNTER_EVENTS = metrics.Counter("image_counter_events_total", "View/download events recorded in memory", ("kind",))
+COUNTER_DROPPED = metrics.Counter("image_counter_events_dropped_total", "Events dropped because too many images were pending")
+metrics.Gauge("image_counter_pending_images", "Images with unflushed view/download increments", callback=lambda: len(_pending))
+
+def _record(image_id: int, index: int, kind: str):
+    with _lock:
+        entry = _pending.get(image_id)
+        if entry is None:
+            if len(_pending) >= COUNTER_MAX_PENDING:
+                COUNTER_DROPPED.inc()
+                return
+            entry = _pending[image_id] = [0, 0]
+        entry[index] += 1
+    COUNTER_EVENTS.inc(kind=kind)
+
+def record_view(image_id: int):
+    _record(image_id, 0, "view")
+
+def record_download(image_id: int):
+    _record(image_id, 1, "download")
+
+def _take_pending() -> Dict[int, List[int]]:
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    return pending
+
+def _restore(pending: Dict[int, List[int]]):
+    # 写回失败时把增量放回，下次再试
+    with _lock:
+        for image_id, (views, downloads) in pending.items():
+            entry = _pending.setdefault(image_id, [0, 0])
+            entry[0] += views
+            entry[1] += downloads
+
+_increment = models.Image.__table__.update().where(
+    models.Image.id == bindparam("image_id")
+).values(
+    view_count=models.Image.view_count + bindparam("views"),
+    download_count=models.Image.download_count + bindparam("downloads"),
+)
+
+def _write(db: Session, pending: Dict[int, List[int]]):
+    """
+    一条 executemany UPDATE 写回所有增量（在调用方事务中）
+    """
+    db.execute(_increment, [
+        {"image_id": image_id, "views": views, "downloads": downloads}
+        for image_id, (views, downloads) in pending.items()
+    ])
+    # 只让按计数排序的列表缓存失效，其他缓存响应和 ETag 不受影响
+    catalog.bump_version(db, catalog.COUNTER_VERSION)
+
+async def flush():
+    """
+    把内存中的增量写回数据库
+    """
+    pending = _take_pending()
+    if not pending:
+        return
+    try:
+        await database.run_write(_write, pending)
+    except Exception as e:
+        logger.error(f"Failed to flush counters for {len(pending)} images: {e}")
+        _restore(pending)
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(COUNTER_FLUSH_SECONDS)
+        await flush()
+
+def start():
+    """
+    启动定期写回任务（需在事件循环中调用）
+    """
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_flush_loop())
+
+async def stop():
+    """
+    停止定期任务并写回剩余的增量
+    """
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    await flush()
@@ -1,8 +1,15 @@
 import httpx
+import aiofiles
+import aiofiles.os
 import os
-import uuid
+import random
+import time
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from . import models, database
+from typing import List, Optional, Tuple
+from . import models, database, catalog, derivatives, storage, metrics, http_client
 import logging
 import asyncio
 from datetime import datetime
@@ -16,36 +23,270 @@ IMAGE_DIR = "data/images"
 API_BASE_URL = "https://www.pighub.top/api/images"
 BASE_URL = "https://www.pighub.top"
 
-async def download_image(client: httpx.AsyncClient, image_data: dict, db: Session) -> bool:
+# 单个文件大小上限（字节），超出则中止下载
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 50 * 1024 * 1024))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class DownloadError(Exception):
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+async def stream_to_file(client: httpx.AsyncClient, url: str, dest_path: str) -> Tuple[int, str]:
+    """
+    流式下载到临时文件，完成后原子重命名为目标文件，返回 (字节数, sha256)。
+    文件写入在线程池中进行，不阻塞事件循环，内存占用与文件大小无关。
+    """
+    tmp_path = f"{dest_path}.part"
+    size = 0
+    hasher = storage.new_hasher()
+    started = time.monotonic()
+    try:
+        async with client.stream("GET", url) as response:
+            if response.status_code != 200:
+                raise DownloadError(f"Failed to download {url}: Status {response.status_code}", response.status_code)
+
+            content_length = response.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > MAX_IMAGE_BYTES:
+                raise DownloadError(f"{url} is {content_length} bytes, exceeds limit of {MAX_IMAGE_BYTES}")
+
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > MAX_IMAGE_BYTES:
+                        raise DownloadError(f"{url} exceeds limit of {MAX_IMAGE_BYTES} bytes")
+                    hasher.update(chunk)
+                    await f.write(chunk)
+
+        await aiofiles.os.replace(tmp_path, dest_path)
+    except BaseException:
+        # 清理未完成的临时文件
+        if os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    metrics.CRAWLER_DOWNLOAD_DURATION.observe(elapsed)
+    metrics.CRAWLER_BYTES.inc(size)
+    logger.info(f"Downloaded {url}: {size} bytes in {elapsed:.2f}s ({size / elapsed / 1024:.1f} KiB/s)")
+    return size, hasher.hexdigest()
+
+# 全量同步的下载并发数（默认与共享客户端的连接池大小一致）、每个主机每秒请求数与重试策略
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", http_client.CRAWLER_MAX_CONNECTIONS))
+HOST_REQUESTS_PER_SECOND = float(os.getenv("HOST_REQUESTS_PER_SECOND", 20))
+MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", 4))
+RETRY_BASE_DELAY = 1.0
+
+class HostRateLimiter:
+    """
+    按主机限速：同一主机相邻两次请求的发起间隔不小于 1 / rate 秒
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next_slot = {}
+
+    async def wait(self, url: str):
+        if not self.interval:
+            return
+        host = httpx.URL(url).host
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+rate_limiter = HostRateLimiter(HOST_REQUESTS_PER_SECOND)
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, DownloadError):
+        return error.status_code is not None and (error.status_code >= 500 or error.status_code == 429)
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+async def fetch_with_retry(client: httpx.AsyncClient, url: str, dest_path: str) -> Tuple[int, str]:
+    """
+    带主机限速的下载，5xx/429/超时/连接错误按指数退避重试
+    """
+    attempt = 0
+    while True:
+        await rate_limiter.wait(url)
+        try:
+            return await stream_to_file(client, url, dest_path)
+        except Exception as e:
+            status_code = getattr(e, "status_code", None)
+            metrics.CRAWLER_FAILURES.inc(reason=str(status_code) if status_code else type(e).__name__)
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random() / 2)
+            attempt += 1
+            logger.warning(f"Retrying {url} in {delay:.1f}s (attempt {attempt}/{MAX_RETRIES}): {e!r}")
+            await asyncio.sleep(delay)
+
+# 批量写库：每 DB_BATCH_SIZE 行或每 DB_FLUSH_INTERVAL 秒提交一次
+DB_BATCH_SIZE = int(os.getenv("CRAWL_DB_BATCH_SIZE", 200))
+DB_FLUSH_INTERVAL = float(os.getenv("CRAWL_DB_FLUSH_INTERVAL", 5))
+
+def load_known_remote_ids(db: Session, source_id: int, remote_ids=None) -> set:
+    """
+    一次查询取出该源已镜像的 remote_id 集合；传入 remote_ids 时只查询这些 id
+    """
+    query = db.query(models.Image.remote_id).filter(models.Image.source_id == source_id)
+    if remote_ids is None:
+        return {row[0] for row in query}
+
+    known = set()
+    remote_ids = list(remote_ids)
+    # 分块避免超出 SQLite 参数数量限制
+    for i in range(0, len(remote_ids), 500):
+        chunk = remote_ids[i:i + 500]
+        known.update(row[0] for row in query.filter(models.Image.remote_id.in_(chunk)))
+    return known
+
+def filter_new_images(images_list: list, known: set) -> list:
+    """
+    在任何网络请求之前过滤掉已存在、重复或缺少下载地址的条目
     """
-    下载单张图片并保存到数据库
+    new_images = []
+    seen = set(known)
+    for image_data in images_list:
+        try:
+            remote_id = int(image_data["id"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if remote_id in seen or not image_data.get("thumbnail"):
+            continue
+        seen.add(remote_id)
+        new_images.append(image_data)
+    return new_images
+
+class ImageBatchWriter:
+    """
+    收集下载完成的图片记录，按行数或时间间隔批量提交，避免每张图片一次 commit。
+    写库在专用的数据库写线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, batch_size: int = DB_BATCH_SIZE, flush_interval: float = DB_FLUSH_INTERVAL,
+                 progress_id: Optional[int] = None, done_before: int = 0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.progress_id = progress_id
+        self.done_before = done_before
+        self.written = 0
+        self.failed = 0
+        self._pending = []
+        self._ticker = None
+        self._started = time.monotonic()
+
+    async def __aenter__(self):
+        self._ticker = asyncio.create_task(self._tick())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._ticker.cancel()
+        await self.flush()
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    @property
+    def downloaded(self) -> int:
+        return self.written + len(self._pending)
+
+    async def add(self, image: models.Image):
+        self._pending.append(image)
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        # 没有新行时仍然保存一次进度检查点
+        if not batch and self.progress_id is None:
+            return
+        image_ids = await database.run_write(self._write_batch, batch)
+        # 提交后才有自增 id，交给后台生成缩略图
+        derivatives.enqueue(image_ids)
+        if batch:
+            logger.info(f"Flushed {len(batch)} images to database. Written so far: {self.written}")
+
+    def _write_batch(self, db: Session, batch: list) -> list:
+        """
+        在数据库写线程中执行：批量插入并与进度检查点一起提交，返回新行的 id
+        """
+        image_ids = []
+        try:
+            db.add_all(batch)
+            for image in batch:
+                storage.acquire(db, image.local_path, image.content_hash)
+            catalog.adjust_image_count(db, len(batch))
+            db.flush()
+            image_ids = [image.id for image in batch]
+            self.written += len(batch)
+            self._checkpoint(db)
+            db.commit()
+        except IntegrityError:
+            # 有并发写入的重复 (source_id, remote_id)，逐行重试并跳过冲突行
+            db.rollback()
+            for image in batch:
+                image_id = self._insert_one(db, image)
+                if image_id is not None:
+                    image_ids.append(image_id)
+            self._checkpoint(db)
+            db.commit()
+        return image_ids
+
+    def _checkpoint(self, db: Session):
+        """
+        把本轮同步的进度写入 sync_progress（与图片行在同一事务中提交）
+        """
+        if self.progress_id is None:
+            return
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        db.query(models.SyncProgress).filter(models.SyncProgress.id == self.progress_id).update({
+            models.SyncProgress.done: self.done_before + self.written,
+            models.SyncProgress.failed: self.failed,
+            models.SyncProgress.throughput: round(self.written / elapsed, 2),
+            models.SyncProgress.updated_at: datetime.utcnow(),
+        }, synchronize_session=False)
+
+    def _insert_one(self, db: Session, image: models.Image) -> Optional[int]:
+        try:
+            db.add(image)
+            storage.acquire(db, image.local_path, image.content_hash)
+            catalog.adjust_image_count(db, 1)
+            db.flush()
+            image_id = image.id
+            db.commit()
+            self.written += 1
+            return image_id
+        except IntegrityError:
+            db.rollback()
+            logger.warning(f"Image {image.remote_id} already exists, discarding downloaded file")
+            storage.discard_if_unreferenced(db, image.local_path)
+            return None
+
+async def download_image(client: httpx.AsyncClient, image_data: dict, base_url: Optional[str] = None,
+                         source_id: Optional[int] = None) -> Optional[models.Image]:
+    """
+    下载单张图片，返回待写入数据库的 Image 对象（失败返回 None）
     """
     try:
         remote_id = int(image_data["id"])
-        
-        # 检查是否已存在
-        existing = db.query(models.Image).filter(models.Image.remote_id == remote_id).first()
-        if existing:
-            return False
 
         # 构建下载链接
         thumbnail_path = image_data.get("thumbnail")
         if not thumbnail_path:
-            return False
+            return None
             
         # 如果 thumbnail 已经是完整 URL 则直接使用，否则拼接
         if thumbnail_path.startswith("http"):
             download_url = thumbnail_path
         else:
-            download_url = urljoin(BASE_URL, thumbnail_path)
+            download_url = urljoin(base_url or BASE_URL, thumbnail_path)
 
         logger.info(f"Downloading {download_url}")
         
-        response = await client.get(download_url)
-        if response.status_code != 200:
-            logger.error(f"Failed to download {download_url}: Status {response.status_code}")
-            return False
-        
         # 生成本地文件名
         # 尝试保留原始扩展名
         original_filename = image_data.get("filename", "")
@@ -53,149 +294,348 @@ async def download_image(client: httpx.AsyncClient, image_data: dict, db: Sessio
         if not ext:
             ext = ".jpg" # 默认回退
             
-        local_filename = f"{remote_id}_{uuid.uuid4()}{ext}"
-        local_filepath = os.path.join(IMAGE_DIR, local_filename)
-
-        # 确保目录存在
-        os.makedirs(IMAGE_DIR, exist_ok=True)
+        # 流式保存到临时文件，同时计算哈希，再移动到内容寻址位置
+        staged_path = storage.new_staging_path(ext)
+        _, content_hash = await fetch_with_retry(client, download_url, staged_path)
+        metrics.CRAWLER_IMAGES_FETCHED.inc()
+        local_filename = await storage.store_staged_file(staged_path, content_hash, ext)
 
-        # 保存文件
-        with open(local_filepath, "wb") as f:
-            f.write(response.content)
-
-        # 保存到数据库
-        db_image = models.Image(
+        return models.Image(
             remote_id=remote_id,
+            source_id=source_id,
             title=image_data.get("title", "Untitled"),
-            view_count=image_data.get("view_count", 0),
-            download_count=image_data.get("download_count", 0),
+            view_count=image_data.get("view_count") or 0,
+            download_count=image_data.get("download_count") or 0,
             thumbnail_url=thumbnail_path,
             local_path=local_filename, # 存储相对路径
+            content_hash=content_hash,
             filename=original_filename,
             duration=image_data.get("duration", "static"),
             image_type=image_data.get("image_type", "static"),
             mtime=image_data.get("mtime", 0)
         )
-        db.add(db_image)
-        db.commit()
-        return True
     except Exception as e:
         logger.error(f"Error processing image {image_data.get('id')}: {e}")
-        return False
+        return None
+
+# 增量爬取最多翻页数，防止上游分页异常时无限翻页
+INCREMENTAL_MAX_PAGES = int(os.getenv("INCREMENTAL_MAX_PAGES", 50))
+# 下载失败的条目在之后的爬取中重试的次数上限，以及每次爬取重试的条数
+CRAWL_RETRY_MAX_ATTEMPTS = int(os.getenv("CRAWL_RETRY_MAX_ATTEMPTS", 5))
+CRAWL_RETRY_BATCH_SIZE = 200
+
+def get_high_water_mark(db: Session, source_id: int) -> int:
+    """
+    该源已镜像的最大 remote_id（走 (source_id, remote_id) 索引，O(1)）
+    """
+    return db.query(func.max(models.Image.remote_id)).filter(models.Image.source_id == source_id).scalar() or 0
+
+def get_default_source(db: Session) -> models.SourceURL:
+    """
+    默认的 Pighub 源，不存在时创建（在调用方事务中）
+    """
+    source = db.query(models.SourceURL).filter(models.SourceURL.url == API_BASE_URL).first()
+    if source is None:
+        source = models.SourceURL(url=API_BASE_URL, name="Pighub", interval_minutes=60)
+        db.add(source)
+        db.flush()
+    return source
+
+def _resolve_source(db: Session, source_id: Optional[int]) -> Tuple[int, str, int]:
+    """
+    返回 (源 id, 列表地址, 爬取标记)；未指定源时使用默认的 Pighub 源。
+    还没有完成过一次增量遍历的源以已镜像的最大 remote_id 作为起点
+    """
+    source = db.get(models.SourceURL, source_id) if source_id is not None else None
+    if source is None:
+        source = get_default_source(db)
+    mark = source.crawl_mark
+    if mark is None:
+        mark = get_high_water_mark(db, source.id)
+    return source.id, source.url, mark
+
+def _set_crawl_mark(db: Session, source_id: int, mark: int):
+    source = db.get(models.SourceURL, source_id)
+    if source is not None:
+        source.crawl_mark = mark
+
+def _load_retries(db: Session, source_id: int) -> list:
+    """
+    取出该源待重试的列表条目，已经镜像的条目直接删除
+    """
+    retries = db.query(models.CrawlRetry).filter(
+        models.CrawlRetry.source_id == source_id
+    ).order_by(models.CrawlRetry.remote_id.desc()).limit(CRAWL_RETRY_BATCH_SIZE).all()
+    known = load_known_remote_ids(db, source_id, [retry.remote_id for retry in retries])
+    entries = []
+    for retry in retries:
+        if retry.remote_id in known:
+            db.delete(retry)
+        else:
+            entries.append(retry.data)
+    return entries
 
-async def crawl_pighub(limit: int = 20):
+def _record_failures(db: Session, source_id: int, entries: list):
     """
-    爬取 Pighub API
+    记录下载失败的条目供下次爬取重试；超过 CRAWL_RETRY_MAX_ATTEMPTS 次的放弃
     """
-    db = database.SessionLocal()
+    now = datetime.utcnow()
+    for entry in entries:
+        try:
+            remote_id = int(entry["id"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        stmt = insert(models.CrawlRetry).values(
+            source_id=source_id, remote_id=remote_id, data=entry, attempts=1, updated_at=now
+        ).on_conflict_do_update(
+            index_elements=[models.CrawlRetry.source_id, models.CrawlRetry.remote_id],
+            set_={"data": entry, "attempts": models.CrawlRetry.attempts + 1, "updated_at": now}
+        )
+        db.execute(stmt)
+    expired = db.query(models.CrawlRetry).filter(
+        models.CrawlRetry.source_id == source_id,
+        models.CrawlRetry.attempts >= CRAWL_RETRY_MAX_ATTEMPTS
+    )
+    for retry in expired:
+        logger.warning(f"Giving up on image {retry.remote_id} after {retry.attempts} failed downloads")
+        db.delete(retry)
+
+def _clear_retries(db: Session, source_id: int, remote_ids):
+    db.query(models.CrawlRetry).filter(
+        models.CrawlRetry.source_id == source_id,
+        models.CrawlRetry.remote_id.in_(list(remote_ids))
+    ).delete(synchronize_session=False)
+
+def _listing_ids(images_list: list) -> List[int]:
+    return [int(img.get("id")) for img in images_list if str(img.get("id")).isdigit()]
+
+def _create_log(db: Session, source_id: Optional[int] = None, error_message: Optional[str] = None) -> int:
+    log = models.CrawlLog(status="running", source_id=source_id, error_message=error_message)
+    db.add(log)
+    db.flush()
+    return log.id
+
+def _finish_log(db: Session, log_id: int, status_msg: str, images_found: int, images_downloaded: int,
+                error_msg: Optional[str], source_id: Optional[int] = None):
+    log = db.get(models.CrawlLog, log_id)
+    log.status = status_msg
+    log.images_found = images_found
+    log.images_downloaded = images_downloaded
+    log.error_message = error_msg
+    if source_id is not None:
+        source = db.get(models.SourceURL, source_id)
+        if source is not None:
+            source.last_crawled = datetime.utcnow()
+
+async def crawl_pighub(limit: int = 20, source_id: Optional[int] = None):
+    """
+    增量爬取 Pighub API：按 sort=latest 逐页拉取，直到翻到该源上次完整遍历的标记（crawl_mark）。
+    只有遍历真正到达旧标记（或列表末尾）时才把标记推进到本次第一页的最大 remote_id；
+    中途失败或达到翻页上限时标记不变，下次仍然一直翻到旧标记，补齐没有走到的页。
+    下载失败的条目记入 crawl_retries，在之后的爬取开始时重试。limit 为每页条数。
+    未指定 source_id 时使用默认的 Pighub 源。
+    """
+    source_id, api_url, mark = await database.run_write(_resolve_source, source_id)
+    base_url = urljoin(api_url, "/")
     
-    logger.info(f"Starting crawl from Pighub API")
+    logger.info(f"Starting crawl from {api_url} down to remote_id {mark}")
     
-    log = models.CrawlLog(status="running")
-    db.add(log)
-    db.commit()
+    log_id = await database.run_write(_create_log, source_id)
 
     images_found = 0
     images_downloaded = 0
     status_msg = "success"
     error_msg = None
+    failures = []
 
     try:
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            # 获取列表
-            api_url = f"{API_BASE_URL}?limit={limit}&sort=latest"
-            response = await client.get(api_url)
-            
-            if response.status_code == 200:
-                data = response.json()
+        # 共享的长连接客户端，并发下载数受其连接池上限约束
+        client = http_client.get_client()
+        async with ImageBatchWriter() as writer:
+            async def fetch(img_data):
+                image = await download_image(client, img_data, base_url, source_id)
+                if image is not None:
+                    await writer.add(image)
+                else:
+                    failures.append(img_data)
+
+            # 先重试之前下载失败的条目
+            retries = await database.run_write(_load_retries, source_id)
+            if retries:
+                logger.info(f"Retrying {len(retries)} previously failed images")
+                await asyncio.gather(*(fetch(img_data) for img_data in retries))
+            # 本次已经尝试过的条目在遍历中不再重复下载
+            attempted = set(_listing_ids(retries))
+
+            top = mark
+            complete = False
+            for page in range(1, INCREMENTAL_MAX_PAGES + 1):
+                # 获取列表（条件请求，未变化时上游返回 304）
+                data, changed = await http_client.fetch_listing(
+                    api_url, {"limit": limit, "sort": "latest", "page": page}
+                )
                 images_list = data.get("images", [])
-                images_found = len(images_list)
-                
-                tasks = []
-                for img_data in images_list:
-                    tasks.append(download_image(client, img_data, db))
-                
-                results = await asyncio.gather(*tasks)
-                images_downloaded = sum(results)
+                page_remote_ids = _listing_ids(images_list)
+                if page == 1:
+                    top = max(page_remote_ids + [mark])
+                    # 上次遍历不完整时第一页可能未变化，但仍有没走到的页
+                    if not changed and top <= mark:
+                        logger.info("Latest listing not modified since last crawl, nothing to do")
+                        complete = True
+                        break
+                images_found += len(images_list)
+
+                known = await database.run_read(load_known_remote_ids, source_id, page_remote_ids)
+                new_images = filter_new_images(images_list, known | attempted)
+                await asyncio.gather(*(fetch(img_data) for img_data in new_images))
+
+                # 停止条件：最后一页，或已翻到上次完整遍历的标记
+                if len(images_list) < limit or (page_remote_ids and min(page_remote_ids) <= mark):
+                    complete = True
+                    break
             else:
-                raise Exception(f"API returned status {response.status_code}")
+                logger.warning(f"Incremental crawl stopped after {INCREMENTAL_MAX_PAGES} pages before reaching remote_id {mark}")
+        images_downloaded = writer.written
+        retried = attempted - set(_listing_ids(failures))
+        if retried:
+            await database.run_write(_clear_retries, source_id, retried)
+        if complete and top > mark:
+            await database.run_write(_set_crawl_mark, source_id, top)
+        if failures:
+            error_msg = f"{len(failures)} images failed"
 
     except Exception as e:
         logger.error(f"Crawl failed: {e}")
         status_msg = "failed"
         error_msg = str(e)
+
+    if failures:
+        await database.run_write(_record_failures, source_id, failures)
     
     # 更新日志
-    log.status = status_msg
-    log.images_found = images_found
-    log.images_downloaded = images_downloaded
-    log.error_message = error_msg
-    
-    db.commit()
-    db.close()
+    await database.run_write(_finish_log, log_id, status_msg, images_found, images_downloaded, error_msg, source_id)
     logger.info(f"Finished crawl. Downloaded {images_downloaded}/{images_found}")
 
+def _get_or_create_sync_progress(db: Session) -> int:
+    """
+    获取未完成的同步记录以便续传，没有则新建；返回记录 id
+    """
+    progress = db.query(models.SyncProgress).filter(
+        models.SyncProgress.status == "running"
+    ).order_by(models.SyncProgress.id.desc()).first()
+    if progress is not None:
+        logger.info(f"Resuming unfinished full sync #{progress.id}")
+        return progress.id
+    progress = models.SyncProgress(status="running")
+    db.add(progress)
+    db.flush()
+    return progress.id
+
+def _start_sync_progress(db: Session, progress_id: int, total: int, done_before: int):
+    progress = db.get(models.SyncProgress, progress_id)
+    progress.total = total
+    progress.done_before = progress.done = done_before
+    progress.failed = 0
+
+def _finish_sync_progress(db: Session, progress_id: int, finished: bool):
+    progress = db.get(models.SyncProgress, progress_id)
+    if finished:
+        progress.status = "finished"
+    progress.updated_at = datetime.utcnow()
+
+def has_unfinished_sync(db: Session) -> bool:
+    return db.query(models.SyncProgress).filter(models.SyncProgress.status == "running").first() is not None
+
+async def _download_worker(client: httpx.AsyncClient, queue: asyncio.Queue, writer: ImageBatchWriter, source_id: int,
+                           failures: list):
+    """
+    消费者：从队列中取出条目下载，完成后交给批量写入器；失败的条目收集到 failures
+    """
+    while True:
+        img_data = await queue.get()
+        metrics.CRAWLER_QUEUE_DEPTH.set(queue.qsize())
+        try:
+            if img_data is None:
+                return
+            image = await download_image(client, img_data, source_id=source_id)
+            if image is not None:
+                await writer.add(image)
+            else:
+                writer.failed += 1
+                failures.append(img_data)
+        finally:
+            queue.task_done()
+
 async def crawl_all_images():
     """
-    全量同步所有图片
+    全量同步所有图片。
+    生产者把待下载条目放入有界队列，SYNC_WORKERS 个消费者并发下载，慢请求不会阻塞其他下载；
+    进度定期写入 sync_progress，进程重启后会继续未完成的同步（已入库的图片自动跳过）。
     """
-    db = database.SessionLocal()
     logger.info("Starting FULL SYNC from Pighub API")
     
-    log = models.CrawlLog(status="running", error_message="Full Sync")
-    db.add(log)
-    db.commit()
+    source_id = await database.run_write(lambda db: get_default_source(db).id)
+    log_id = await database.run_write(_create_log, source_id, "Full Sync")
+    progress_id = await database.run_write(_get_or_create_sync_progress)
 
     images_found = 0
     images_downloaded = 0
     status_msg = "success"
     error_msg = None
+    failures = []
 
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=60.0) as client:
-            # 获取全量列表
-            api_url = f"{BASE_URL}/api/all-images"
-            response = await client.get(api_url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                images_list = data.get("images", [])
-                images_found = len(images_list)
-                logger.info(f"Found {images_found} images in full sync list")
-                
-                # 使用信号量限制并发下载数量，避免过大压力
-                sem = asyncio.Semaphore(10)
-                
-                async def safe_download(img_data):
-                    async with sem:
-                        return await download_image(client, img_data, db)
-
-                tasks = []
-                for img_data in images_list:
-                    tasks.append(safe_download(img_data))
-                
-                # 分批处理，避免一次性创建过多任务
-                batch_size = 50
-                for i in range(0, len(tasks), batch_size):
-                    batch = tasks[i:i + batch_size]
-                    results = await asyncio.gather(*batch)
-                    images_downloaded += sum(results)
-                    logger.info(f"Processed batch {i}-{i+len(batch)}. Downloaded so far: {images_downloaded}")
+        client = http_client.get_client()
+        # 获取全量列表。条件请求只缓存 ETag / Last-Modified，不在内存中保留整份列表：
+        # 未变化说明上次同步之后没有新图片，上次失败的条目已记入 crawl_retries，由增量爬取重试
+        api_url = f"{BASE_URL}/api/all-images"
+        data, changed = await http_client.fetch_listing(api_url, keep_body=False)
+        images_list = data.get("images", []) if data is not None else []
+        images_found = len(images_list)
+        logger.info(f"Found {images_found} images in full sync list" if changed else "Full sync list not modified since last sync")
 
-            else:
-                raise Exception(f"API returned status {response.status_code}")
+        # 一次性取出全部已知 id，在下载前过滤
+        known = await database.run_read(load_known_remote_ids, source_id)
+        new_images = filter_new_images(images_list, known)
+        logger.info(f"{len(new_images)} images not yet mirrored")
+
+        done_before = images_found - len(new_images)
+        await database.run_write(_start_sync_progress, progress_id, images_found, done_before)
+
+        queue = asyncio.Queue(maxsize=SYNC_WORKERS * 2)
+        async with ImageBatchWriter(progress_id=progress_id, done_before=done_before) as writer:
+            workers = [
+                asyncio.create_task(_download_worker(client, queue, writer, source_id, failures))
+                for _ in range(SYNC_WORKERS)
+            ]
+            try:
+                for img_data in new_images:
+                    await queue.put(img_data)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+        images_downloaded = writer.written
+        if writer.failed:
+            error_msg = f"{writer.failed} images failed"
 
     except Exception as e:
         logger.error(f"Full sync failed: {e}")
         status_msg = "failed"
         error_msg = str(e)
+
+    if failures:
+        await database.run_write(_record_failures, source_id, failures)
     
     # 更新日志
-    log.status = status_msg
-    log.images_found = images_found
-    log.images_downloaded = images_downloaded
-    log.error_message = f"Full Sync: {error_msg}" if error_msg else "Full Sync"
-    
-    db.commit()
-    db.close()
+    error_msg = f"Full Sync: {error_msg}" if error_msg else "Full Sync"
+    await database.run_write(_finish_log, log_id, status_msg, images_found, images_downloaded, error_msg)
+
+    # 列表获取失败时保留 running 状态，下次启动继续；否则本轮同步结束
+    await database.run_write(_finish_sync_progress, progress_id, status_msg == "success")
     logger.info(f"Finished FULL SYNC. Downloaded {images_downloaded}/{images_found}")
+    if images_downloaded:
+        # 空库首次同步后表的规模变化很大，立即刷新规划器统计，不等定时任务
+        await asyncio.get_running_loop().run_in_executor(None, database.analyze)
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from PIL import Image as PILImage, ImageSequence
+from . import models, database, catalog, similarity
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = "data/images"
+# 衍生图（缩略图 / 现代格式）存放在 IMAGE_DIR 下的子目录，通过 /images/derived/... 访问
+DERIVED_DIR = "derived"
+THUMBNAIL_WIDTHS = (240, 480)
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+# 编码是 CPU 密集型任务，放到独立进程中执行，不占用事件循环
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", 2))
+
+def _avif_available() -> bool:
+    try:
+        import pillow_avif  # noqa: F401  注册 AVIF 插件（可选依赖）
+    except ImportError:
+        pass
+    PILImage.init()
+    return "AVIF" in PILImage.SAVE
+
+AVIF_ENABLED = _avif_available()
+
+_executor: Optional[ProcessPoolExecutor] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_queue: Optional[asyncio.Queue] = None
+_workers = []
+# 已写回结果但尚未提升目录版本号；队列排空时统一提升一次
+_version_dirty = False
+_busy = 0
+
+def variant_path(local_path: str, width: int, fmt: str) -> str:
+    """
+    衍生图相对 IMAGE_DIR 的路径，例如 derived/123_abc_240.webp
+    """
+    stem = os.path.splitext(local_path)[0]
+    return f"{DERIVED_DIR}/{stem}_{width}.{fmt}"
+
+def _save(frames, out_path: str, fmt: str, animated: bool, durations, loop):
+    # 同一内容可能被并发处理，临时文件名需唯一
+    tmp_path = f"{out_path}.{uuid.uuid4().hex}.part"
+    if fmt == "webp":
+        if animated:
+            frames[0].save(tmp_path, "WEBP", save_all=True, append_images=frames[1:],
+                           duration=durations, loop=loop, quality=WEBP_QUALITY)
+        else:
+            frames[0].save(tmp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        frames[0].save(tmp_path, "AVIF", quality=AVIF_QUALITY)
+    os.replace(tmp_path, out_path)
+
+def render_variants(local_path: str) -> dict:
+    """
+    在子进程中为一张原图生成固定宽度的 WebP（及可用时的 AVIF）衍生图。
+    动图保留动画（仅 WebP），不放大小于目标宽度的原图。
+    同时计算感知哈希，返回 {"variants", "width", "height", "frame_count", "phash"}
+    """
+    src_path = os.path.join(IMAGE_DIR, local_path)
+    variants = []
+    with PILImage.open(src_path) as im:
+        frame_count = getattr(im, "n_frames", 1)
+        animated = getattr(im, "is_animated", False) and frame_count > 1
+        dimensions = {"width": im.width, "height": im.height, "frame_count": frame_count}
+        formats = ["webp"] if animated or not AVIF_ENABLED else ["webp", "avif"]
+        sizes = {}
+        for width in THUMBNAIL_WIDTHS:
+            target = min(width, im.width)
+            sizes[width] = (target, max(1, round(im.height * target / im.width)))
+
+        # 逐帧缩放，只在内存中保留缩小后的帧
+        durations = []
+        frames = {width: [] for width in THUMBNAIL_WIDTHS}
+        for frame in ImageSequence.Iterator(im) if animated else [im]:
+            durations.append(frame.info.get("duration", 100))
+            rgba = frame.convert("RGBA")
+            for width, size in sizes.items():
+                frames[width].append(rgba.resize(size, PILImage.LANCZOS))
+        loop = im.info.get("loop", 0)
+
+    for width in THUMBNAIL_WIDTHS:
+        for fmt in formats:
+            rel_path = variant_path(local_path, width, fmt)
+            out_path = os.path.join(IMAGE_DIR, rel_path)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            _save(frames[width], out_path, fmt, animated, durations, loop)
+            # 记录实际宽度（原图较窄时小于目标宽度），前端据此生成 srcset 描述符
+            variants.append({"width": sizes[width][0], "format": fmt, "path": rel_path})
+    # 与 backfill 相同的解码方式（JPEG 按缩小尺寸解码），哈希才能互相比较
+    return {"variants": variants, **dimensions, "phash": similarity.hash_file(local_path)}
+
+def remove_variants(image: models.Image):
+    """
+    删除图片的所有衍生图文件
+    """
+    for variant in image.variants or []:
+        file_path = os.path.join(IMAGE_DIR, variant["path"])
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # 服务进程里有事件循环、数据库写线程等多个线程，fork 出的子进程可能继承被其他线程持有的锁而死锁，
+        # 因此用 spawn 启动全新的解释器
+        _executor = ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def _load_for_processing(db, image_id: int):
+    """
+    返回 (local_path, 已有的共享处理结果)；图片不存在时返回 None
+    """
+    image = db.get(models.Image, image_id)
+    if image is None or not image.local_path:
+        return None
+    # 相同内容的图片共享同一个文件，也共享衍生图和尺寸信息
+    existing = db.query(
+        models.Image.variants, models.Image.width, models.Image.height, models.Image.frame_count, models.Image.phash
+    ).filter(
+        models.Image.local_path == image.local_path,
+        models.Image.variants.isnot(None),
+        models.Image.width.isnot(None),
+        models.Image.phash.isnot(None)
+    ).first()
+    if existing is None:
+        return image.local_path, None
+    result = dict(existing._mapping)
+    result["phash"] = similarity.to_unsigned(result["phash"])
+    return image.local_path, result
+
+def apply_result(image: models.Image, result: dict):
+    image.variants = result["variants"]
+    image.width = result["width"]
+    image.height = result["height"]
+    image.frame_count = result["frame_count"]
+    similarity.set_hash(image, result.get("phash"))
+    # 上传的图片没有来源元数据，按实际帧数标记动图
+    if image.remote_id <= 0 and result["frame_count"] > 1:
+        image.image_type = "animated"
+        image.duration = "GIF"
+
+def _save_result(db, image_id: int, result: dict):
+    image = db.get(models.Image, image_id)
+    if image is not None:
+        apply_result(image, result)
+
+async def process_image(image_id: int):
+    """
+    生成一张图片的衍生图、读取尺寸和帧数并写回数据库（不提升目录版本号，见 _flush_version）
+    """
+    global _version_dirty
+    try:
+        loaded = await database.run_read(_load_for_processing, image_id)
+        if loaded is None:
+            return
+        local_path, result = loaded
+        if result is None:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(_get_executor(), render_variants, local_path)
+        await database.run_write(_save_result, image_id, result)
+        _version_dirty = True
+    except Exception as e:
+        logger.error(f"Failed to generate derivatives for image {image_id}: {e}")
+
+async def _flush_version():
+    """
+    队列排空后提升一次目录版本号：抓取或批量上传期间逐张写回结果，
+    不会让 /api/images、/api/search 等响应缓存反复失效
+    """
+    global _version_dirty
+    if not _version_dirty:
+        return
+    _version_dirty = False
+    try:
+        await database.run_write(catalog.bump_version)
+    except Exception as e:
+        _version_dirty = True
+        logger.error(f"Failed to bump catalog version after derivatives: {e}")
+
+async def _worker():
+    global _busy
+    while True:
+        image_id = await _queue.get()
+        _busy += 1
+        try:
+            await process_image(image_id)
+        finally:
+            _busy -= 1
+            _queue.task_done()
+        # 最后一个空闲下来的 worker 负责提升版本号
+        if _queue.empty() and _busy == 0:
+            await _flush_version()
+
+def start():
+    """
+    启动后台衍生图队列（需在事件循环中调用）
+    """
+    global _loop, _queue
+    if _queue is not None:
+        return
+    _loop = asyncio.get_running_loop()
+    _queue = asyncio.Queue()
+    for _ in range(DERIVATIVE_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+def stop(wait: bool = False):
+    global _executor
+    for worker in _workers:
+        worker.cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=not wait)
+        _executor = None
+
+def enqueue(image_ids):
+    """
+    把新图片加入衍生图队列；可在任意线程调用，队列未启动时忽略（由 backfill 补齐）
+    """
+    if _queue is None or _loop is None:
+        return
+    for image_id in image_ids:
+        _loop.call_soon_threadsafe(_queue.put_nowait, image_id)
+
+def backfill(batch_size: int = 100):
+    """
+    为所有尚无衍生图或尺寸信息的图片批量生成衍生图（使用进程池并行编码）
+    """
+    db = database.SessionLocal()
+    executor = _get_executor()
+    done = 0
+    last_id = 0
+    try:
+        while True:
+            images = db.query(models.Image).filter(
+                models.Image.id > last_id,
+                (models.Image.variants.is_(None)) | (models.Image.width.is_(None))
+            ).order_by(models.Image.id).limit(batch_size).all()
+            if not images:
+                break
+            last_id = images[-1].id
+            futures = [(image, executor.submit(render_variants, image.local_path)) for image in images]
+            for image, future in futures:
+                try:
+                    apply_result(image, future.result())
+                    done += 1
+                except Exception as e:
+                    logger.error(f"Failed to generate derivatives for image {image.id}: {e}")
+            catalog.bump_version(db)
+            db.commit()
+            logger.info(f"Backfilled derivatives for {done} images")
+    finally:
+        db.close()
+        stop(wait=True)
+
+if __name__ == "__main__":
+    # 为已有图片补齐衍生图：python -m app.derivatives backfill
+    if sys.argv[1:] == ["backfill"]:
+        logging.basicConfig(level=logging.INFO)
+        backfill()
+    else:
+        print("Usage: python -m app.derivatives backfill")
@@ -0,0 +1,37 @@
+import json
+from datetime import datetime
+from typing import Any, Iterable
+from . import models, schemas
+
+# 读接口的快速序列化：直接把查询到的列转成 dict 再用 orjson 编码，跳过逐行的 Pydantic 校验。
+# 输出与 schemas.Image 的 model_dump_json 一致；未安装 orjson 时退回标准库 json。
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+# schemas.Image 的全部字段，按同名列查询
+IMAGE_FIELDS = tuple(schemas.Image.model_fields)
+IMAGE_COLUMNS = tuple(getattr(models.Image, field) for field in IMAGE_FIELDS)
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+def image_row(row) -> dict:
+    """
+    把按 IMAGE_COLUMNS 查询的行（或 Image ORM 对象）转换成与 schemas.Image 相同结构的 dict
+    """
+    data = row._asdict() if hasattr(row, "_asdict") else {field: getattr(row, field) for field in IMAGE_FIELDS}
+    if data["variants"] is None:
+        data["variants"] = []
+    return data
+
+def image_list(rows: Iterable) -> list:
+    return [image_row(row) for row in rows]
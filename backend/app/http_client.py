@@ -0,0 +1,100 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 爬虫共用的长连接客户端：连接池、keep-alive 与 TLS 会话在多次爬取之间复用
+CRAWLER_MAX_CONNECTIONS = int(os.getenv("CRAWLER_MAX_CONNECTIONS", 20))
+CRAWLER_MAX_KEEPALIVE = int(os.getenv("CRAWLER_MAX_KEEPALIVE", 10))
+CRAWLER_KEEPALIVE_EXPIRY = float(os.getenv("CRAWLER_KEEPALIVE_EXPIRY", 60))
+CRAWLER_CONNECT_TIMEOUT = float(os.getenv("CRAWLER_CONNECT_TIMEOUT", 10))
+CRAWLER_READ_TIMEOUT = float(os.getenv("CRAWLER_READ_TIMEOUT", 60))
+CRAWLER_WRITE_TIMEOUT = 30.0
+# 全量同步时大量下载排队等待连接，等待连接池的时间不应算作失败
+CRAWLER_POOL_TIMEOUT = float(os.getenv("CRAWLER_POOL_TIMEOUT", 600))
+# 需要安装 h2（httpx[http2]），仅对 HTTPS 上游通过 ALPN 协商生效
+CRAWLER_HTTP2 = os.getenv("CRAWLER_HTTP2", "1") != "0"
+USER_AGENT = "PighubMirror/1.0"
+LISTING_CACHE_SIZE = 64
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    """
+    返回共享的爬虫客户端，首次调用时创建（应用启动时创建，关闭时由 close 释放）
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = CRAWLER_HTTP2 and _http2_available()
+        _client = httpx.AsyncClient(
+            http2=http2,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(
+                max_connections=CRAWLER_MAX_CONNECTIONS,
+                max_keepalive_connections=CRAWLER_MAX_KEEPALIVE,
+                keepalive_expiry=CRAWLER_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=CRAWLER_CONNECT_TIMEOUT,
+                read=CRAWLER_READ_TIMEOUT,
+                write=CRAWLER_WRITE_TIMEOUT,
+                pool=CRAWLER_POOL_TIMEOUT,
+            ),
+        )
+        logger.info(f"Created crawler HTTP client (http2={http2}, max_connections={CRAWLER_MAX_CONNECTIONS})")
+    return _client
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _listing_cache.clear()
+
+# 列表接口的条件请求缓存：url -> (ETag, Last-Modified, 已解析的 JSON 或 None)
+_listing_cache: "OrderedDict[str, Tuple[Optional[str], Optional[str], Optional[dict]]]" = OrderedDict()
+
+async def fetch_listing(url: str, params: Optional[dict] = None, keep_body: bool = True) -> Tuple[Optional[dict], bool]:
+    """
+    获取列表接口 JSON，带 If-None-Match / If-Modified-Since。
+    返回 (数据, 是否有变化)；上游返回 304 时复用上次的数据，只花费一次往返。
+    keep_body=False 时只缓存 ETag / Last-Modified（用于很大且很少重复请求的列表），304 时返回 (None, False)
+    """
+    client = get_client()
+    key = str(httpx.URL(url, params=params))
+    headers = {}
+    cached = _listing_cache.get(key)
+    if cached is not None:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    response = await client.get(url, params=params, headers=headers)
+    if response.status_code == 304 and cached is not None:
+        _listing_cache.move_to_end(key)
+        return cached[2], False
+    if response.status_code != 200:
+        raise Exception(f"API returned status {response.status_code}")
+
+    data = response.json()
+    etag = response.headers.get("etag")
+    last_modified = response.headers.get("last-modified")
+    if etag or last_modified:
+        _listing_cache[key] = (etag, last_modified, data if keep_body else None)
+        _listing_cache.move_to_end(key)
+        while len(_listing_cache) > LISTING_CACHE_SIZE:
+            _listing_cache.popitem(last=False)
+    return data, True
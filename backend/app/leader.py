@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境：只会运行单个进程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 多 worker 部署时只有持有该文件锁的进程运行调度器和全量同步。
+# 锁随进程退出由内核自动释放，其他 worker 定期重试接管。
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", "data/leader.lock")
+LEADER_RETRY_SECONDS = int(os.getenv("LEADER_RETRY_SECONDS", 30))
+
+class FileLock:
+    """
+    基于 flock 的进程间排他锁（同一主机上的所有 worker 共享 data 目录）
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+_leader_lock = FileLock(LEADER_LOCK_PATH)
+_election_task: Optional[asyncio.Task] = None
+
+def is_leader() -> bool:
+    return _leader_lock.held
+
+async def _campaign(on_elected: Callable[[], Awaitable[None]]):
+    while not _leader_lock.acquire(blocking=False):
+        await asyncio.sleep(LEADER_RETRY_SECONDS)
+    logger.info(f"Process {os.getpid()} became leader, starting scheduler")
+    await on_elected()
+
+def start(on_elected: Callable[[], Awaitable[None]]):
+    """
+    参与选主（需在事件循环中调用）。成为 leader 后执行一次 on_elected，
+    之后一直持有锁直到进程退出
+    """
+    global _election_task
+    if _election_task is None:
+        _election_task = asyncio.create_task(_campaign(on_elected))
+
+def stop():
+    global _election_task
+    if _election_task is not None:
+        _election_task.cancel()
+        _election_task = None
+    _leader_lock.release()
@@ -1,27 +1,72 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request, UploadFile, File, Form, Body
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, HTTPException, status, Request, UploadFile, File, Form, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from typing import List
-from . import models, database, auth, schemas
-from .database import engine
+from typing import List, Optional, Union
+from pydantic import ValidationError
+from . import models, database, auth, schemas, catalog, search, derivatives, storage, serving, cache, bootstrap, leader, metrics, http_client, similarity, bulk, counters, tiering, fastjson, scrubber
+from datetime import datetime, timezone
+import asyncio
+import base64
+import json
 import os
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="Image Mirror API")
 
-# Mount static files FIRST (before CORS middleware)
-# Ensure directory exists
-os.makedirs("data/images", exist_ok=True)
-app.mount("/images", StaticFiles(directory="data/images"), name="images")
+# Serve images FIRST (before the SPA catch-all)
+app.include_router(serving.router)
+
+# Frontend assets (built by Vite) are served by serving.serve_asset, using precompressed .br/.gz siblings
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject oversized upload requests before the multipart parser spools them to disk.
+    Checks Content-Length up front and counts bytes for chunked bodies.
+    """
+
+    # Multipart boundaries and the title field on top of the file itself
+    FORM_OVERHEAD = 64 * 1024
+
+    def __init__(self, app):
+        self.app = app
+        self.limits = {
+            "/api/upload": storage.MAX_UPLOAD_BYTES + self.FORM_OVERHEAD,
+            "/api/upload/batch": storage.MAX_UPLOAD_REQUEST_BYTES + self.FORM_OVERHEAD,
+        }
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        detail = f"Request body exceeds limit of {limit} bytes"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            body = json.dumps({"detail": detail}).encode()
+            await send({"type": "http.response.start", "status": 413,
+                        "headers": [(b"content-type", b"application/json"),
+                                    (b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+            return
 
-# Mount frontend static assets (built by Vite)
-# Check if directory exists to avoid errors in dev mode
-if os.path.exists("app/static/assets"):
-    app.mount("/assets", StaticFiles(directory="app/static/assets"), name="assets")
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while the form is being parsed; FastAPI re-raises HTTPException as-is
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadSizeLimitMiddleware)
 
 # Configure CORS (after mounting static files)
 app.add_middleware(
@@ -33,12 +78,15 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Outermost, so the latency covers every other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
 # --- Auth Routes ---
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await database.run_read(auth.get_user, form_data.username)
+    if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -53,18 +101,149 @@ async def read_users_me(current_user: models.User = Depends(auth.get_current_use
 
 # --- Image Routes ---
 
+# Page size bounds for the public list and search endpoints
+MAX_PAGE_SIZE = 100
+# Keyset values are bound as SQLite INTEGER (signed 64-bit)
+_INT64_MIN, _INT64_MAX = -2**63, 2**63 - 1
+
+# Listing orders: sort key columns, most significant first. Each has a matching index,
+# and the last column is unique so the keyset cursor is unambiguous.
+_SORT_KEYS = {
+    "latest": (models.Image.remote_id, models.Image.id),
+    "popular": (models.Image.view_count, models.Image.id),
+    "downloads": (models.Image.download_count, models.Image.id),
+}
+
+def _encode_cursor(image: models.Image, sort: str = "latest") -> str:
+    raw = json.dumps([getattr(image, column.key) for column in _SORT_KEYS[sort]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, sort: str = "latest") -> List[int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(_SORT_KEYS[sort]):
+            raise ValueError("cursor does not match sort")
+        values = [int(value) for value in values]
+        if any(not _INT64_MIN <= value <= _INT64_MAX for value in values):
+            raise ValueError("cursor value out of range")
+        return values
+    except (ValueError, TypeError, OverflowError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # created_at is stored as naive UTC (SQLite CURRENT_TIMESTAMP)
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _image_filters(image_type: Optional[str], duration: Optional[str], mtime_min: Optional[int], mtime_max: Optional[int],
+                   created_min: Optional[datetime], created_max: Optional[datetime]) -> list:
+    filters = []
+    if image_type is not None:
+        filters.append(models.Image.image_type == image_type)
+    if duration is not None:
+        filters.append(models.Image.duration == duration)
+    if mtime_min is not None:
+        filters.append(models.Image.mtime >= mtime_min)
+    if mtime_max is not None:
+        filters.append(models.Image.mtime <= mtime_max)
+    if created_min is not None:
+        filters.append(models.Image.created_at >= _naive_utc(created_min))
+    if created_max is not None:
+        filters.append(models.Image.created_at <= _naive_utc(created_max))
+    return filters
+
 @app.get("/api/images", response_model=schemas.ImagePagination)
-def read_images(page: int = 1, limit: int = 20, db: Session = Depends(database.get_db)):
-    skip = (page - 1) * limit
-    images = db.query(models.Image).order_by(models.Image.remote_id.desc()).offset(skip).limit(limit).all()
-    total = db.query(models.Image).count()
+def read_images(
+    request: Request,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    after_remote_id: Optional[int] = None,
+    sort: str = "latest",
+    image_type: Optional[str] = None,
+    duration: Optional[str] = None,
+    mtime_min: Optional[int] = None,
+    mtime_max: Optional[int] = None,
+    created_min: Optional[datetime] = None,
+    created_max: Optional[datetime] = None,
+    db: Session = Depends(database.get_db)
+):
+    if sort not in _SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(_SORT_KEYS)}")
+    if after_remote_id is not None and not _INT64_MIN <= after_remote_id <= _INT64_MAX:
+        raise HTTPException(status_code=400, detail="after_remote_id out of range")
+    if after_remote_id is not None and sort != "latest":
+        # remote_id is not a key of the popularity orders; page those with the returned cursor
+        raise HTTPException(status_code=400, detail="after_remote_id is only supported with sort=latest; use cursor")
+    filters = _image_filters(image_type, duration, mtime_min, mtime_max, created_min, created_max)
+    # A single facet filter takes its total from the facet summary table instead of COUNT(*)
+    facet = None
+    if len(filters) == 1 and (image_type is not None or duration is not None):
+        facet = ("image_type", image_type) if image_type is not None else ("duration", duration)
+    # Served from the response cache until the next catalog write bumps its version;
+    # popularity orders are also invalidated by counter flushes
+    return cache.cached_json(
+        request, db, lambda: _list_images(db, page, limit, cursor, after_remote_id, sort, filters, facet),
+        by_counters=sort != "latest"
+    )
+
+def _count_images(db: Session, filters: list, facet: Optional[tuple]) -> int:
+    if not filters:
+        return catalog.get_image_count(db)
+    if facet is not None:
+        return catalog.get_facet_counts(db).get(facet[0], {}).get(facet[1], 0)
+    return db.query(func.count(models.Image.id)).filter(*filters).scalar()
+
+def _list_images(db: Session, page: int, limit: int, cursor: Optional[str], after_remote_id: Optional[int],
+                 sort: str = "latest", filters: Optional[list] = None, facet: Optional[tuple] = None) -> bytes:
+    filters = filters or []
+    columns = _SORT_KEYS[sort]
+    # Plain column rows, serialized by orjson without building ORM objects or Pydantic models
+    query = db.query(*fastjson.IMAGE_COLUMNS).filter(*filters).order_by(*(column.desc() for column in columns))
+    after = None
+    if cursor is not None:
+        after = _decode_cursor(cursor, sort)
+    elif after_remote_id is not None:
+        # Every id is positive, so (remote_id, id) < (after_remote_id, 0) means remote_id < after_remote_id
+        after = [after_remote_id, 0]
+
+    if after is not None:
+        # Keyset pagination: seek on the sort index instead of scanning past OFFSET rows
+        images = query.filter(tuple_(*columns) < tuple_(*after)).limit(limit).all()
+    else:
+        skip = (page - 1) * limit
+        images = query.offset(skip).limit(limit).all()
+
+    total = _count_images(db, filters, facet)
+    next_cursor = _encode_cursor(images[-1], sort) if len(images) == limit else None
     
-    return {
-        "data": images,
+    return fastjson.dumps({
+        "data": fastjson.image_list(images),
         "total": total,
         "page": page,
-        "limit": limit
-    }
+        "limit": limit,
+        "next_cursor": next_cursor
+    })
+
+@app.get("/api/images/facets", response_model=schemas.ImageFacets)
+def read_image_facets(request: Request, db: Session = Depends(database.get_db)):
+    # Counts come from the trigger-maintained facet_counts table, no GROUP BY per request
+    return cache.cached_json(
+        request, db, lambda: schemas.ImageFacets(**catalog.get_facet_counts(db)).model_dump_json().encode()
+    )
+
+@app.post("/api/images/{image_id}/view", status_code=204)
+async def record_image_view(image_id: int):
+    # Counted in memory and written back in batches, see counters.py
+    counters.record_view(image_id)
+    return Response(status_code=204)
+
+@app.post("/api/images/{image_id}/download", status_code=204)
+async def record_image_download(image_id: int):
+    counters.record_download(image_id)
+    return Response(status_code=204)
 
 @app.delete("/api/images/{image_id}")
 def delete_image(image_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
@@ -72,57 +251,84 @@ def delete_image(image_id: int, db: Session = Depends(database.get_db), current_
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    # Delete file from disk
-    try:
-        if image.local_path:
-            file_path = os.path.join("data/images", image.local_path)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-    except Exception as e:
-        print(f"Error deleting file: {e}")
-
+    # Files are shared between identical images; only the last reference unlinks them
+    last_reference = storage.release(db, image)
     db.delete(image)
+    catalog.adjust_image_count(db, -1)
     db.commit()
+
+    # Delete file from disk
+    if last_reference:
+        try:
+            storage.unlink_blob(image)
+        except Exception as e:
+            print(f"Error deleting file: {e}")
     return {"ok": True}
 
-@app.post("/api/upload", response_model=schemas.Image)
-async def upload_image(
-    file: UploadFile = File(...),
-    title: str = Form(...),
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
-):
-    import uuid
-    from datetime import datetime
-    
-    # Generate unique filename
-    file_ext = os.path.splitext(file.filename)[1]
-    unique_filename = f"upload_{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join("data/images", unique_filename)
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    
-    # Create database record
+def _insert_uploaded_image(db: Session, db_image: models.Image, size: int) -> schemas.Image:
+    # Uploads have no source ID; each gets a unique negative remote_id from an atomic counter
+    db_image.remote_id = catalog.allocate_upload_remote_id(db)
+    db.add(db_image)
+    storage.acquire(db, db_image.local_path, db_image.content_hash, size)
+    catalog.adjust_image_count(db, 1)
+    db.commit()
+    db.refresh(db_image)
+    return schemas.Image.model_validate(db_image)
+
+async def _store_upload(file: Union[UploadFile, str], title: str) -> schemas.Image:
+    # A part sent without a filename reaches us as a plain form value, not a file
+    if isinstance(file, str) or not file.filename:
+        raise HTTPException(status_code=400, detail="Each file must be sent as a file part with a filename")
+    # Stream to disk in chunks: type is sniffed from magic bytes, size is capped, hash computed on the fly
+    try:
+        local_path, content_hash, size = await storage.save_upload(file)
+    except storage.UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
     db_image = models.Image(
-        remote_id=0,  # Manual upload
         title=title,
         view_count=0,
         download_count=0,
         thumbnail_url="",
-        local_path=unique_filename,
+        local_path=local_path,
+        content_hash=content_hash,
         filename=file.filename,
         duration="图片",
         image_type="static",
         mtime=int(datetime.now().timestamp())
     )
-    db.add(db_image)
-    db.commit()
-    db.refresh(db_image)
-    
-    return db_image
+    # Write on the DB writer thread instead of blocking the event loop
+    result = await database.run_write(_insert_uploaded_image, db_image, size)
+    # Thumbnails, dimensions and animation detection happen in the background
+    derivatives.enqueue([result.id])
+    return result
+
+@app.post("/api/upload", response_model=schemas.Image)
+async def upload_image(
+    file: Union[UploadFile, str] = File(...),
+    title: str = Form(...),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    return await _store_upload(file, title)
+
+@app.post("/api/upload/batch", response_model=List[schemas.UploadResult])
+async def upload_images(
+    files: List[Union[UploadFile, str]] = File(...),
+    titles: List[str] = Form([]),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    if len(files) > storage.MAX_UPLOAD_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {storage.MAX_UPLOAD_FILES} files per request")
+    results = []
+    for index, file in enumerate(files):
+        filename = getattr(file, "filename", None) or ""
+        title = titles[index] if index < len(titles) else os.path.splitext(filename)[0]
+        try:
+            image = await _store_upload(file, title)
+            results.append(schemas.UploadResult(filename=filename, ok=True, image=image))
+        except HTTPException as e:
+            results.append(schemas.UploadResult(filename=filename, ok=False, error=e.detail))
+    return results
 
 @app.put("/api/images/{image_id}/rename", response_model=schemas.Image)
 def rename_image(
@@ -136,26 +342,161 @@ def rename_image(
         raise HTTPException(status_code=404, detail="Image not found")
     
     image.title = title
+    catalog.bump_version(db)
     db.commit()
     db.refresh(image)
     
     return image
 
 @app.get("/api/search", response_model=List[schemas.Image])
-def search_images_endpoint(q: str, db: Session = Depends(database.get_db)):
-    from . import search
-    results = search.search_images(q, db, limit=50)
-    return results
+def search_images_endpoint(
+    request: Request,
+    q: str,
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(database.get_db)
+):
+    def build() -> bytes:
+        results = search.search_images(q, db, limit=limit, offset=(page - 1) * limit)
+        return fastjson.dumps(fastjson.image_list(results))
+    return cache.cached_json(request, db, build)
+
+@app.get("/api/images/{image_id}/similar", response_model=List[schemas.SimilarImage])
+def read_similar_images(
+    image_id: int,
+    max_distance: int = similarity.SIMILAR_MAX_DISTANCE,
+    limit: int = 20,
+    db: Session = Depends(database.get_db)
+):
+    max_distance = max(0, min(max_distance, similarity.SIMILAR_DISTANCE_LIMIT))
+    matches = similarity.find_similar(db, image_id, max_distance=max_distance, limit=max(1, min(limit, 100)))
+    if matches is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return [{"image": image, "distance": distance} for image, distance in matches]
+
+@app.get("/api/admin/duplicates", response_model=List[schemas.DuplicateCluster])
+def read_duplicate_clusters(
+    max_distance: int = similarity.DUPLICATE_MAX_DISTANCE,
+    min_size: int = 2,
+    limit: int = 100,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    max_distance = max(0, min(max_distance, similarity.SIMILAR_DISTANCE_LIMIT))
+    clusters = similarity.find_duplicate_clusters(db, max_distance=max_distance, min_size=max(2, min_size))[:limit]
+    ids = [image_id for members, _ in clusters for image_id in members]
+    images = {image.id: image for image in db.query(models.Image).filter(models.Image.id.in_(ids))} if ids else {}
+    return [
+        {"size": len(members), "max_distance": distance, "images": [images[i] for i in members if i in images]}
+        for members, distance in clusters
+    ]
+
+@app.get("/api/admin/scrub", response_model=schemas.ScrubStatus)
+def read_scrub_status(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return scrubber.get_status(db)
+
+@app.post("/api/admin/scrub", status_code=202)
+def run_scrub(shards: Optional[int] = None, current_user: models.User = Depends(auth.get_current_user)):
+    # Scan the next shards in a background thread, with the configured repair / hash settings;
+    # progress and the report are read from GET /api/admin/scrub
+    if not scrubber.start_incremental(shards=shards):
+        raise HTTPException(status_code=409, detail="A scrub is already running")
+    return {"message": "Scrub started in background"}
+
+# --- Bulk Admin Routes ---
+
+def _run_bulk(fn, db: Session, payload):
+    try:
+        return fn(db, payload)
+    except bulk.SelectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/admin/images/delete", response_model=schemas.BulkResult)
+def bulk_delete_images(payload: schemas.BulkSelection, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    # One transaction for the whole selection; files are removed in the background after commit
+    return _run_bulk(bulk.delete_images, db, payload)
+
+@app.post("/api/admin/images/rename", response_model=schemas.BulkResult)
+def bulk_rename_images(payload: schemas.BulkRename, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return _run_bulk(bulk.rename_images, db, payload)
+
+@app.post("/api/admin/images/retag", response_model=schemas.BulkResult)
+def bulk_retag_images(payload: schemas.BulkRetag, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return _run_bulk(bulk.retag_images, db, payload)
+
+@app.get("/api/admin/export")
+def export_catalog(current_user: models.User = Depends(auth.get_current_user)):
+    filename = f"pighub-images-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson"
+    return StreamingResponse(
+        bulk.export_ndjson(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/admin/import", response_model=schemas.ImportResult)
+async def import_catalog(request: Request, current_user: models.User = Depends(auth.get_current_user)):
+    # Parse the NDJSON body as it streams in and commit every IMPORT_BATCH_SIZE records
+    created = updated = failed = 0
+    errors = []
+    batch = []
+
+    async def flush():
+        nonlocal created, updated, failed
+        records = list(batch)
+        batch.clear()
+        # Hash files of records exported without content_hash off the DB writer thread
+        await asyncio.get_running_loop().run_in_executor(None, bulk.fill_content_hashes, records)
+        try:
+            # Conflicting batches are retried row by row inside import_records
+            batch_created, batch_updated, new_ids, batch_errors = await database.run_write(bulk.import_records, records)
+        except SQLAlchemyError as e:
+            # Earlier batches are already committed; report this one and keep going
+            failed += len(records)
+            errors.append(f"batch of {len(records)} records failed: {e.__class__.__name__}")
+            return
+        created += batch_created
+        updated += batch_updated
+        failed += len(batch_errors)
+        errors.extend(batch_errors)
+        derivatives.enqueue(new_ids)
+
+    def parse(line_number: int, line: bytes):
+        nonlocal failed
+        if not line.strip():
+            return
+        try:
+            batch.append(schemas.ImageRecord.model_validate_json(line))
+        except ValidationError as e:
+            failed += 1
+            errors.append(f"line {line_number}: {e.errors()[0]['msg']}")
+
+    line_number = 0
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            parse(line_number, line)
+            if len(batch) >= bulk.IMPORT_BATCH_SIZE:
+                await flush()
+    parse(line_number + 1, buffer)
+    if batch:
+        await flush()
+    return {"created": created, "updated": updated, "failed": failed, "errors": errors[:bulk.IMPORT_MAX_ERRORS]}
 
 # --- Crawler Routes ---
 
 @app.post("/api/crawl")
-async def trigger_crawl(background_tasks: Request, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    from . import crawler
-    import asyncio
-    
-    # Run in background
-    asyncio.create_task(crawler.crawl_pighub(limit=20))
+async def trigger_crawl(source_id: Optional[int] = None, current_user: models.User = Depends(auth.get_current_user)):
+    from . import crawler, scheduler
+
+    if source_id is None:
+        source_id = await database.run_write(lambda db: crawler.get_default_source(db).id)
+    elif await database.run_read(lambda db: db.get(models.SourceURL, source_id)) is None:
+        raise HTTPException(status_code=404, detail="Source not found")
+    # Run in background, sharing the scheduled job's concurrency limit and per-source lock
+    asyncio.create_task(scheduler.run_source_crawl(source_id))
     return {"message": "Crawl started in background"}
 
 @app.get("/api/logs", response_model=List[schemas.CrawlLog])
@@ -163,60 +504,83 @@ def read_logs(skip: int = 0, limit: int = 20, db: Session = Depends(database.get
     logs = db.query(models.CrawlLog).order_by(models.CrawlLog.created_at.desc()).offset(skip).limit(limit).all()
     return logs
 
+@app.get("/api/sync/status", response_model=schemas.SyncProgress)
+def read_sync_status(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    progress = db.query(models.SyncProgress).order_by(models.SyncProgress.id.desc()).first()
+    if not progress:
+        raise HTTPException(status_code=404, detail="No full sync has run yet")
+    return {
+        "id": progress.id,
+        "status": progress.status,
+        "total": progress.total or 0,
+        "done": progress.done or 0,
+        "failed": progress.failed or 0,
+        "pending": max((progress.total or 0) - (progress.done or 0) - (progress.failed or 0), 0),
+        "throughput": progress.throughput or 0,
+        "started_at": progress.started_at,
+        "updated_at": progress.updated_at
+    }
+
 # Initial User Setup
-@app.on_event("startup")
-def create_initial_user():
-    db = database.SessionLocal()
-    user = db.query(models.User).first()
-    if not user:
-        import secrets
-        import string
-        # Generate a strong random password: 16 characters with letters, digits and symbols
-        alphabet = string.ascii_letters + string.digits + "!@#$%^&*"
-        random_password = ''.join(secrets.choice(alphabet) for i in range(16))
-        
-        hashed_password = auth.get_password_hash(random_password)
-        db_user = models.User(username="Labyrinth", hashed_password=hashed_password)
-        db.add(db_user)
-        db.commit()
-        
-        # Print credentials for first-time setup
-        print("=" * 60)
-        print("🔐 初始管理员账户已创建:")
-        print(f"   用户名: Labyrinth")
-        print(f"   密码: {random_password}")
-        print("   ⚠️  请立即登录并妥善保存此密码！")
-        print("=" * 60)
-    
-    # Check if we need to run full sync
-    image_count = db.query(models.Image).count()
-    if image_count == 0:
-        print("Database is empty. Triggering FULL SYNC...")
-        from . import crawler
-        import asyncio
+async def start_background_jobs():
+    # Runs in exactly one process (the leader) when several workers serve the app
+    from . import crawler, scheduler
+    has_images = await database.run_read(catalog.get_image_count) > 0
+    if not has_images or await database.run_read(crawler.has_unfinished_sync):
+        print("Database is empty or a full sync was interrupted. Triggering FULL SYNC...")
         asyncio.create_task(crawler.crawl_all_images())
+    scheduler.start_scheduler()
 
-    db.close()
-    
-    # Start Scheduler
+@app.on_event("startup")
+def startup():
+    # Idempotent: tables, migrations, search index, initial user and stats
+    bootstrap.run()
+
+    # Cache index.html and pig.svg in memory
+    serving.load_static_assets()
+
+    # Start background thumbnail/WebP generation
+    derivatives.start()
+
+    # Periodic write-back of view/download counts
+    counters.start()
+
+    # Periodic write-back of original file access times (LRU eviction order)
+    tiering.start()
+
+    # One pooled keep-alive client for all crawls, closed on shutdown
+    http_client.get_client()
+
+    # Only the leader runs the scheduler and the full sync; the others keep retrying the lock
+    leader.start(start_background_jobs)
+
+@app.on_event("shutdown")
+async def shutdown_workers():
     from . import scheduler
-    scheduler.start_scheduler()
+    if scheduler.scheduler.running:
+        scheduler.scheduler.shutdown(wait=False)
+    leader.stop()
+    derivatives.stop()
+    await counters.stop()
+    await tiering.stop()
+    await http_client.close()
 
-from fastapi.responses import FileResponse
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    # Prometheus text exposition format, per worker process
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-# Serve specific static files before catch-all
+# Serve specific static files before catch-all (kept in memory, loaded at startup)
 @app.get("/pig.svg")
-async def serve_pig_svg():
-    from fastapi.responses import FileResponse
-    pig_path = "app/static/pig.svg"
-    if os.path.exists(pig_path):
-        return FileResponse(pig_path, media_type="image/svg+xml")
-    raise HTTPException(status_code=404, detail="Not found")
+async def serve_pig_svg(request: Request):
+    response = serving.pig_svg.response(request)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return response
 
 # Catch-all for SPA
 @app.get("/{full_path:path}")
-async def serve_spa(full_path: str):
-    from fastapi.responses import FileResponse
+async def serve_spa(full_path: str, request: Request):
     # API requests should have been handled by specific routes or return 404 if not found
     if full_path.startswith("api") or full_path.startswith("images") or full_path.startswith("assets"):
          raise HTTPException(status_code=404, detail="Not Found")
@@ -224,10 +588,7 @@ async def serve_spa(full_path: str):
     # Serve index.html for all other routes (client-side routing)
     # In dev mode, this might fail if static files aren't built, but we use Vite dev server in dev.
     # This is for production Docker container.
-    index_path = "app/static/index.html"
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
+    response = serving.index_html.response(request)
+    if response is not None:
+        return response
     return {"message": "Frontend not built or not found. Please run in Docker or build frontend."}
-
-
-
@@ -0,0 +1,250 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# 轻量的 Prometheus 文本格式指标（不依赖 prometheus_client）。
+# 指标按进程统计：多 worker 部署时每个 worker 各自暴露，/metrics 返回处理该请求的 worker 的数据。
+
+# 超过该耗时（毫秒）的请求记录一条包含 SQL 明细的警告日志，0 表示关闭
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 0))
+SLOW_REQUEST_TOP_QUERIES = 5
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+JOB_BUCKETS = (0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+_registry: List["_Metric"] = []
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Gauge(_Metric):
+    """
+    普通 Gauge；传入 callback 时在导出时取值（用于缓存命中率、队列长度等已有状态）
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self._callback is not None:
+            return [f"{self.name} {_format_value(self._callback())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class CallbackCounter(Gauge):
+    """
+    导出由其他模块维护的单调计数（如缓存命中数）
+    """
+    kind = "counter"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数..., +Inf 计数], 总和
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+# --- HTTP ---
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+
+# --- Database ---
+
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ("operation",))
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("operation",), DB_BUCKETS)
+
+# --- Crawler ---
+
+CRAWLER_IMAGES_FETCHED = Counter("crawler_images_fetched_total", "Images downloaded from upstream")
+CRAWLER_BYTES = Counter("crawler_bytes_downloaded_total", "Bytes downloaded from upstream")
+CRAWLER_FAILURES = Counter(
+    "crawler_download_failures_total", "Failed download attempts by HTTP status or error type", ("reason",))
+CRAWLER_DOWNLOAD_DURATION = Histogram(
+    "crawler_download_duration_seconds", "Time to stream one image from upstream", (), LATENCY_BUCKETS)
+CRAWLER_QUEUE_DEPTH = Gauge("crawler_queue_depth", "Images waiting in the full sync download queue")
+
+# --- Scheduler ---
+
+SCHEDULER_JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds", "Scheduled job run time", ("job",), JOB_BUCKETS)
+SCHEDULER_JOB_FAILURES = Counter("scheduler_job_failures_total", "Scheduled job runs that raised", ("job",))
+
+def register_cache_metrics(name: str, stats: Callable[[], Tuple[int, int]]):
+    """
+    为已有的缓存注册命中数、未命中数和命中率（stats 返回 (hits, misses)）
+    """
+    def ratio() -> float:
+        hits, misses = stats()
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    CallbackCounter(f"{name}_hits_total", f"{name} hits", callback=lambda: stats()[0])
+    CallbackCounter(f"{name}_misses_total", f"{name} misses", callback=lambda: stats()[1])
+    Gauge(f"{name}_hit_ratio", f"{name} hit ratio since start", callback=ratio)
+
+# --- 单请求 SQL 明细（用于慢请求日志） ---
+
+_request_queries: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_queries", default=None)
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+    return word if word in ("select", "insert", "update", "delete", "pragma") else "other"
+
+def instrument_engine(engine):
+    """
+    通过 SQLAlchemy 事件统计每条 SQL 的次数与耗时
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = _operation(statement)
+        DB_QUERIES.inc(operation=operation)
+        DB_QUERY_DURATION.observe(elapsed, operation=operation)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries.append((elapsed, statement))
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件：按路由模板记录请求耗时，超过 SLOW_REQUEST_MS 时输出 SQL 明细
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        queries = [] if SLOW_REQUEST_MS > 0 else None
+        token = _request_queries.set(queries)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            route = scope.get("route")
+            # 未匹配具体路由（挂载的静态目录、404）时不使用原始路径，避免标签基数无限增长
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(elapsed, method=scope["method"], route=route_path, status=status)
+            if queries is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+                _log_slow_request(scope, status, elapsed, queries)
+
+def _log_slow_request(scope, status: int, elapsed: float, queries: list):
+    db_time = sum(duration for duration, _ in queries)
+    slowest = sorted(queries, key=lambda q: q[0], reverse=True)[:SLOW_REQUEST_TOP_QUERIES]
+    breakdown = "; ".join(f"{duration * 1000:.1f}ms {' '.join(statement.split())[:200]}" for duration, statement in slowest)
+    logger.warning(
+        f"Slow request {scope['method']} {scope['path']} -> {status} in {elapsed * 1000:.1f}ms "
+        f"({len(queries)} queries, {db_time * 1000:.1f}ms in SQLite): {breakdown}"
+    )
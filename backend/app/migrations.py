@@ -0,0 +1,122 @@
+import logging
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# 新建数据库由 create_all 直接生成完整表结构；以下迁移用于升级已有的 data/app.db。
+# 每个迁移按 revision 顺序执行一次，已执行的 revision 记录在 schema_version 表中，
+# 迁移函数本身也需要幂等（create_all 新建的表已经包含这些列）。
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    rows = conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+    return any(row[1] == column for row in rows)
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str):
+    if not _has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def _0001_image_variants(conn: Connection):
+    _add_column(conn, "images", "variants", "JSON")
+
+def _0002_image_content_hash(conn: Connection):
+    _add_column(conn, "images", "content_hash", "VARCHAR")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_content_hash ON images (content_hash)"))
+
+def _0003_image_dimensions(conn: Connection):
+    _add_column(conn, "images", "width", "INTEGER")
+    _add_column(conn, "images", "height", "INTEGER")
+    _add_column(conn, "images", "frame_count", "INTEGER")
+
+def _0004_image_phash(conn: Connection):
+    _add_column(conn, "images", "phash", "BIGINT")
+    for band in range(4):
+        column = f"phash_b{band}"
+        _add_column(conn, "images", column, "INTEGER")
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_images_{column} ON images ({column})"))
+
+def _0005_image_popularity_indexes(conn: Connection):
+    # 计数为 NULL 的行无法参与键集分页，也无法被增量 UPDATE 累加
+    conn.execute(text("UPDATE images SET view_count = 0 WHERE view_count IS NULL"))
+    conn.execute(text("UPDATE images SET download_count = 0 WHERE download_count IS NULL"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_view_count_id ON images (view_count, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_download_count_id ON images (download_count, id)"))
+
+def _0006_image_facet_indexes(conn: Connection):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_image_type_remote_id ON images (image_type, remote_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_duration_remote_id ON images (duration, remote_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_mtime ON images (mtime)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_created_at ON images (created_at)"))
+
+def _0007_blob_access_tracking(conn: Connection):
+    _add_column(conn, "blobs", "last_access", "BIGINT")
+    _add_column(conn, "blobs", "evicted", "BOOLEAN NOT NULL DEFAULT 0")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_blobs_evicted_last_access ON blobs (evicted, last_access)"))
+
+def _0008_image_local_path_index(conn: Connection):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_local_path_id ON images (local_path, id)"))
+
+def _0009_source_crawl_mark(conn: Connection):
+    _add_column(conn, "source_urls", "crawl_mark", "BIGINT")
+
+# crawler.API_BASE_URL at the time of this migration
+_PIGHUB_API_URL = "https://www.pighub.top/api/images"
+
+def _0010_image_source_id(conn: Connection):
+    _add_column(conn, "images", "source_id", "INTEGER REFERENCES source_urls (id)")
+    crawled = conn.execute(text("SELECT 1 FROM images WHERE remote_id > 0 AND source_id IS NULL LIMIT 1")).first()
+    if crawled is not None:
+        # 之前没有记录来源，已爬取的图片都归到默认的 Pighub 源（不存在时创建；已配置其他源时创建为停用）
+        conn.execute(text(
+            "INSERT INTO source_urls (url, name, interval_minutes, is_active) "
+            "SELECT :url, 'Pighub', 60, NOT EXISTS (SELECT 1 FROM source_urls) "
+            "WHERE NOT EXISTS (SELECT 1 FROM source_urls WHERE url = :url)"
+        ), {"url": _PIGHUB_API_URL})
+        conn.execute(text(
+            "UPDATE images SET source_id = (SELECT id FROM source_urls WHERE url = :url) "
+            "WHERE remote_id > 0 AND source_id IS NULL"
+        ), {"url": _PIGHUB_API_URL})
+    # remote_id 只在同一个源内唯一
+    conn.execute(text("DROP INDEX IF EXISTS ix_images_remote_id"))
+    conn.execute(text("CREATE INDEX ix_images_remote_id ON images (remote_id)"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_images_source_id_remote_id ON images (source_id, remote_id)"))
+
+def _0011_image_facet_sort_indexes(conn: Connection):
+    for facet in ("image_type", "duration"):
+        # 分面过滤 + 按计数排序时沿索引取前 N 行，不必扫描整个分面再排序
+        for counter in ("view_count", "download_count"):
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_images_{facet}_{counter}_id ON images ({facet}, {counter}, id)"
+            ))
+        # 分面 + 时间范围的总数只读索引
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_images_{facet}_mtime ON images ({facet}, mtime)"))
+
+MIGRATIONS = [
+    ("0001", "add images.variants", _0001_image_variants),
+    ("0002", "add images.content_hash", _0002_image_content_hash),
+    ("0003", "add images.width/height/frame_count", _0003_image_dimensions),
+    ("0004", "add images.phash and band indexes", _0004_image_phash),
+    ("0005", "add images popularity sort indexes", _0005_image_popularity_indexes),
+    ("0006", "add images facet filter indexes", _0006_image_facet_indexes),
+    ("0007", "add blobs.last_access/evicted", _0007_blob_access_tracking),
+    ("0008", "add images local_path index", _0008_image_local_path_index),
+    ("0009", "add source_urls.crawl_mark", _0009_source_crawl_mark),
+    ("0010", "add images.source_id, unique per (source_id, remote_id)", _0010_image_source_id),
+    ("0011", "add images facet + sort / mtime indexes", _0011_image_facet_sort_indexes),
+]
+
+def upgrade(engine: Engine):
+    """
+    执行所有尚未应用的迁移（幂等，可在每次启动时调用）
+    """
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (revision VARCHAR PRIMARY KEY)"))
+        applied = {row[0] for row in conn.execute(text("SELECT revision FROM schema_version"))}
+
+    for revision, description, migrate in MIGRATIONS:
+        if revision in applied:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_version (revision) VALUES (:r)"), {"r": revision})
+        logger.info(f"Applied migration {revision}: {description}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, BigInteger, Float, JSON, Index, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -20,6 +20,9 @@ class SourceURL(Base):
     interval_minutes = Column(Integer, default=60)
     last_crawled = Column(DateTime(timezone=True), nullable=True)
     is_active = Column(Boolean, default=True)
+    # Top remote_id of the last incremental walk that reached down to the previous mark;
+    # only advanced after such a complete walk, see crawler.crawl_pighub
+    crawl_mark = Column(BigInteger, nullable=True)
     
     logs = relationship("CrawlLog", back_populates="source")
 
@@ -27,7 +30,8 @@ class Image(Base):
     __tablename__ = "images"
 
     id = Column(Integer, primary_key=True, index=True)
-    remote_id = Column(Integer, unique=True, index=True) # Pighub ID
+    remote_id = Column(Integer, index=True) # ID at the source; unique per source, negative for uploads
+    source_id = Column(Integer, ForeignKey("source_urls.id"), nullable=True) # Source the image was crawled from, NULL for uploads
     title = Column(String)
     view_count = Column(Integer, default=0)
     download_count = Column(Integer, default=0)
@@ -37,9 +41,42 @@ class Image(Base):
     duration = Column(String) # e.g. "图片", "GIF"
     image_type = Column(String) # e.g. "static", "animated"
     mtime = Column(BigInteger) # Unix timestamp
+    variants = Column(JSON, nullable=True) # [{"width": 240, "format": "webp", "path": "derived/..."}]
+    content_hash = Column(String, index=True, nullable=True) # sha256 of the file, see Blob
+    width = Column(Integer, nullable=True) # Filled in by the background derivative worker
+    height = Column(Integer, nullable=True)
+    frame_count = Column(Integer, nullable=True)
+    # 64-bit dHash (stored signed) and its four 16-bit bands for multi-index Hamming lookup, see similarity.py
+    phash = Column(BigInteger, nullable=True)
+    phash_b0 = Column(Integer, index=True, nullable=True)
+    phash_b1 = Column(Integer, index=True, nullable=True)
+    phash_b2 = Column(Integer, index=True, nullable=True)
+    phash_b3 = Column(Integer, index=True, nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Keyset pagination for sort=popular / sort=downloads (id breaks ties),
+    # and facet filters on each sort order or by date range
+    __table_args__ = (
+        Index("ix_images_view_count_id", "view_count", "id"),
+        Index("ix_images_download_count_id", "download_count", "id"),
+        Index("ix_images_image_type_remote_id", "image_type", "remote_id"),
+        Index("ix_images_duration_remote_id", "duration", "remote_id"),
+        Index("ix_images_image_type_view_count_id", "image_type", "view_count", "id"),
+        Index("ix_images_image_type_download_count_id", "image_type", "download_count", "id"),
+        Index("ix_images_duration_view_count_id", "duration", "view_count", "id"),
+        Index("ix_images_duration_download_count_id", "duration", "download_count", "id"),
+        # Covering counts for a facet combined with a modification time range
+        Index("ix_images_image_type_mtime", "image_type", "mtime"),
+        Index("ix_images_duration_mtime", "duration", "mtime"),
+        Index("ix_images_mtime", "mtime"),
+        Index("ix_images_created_at", "created_at"),
+        # Range scans per storage shard in the scrubber
+        Index("ix_images_local_path_id", "local_path", "id"),
+        # Each source has its own id space
+        Index("ux_images_source_id_remote_id", "source_id", "remote_id", unique=True),
+    )
+
 class CrawlLog(Base):
     __tablename__ = "crawl_logs"
 
@@ -52,3 +89,67 @@ class CrawlLog(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     source = relationship("SourceURL", back_populates="logs")
+
+class CrawlRetry(Base):
+    __tablename__ = "crawl_retries"
+
+    # Listing entries whose download failed, retried at the start of the next crawl of their source
+    source_id = Column(Integer, ForeignKey("source_urls.id"), primary_key=True)
+    remote_id = Column(Integer, primary_key=True)
+    data = Column(JSON) # The upstream listing entry, enough to download it again
+    attempts = Column(Integer, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+
+class CatalogStat(Base):
+    __tablename__ = "catalog_stats"
+
+    key = Column(String, primary_key=True) # e.g. "image_count"
+    value = Column(BigInteger, default=0)
+
+class FacetCount(Base):
+    __tablename__ = "facet_counts"
+
+    # Maintained by triggers on images, see catalog.init_facets
+    facet = Column(String, primary_key=True) # "image_type" or "duration"
+    value = Column(String, primary_key=True) # NULL values are counted under ""
+    count = Column(BigInteger, default=0)
+
+class SyncProgress(Base):
+    __tablename__ = "sync_progress"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="running") # "running", "finished"
+    total = Column(Integer, default=0) # Images in the upstream listing
+    done_before = Column(Integer, default=0) # Already mirrored when this run (or resume) started
+    done = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    throughput = Column(Float, default=0) # Images per second in the current run
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    path = Column(String, primary_key=True) # Content-addressed path "ab/cd/<sha256>.ext" relative to data/images
+    content_hash = Column(String, index=True)
+    size = Column(BigInteger)
+    refcount = Column(Integer, default=0) # Number of Image rows pointing at this file
+    last_access = Column(BigInteger, nullable=True) # Unix time the file was last served, for LRU eviction
+    evicted = Column(Boolean, default=False) # File removed to stay within the disk budget, see tiering.py
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_blobs_evicted_last_access", "evicted", "last_access"),
+    )
+
+class ScrubState(Base):
+    __tablename__ = "scrub_state"
+
+    # Single row (id=1) holding the resumable catalog/disk scrubber position, see scrubber.py
+    id = Column(Integer, primary_key=True)
+    cursor = Column(String, nullable=True) # Last finished shard of the current pass; NULL before the first
+    pass_started_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    last_finished_at = Column(DateTime(timezone=True), nullable=True)
+    current_report = Column(Text, nullable=True) # JSON findings accumulated so far in the current pass
+    last_report = Column(Text, nullable=True) # JSON findings of the last complete pass
@@ -1,28 +1,122 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy.orm import Session
-from . import models, database, crawler
+from . import models, database, crawler, metrics, tiering, scrubber, leader
 import asyncio
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
 
-async def check_and_run_crawls():
+# 全局同时运行的爬取任务上限，避免多个源同时触发占满上行带宽
+MAX_CONCURRENT_CRAWLS = int(os.getenv("MAX_CONCURRENT_CRAWLS", 2))
+# 每次触发的随机抖动（秒），错开各个源的执行时间
+JOB_JITTER_SECONDS = int(os.getenv("CRAWL_JOB_JITTER_SECONDS", 120))
+# 重新加载 SourceURL 配置的间隔
+SOURCE_RELOAD_MINUTES = 5
+# 每个源一个文件锁，定时任务与手动触发（可能在其他 worker 中）不会同时爬取同一个源
+CRAWL_LOCK_DIR = "data"
+
+_crawl_slots = None
+
+def _job_id(source_id: int) -> str:
+    return f"source-{source_id}"
+
+def ensure_default_source(db: Session):
     """
-    定期运行爬虫任务
+    没有配置任何源时，写入默认的 Pighub 源（幂等）
     """
-    # 这里我们简化逻辑，直接调用 Pighub 爬虫
-    # 在实际应用中，可以根据 SourceURL 配置来决定爬取哪些源
-    # 但目前需求主要针对 Pighub API
-    from . import crawler
-    await crawler.crawl_pighub(limit=20)
+    if db.query(models.SourceURL).first() is None:
+        crawler.get_default_source(db)
+        db.commit()
+
+async def run_source_crawl(source_id: int) -> bool:
+    """
+    爬取单个源；受全局并发上限约束，同一个源已在爬取时跳过并返回 False
+    """
+    global _crawl_slots
+    if _crawl_slots is None:
+        _crawl_slots = asyncio.Semaphore(MAX_CONCURRENT_CRAWLS)
+    lock = leader.FileLock(os.path.join(CRAWL_LOCK_DIR, f"crawl-{source_id}.lock"))
+    if not lock.acquire(blocking=False):
+        logger.info(f"Crawl of source {source_id} already running, skipped")
+        return False
+    try:
+        await _crawl_source(source_id)
+    finally:
+        lock.release()
+    return True
+
+async def _crawl_source(source_id: int):
+    async with _crawl_slots:
+        job = _job_id(source_id)
+        started = time.perf_counter()
+        try:
+            await crawler.crawl_pighub(limit=20, source_id=source_id)
+        except Exception:
+            metrics.SCHEDULER_JOB_FAILURES.inc(job=job)
+            raise
+        finally:
+            metrics.SCHEDULER_JOB_DURATION.observe(time.perf_counter() - started, job=job)
+
+def sync_source_jobs():
+    """
+    按 SourceURL 表为每个启用的源维护一个定时任务：新增、更新间隔、移除停用的源
+    """
+    db = database.SessionLocal()
+    try:
+        sources = db.query(models.SourceURL).filter(models.SourceURL.is_active == True).all()
+        wanted = {}
+        for source in sources:
+            wanted[_job_id(source.id)] = (source.id, max(source.interval_minutes or 60, 1))
+    finally:
+        db.close()
+
+    for job in scheduler.get_jobs():
+        if job.id.startswith("source-") and job.id not in wanted:
+            job.remove()
+            logger.info(f"Removed crawl job {job.id}")
+
+    for job_id, (source_id, interval) in wanted.items():
+        job = scheduler.get_job(job_id)
+        if job is not None and job.trigger.interval.total_seconds() == interval * 60:
+            continue
+        # max_instances=1：同一个源上一次还没跑完时跳过本次触发
+        scheduler.add_job(
+            run_source_crawl,
+            IntervalTrigger(minutes=interval, jitter=JOB_JITTER_SECONDS),
+            args=[source_id],
+            id=job_id,
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+        logger.info(f"Scheduled crawl job {job_id} every {interval} minutes")
 
 def start_scheduler():
-    # Run the check every 60 minutes (default)
-    # But for testing, maybe every minute? Let's stick to a reasonable default.
-    # User can configure source intervals, but we need a master ticker.
-    scheduler.add_job(check_and_run_crawls, IntervalTrigger(minutes=60))
+    db = database.SessionLocal()
+    try:
+        ensure_default_source(db)
+    finally:
+        db.close()
+
+    sync_source_jobs()
+    # 定期重新读取 SourceURL，使新增/修改的源无需重启即可生效
+    scheduler.add_job(sync_source_jobs, IntervalTrigger(minutes=SOURCE_RELOAD_MINUTES), id="reload-sources", replace_existing=True)
+    if tiering.STORAGE_BUDGET_BYTES > 0:
+        # 淘汰只在 leader 中执行，避免多个 worker 同时删除文件
+        scheduler.add_job(tiering.enforce_budget, IntervalTrigger(minutes=tiering.STORAGE_CHECK_MINUTES),
+                          id="storage-budget", replace_existing=True, max_instances=1, coalesce=True)
+    if scrubber.SCRUB_INTERVAL_MINUTES > 0:
+        # 每次只扫描一部分分片，从游标继续
+        scheduler.add_job(scrubber.run_incremental, IntervalTrigger(minutes=scrubber.SCRUB_INTERVAL_MINUTES),
+                          id="scrub", replace_existing=True, max_instances=1, coalesce=True)
+    if database.ANALYZE_INTERVAL_MINUTES > 0:
+        # 目录增长后刷新查询规划器统计（抽样，耗时很短）
+        scheduler.add_job(database.analyze, IntervalTrigger(minutes=database.ANALYZE_INTERVAL_MINUTES),
+                          id="analyze", replace_existing=True, max_instances=1, coalesce=True)
     scheduler.start()
     logger.info("Scheduler started")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, field_validator
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class SourceURLBase(BaseModel):
@@ -29,14 +29,113 @@ class ImageBase(BaseModel):
     image_type: str
     mtime: int
 
+class ImageVariant(BaseModel):
+    width: int
+    format: str # "webp" or "avif"
+    path: str # Relative to /images, like local_path
+
 class Image(ImageBase):
     id: int
     local_path: str
+    variants: List[ImageVariant] = []
+    width: Optional[int] = None
+    height: Optional[int] = None
+    frame_count: Optional[int] = None
     created_at: datetime
 
+    @field_validator("variants", mode="before")
+    @classmethod
+    def _variants_default(cls, value):
+        return value or []
+
+    class Config:
+        from_attributes = True
+
+class ImageFacets(BaseModel):
+    # Facet value -> number of images; images without a value are counted under ""
+    image_type: Dict[str, int] = {}
+    duration: Dict[str, int] = {}
+
+class SimilarImage(BaseModel):
+    image: Image
+    distance: int
+
+class DuplicateCluster(BaseModel):
+    size: int
+    max_distance: int
+    images: List[Image]
+
+class BulkSelection(BaseModel):
+    # Explicit ids and/or a filter; all given conditions must match
+    ids: List[int] = []
+    title_contains: Optional[str] = None
+    remote_id_min: Optional[int] = None
+    remote_id_max: Optional[int] = None
+
+class BulkRename(BulkSelection):
+    # Either a new title for every image, or a substring replacement
+    title: Optional[str] = None
+    find: Optional[str] = None
+    replace: str = ""
+
+class BulkRetag(BulkSelection):
+    image_type: Optional[str] = None
+    duration: Optional[str] = None
+
+class BulkItemResult(BaseModel):
+    id: int
+    ok: bool
+    error: Optional[str] = None
+
+class BulkResult(BaseModel):
+    matched: int
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+class ImageRecord(ImageBase):
+    # One line of the NDJSON catalog export / import
+    source_id: Optional[int] = None
+    local_path: str
+    content_hash: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    frame_count: Optional[int] = None
+    phash: Optional[int] = None
+    created_at: Optional[datetime] = None
+
     class Config:
         from_attributes = True
 
+class ImportResult(BaseModel):
+    created: int
+    updated: int
+    failed: int
+    errors: List[str]
+
+class ScrubReport(BaseModel):
+    files: int
+    counts: Dict[str, int] # Problem kind -> number found
+    repaired: int
+    samples: Dict[str, List[str]] # Problem kind -> first few paths
+
+class ScrubStatus(BaseModel):
+    running: bool = False # A scan is in progress in this process
+    cursor: Optional[str] = None
+    shards_done: int
+    shards_total: int
+    pass_started_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    last_finished_at: Optional[datetime] = None
+    current: Optional[ScrubReport] = None
+    last: Optional[ScrubReport] = None
+
+class UploadResult(BaseModel):
+    filename: str
+    ok: bool
+    image: Optional[Image] = None
+    error: Optional[str] = None
+
 class CrawlLogBase(BaseModel):
     status: str
     images_found: int
@@ -51,6 +150,20 @@ class CrawlLog(CrawlLogBase):
     class Config:
         from_attributes = True
 
+class SyncProgress(BaseModel):
+    id: int
+    status: str
+    total: int
+    done: int
+    failed: int
+    pending: int
+    throughput: float
+    started_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -63,3 +176,4 @@ class ImagePagination(BaseModel):
     total: int
     page: int
     limit: int
+    next_cursor: Optional[str] = None
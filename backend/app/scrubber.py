@@ -0,0 +1,387 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import and_, tuple_
+from sqlalchemy.orm import Session
+from . import models, database, metrics, storage
+
+logger = logging.getLogger(__name__)
+
+# 目录与数据库对账：按内容寻址的第一级分片（00..ff，外加存放旧文件的根目录 ""）逐片扫描，
+# 每次只处理 SCRUB_SHARDS_PER_RUN 个分片，游标保存在 scrub_state 表中，下次从断点继续。
+# 每个分片用 os.scandir 列出文件，按 local_path 分块读取数据库中的引用，在内存中比较两个集合：
+#   missing  数据库引用的文件不在盘上（被磁盘预算淘汰的除外）
+#   orphan   盘上的文件没有被任何图片引用
+#   corrupt  大小与 blob 记录不符，或（SCRUB_VERIFY_HASH=1 时）内容哈希不符
+IMAGE_DIR = "data/images"
+SCRUB_INTERVAL_MINUTES = int(os.getenv("SCRUB_INTERVAL_MINUTES", 60)) # 0 表示不定时运行
+SCRUB_SHARDS_PER_RUN = int(os.getenv("SCRUB_SHARDS_PER_RUN", 16))
+SCRUB_VERIFY_HASH = os.getenv("SCRUB_VERIFY_HASH", "0") == "1"
+# 默认只报告；开启后删除孤儿文件和过期的临时文件，并把可重新下载的缺失/损坏原图交给 tiering 按需恢复
+SCRUB_REPAIR = os.getenv("SCRUB_REPAIR", "0") == "1"
+SCRUB_HASH_WORKERS = int(os.getenv("SCRUB_HASH_WORKERS", 2))
+# 比这更新的孤儿文件可能是刚下载、还没提交数据库记录的文件，不处理
+SCRUB_ORPHAN_GRACE_SECONDS = int(os.getenv("SCRUB_ORPHAN_GRACE_SECONDS", 3600))
+DB_CHUNK_SIZE = 2000
+# 每种问题在一遍扫描的报告中最多保留的路径数
+REPORT_SAMPLE_SIZE = 100
+
+SHARDS = [""] + [f"{i:02x}" for i in range(256)]
+PROBLEM_KINDS = ("missing", "orphan", "corrupt", "stale_eviction", "staging")
+
+SCRUB_FILES_CHECKED = metrics.Counter("scrub_files_checked_total", "Files examined by the catalog/disk scrubber")
+SCRUB_PROBLEMS = metrics.Counter("scrub_problems_total", "Inconsistencies found by the scrubber", ("kind",))
+SCRUB_REPAIRS = metrics.Counter("scrub_repairs_total", "Inconsistencies repaired by the scrubber", ("kind",))
+
+# 定时任务与手动触发不能同时运行
+_running = threading.Lock()
+
+class Entry:
+    """
+    数据库中一个被引用的文件
+    """
+    __slots__ = ("size", "content_hash", "evicted", "has_blob", "refetchable")
+
+    def __init__(self):
+        self.size = None
+        self.content_hash = None
+        self.evicted = False
+        self.has_blob = False
+        self.refetchable = False
+
+def _empty_report() -> dict:
+    return {"files": 0, "counts": {kind: 0 for kind in PROBLEM_KINDS}, "repaired": 0,
+            "samples": {kind: [] for kind in PROBLEM_KINDS}}
+
+def _shard_filter(shard: str):
+    if shard == "":
+        # 迁移到内容寻址布局之前的文件直接位于 IMAGE_DIR 下
+        return ~models.Image.local_path.contains("/")
+    # '/' 的下一个字符是 '0'，范围查询可以使用 local_path 索引
+    return and_(models.Image.local_path >= f"{shard}/", models.Image.local_path < f"{shard}0")
+
+def _db_entries(db: Session, shard: str) -> Dict[str, Entry]:
+    """
+    按 (local_path, id) 键集分块读取一个分片内被引用的文件
+    """
+    entries: Dict[str, Entry] = {}
+    columns = (models.Image.local_path, models.Image.id, models.Image.remote_id, models.Image.thumbnail_url,
+               models.Blob.size, models.Blob.content_hash, models.Blob.evicted, models.Blob.path)
+    last = None
+    while True:
+        query = db.query(*columns).outerjoin(
+            models.Blob, models.Blob.path == models.Image.local_path
+        ).filter(models.Image.local_path.isnot(None), _shard_filter(shard))
+        if last is not None:
+            query = query.filter(tuple_(models.Image.local_path, models.Image.id) > last)
+        rows = query.order_by(models.Image.local_path, models.Image.id).limit(DB_CHUNK_SIZE).all()
+        if not rows:
+            return entries
+        for local_path, _, remote_id, thumbnail_url, size, content_hash, evicted, blob_path in rows:
+            entry = entries.get(local_path)
+            if entry is None:
+                entry = entries[local_path] = Entry()
+                entry.has_blob = blob_path is not None
+                entry.size = size
+                entry.content_hash = content_hash
+                entry.evicted = bool(evicted)
+            if remote_id and remote_id > 0 and thumbnail_url:
+                entry.refetchable = True
+        last = (rows[-1][0], rows[-1][1])
+
+def _disk_files(shard: str) -> Dict[str, os.stat_result]:
+    """
+    用 os.scandir 列出分片内的文件：相对路径 -> stat（跳过隐藏文件和 derived 等目录）
+    """
+    files: Dict[str, os.stat_result] = {}
+    if shard == "":
+        try:
+            with os.scandir(IMAGE_DIR) as it:
+                for item in it:
+                    if not item.name.startswith(".") and item.is_file(follow_symlinks=False):
+                        files[item.name] = item.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            pass
+        return files
+
+    top = os.path.join(IMAGE_DIR, shard)
+    try:
+        with os.scandir(top) as subdirs:
+            for subdir in subdirs:
+                if not subdir.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(subdir.path) as it:
+                    for item in it:
+                        if not item.name.startswith(".") and item.is_file(follow_symlinks=False):
+                            files[f"{shard}/{subdir.name}/{item.name}"] = item.stat(follow_symlinks=False)
+    except FileNotFoundError:
+        pass
+    return files
+
+def _hash_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=SCRUB_HASH_WORKERS)
+
+def _hash_or_none(rel_path: str) -> Optional[str]:
+    try:
+        return storage.hash_file(os.path.join(IMAGE_DIR, rel_path))
+    except OSError:
+        return None
+
+def _remove(rel_path: str):
+    from . import serving
+    try:
+        os.remove(os.path.join(IMAGE_DIR, rel_path))
+    except FileNotFoundError:
+        pass
+    serving.invalidate(rel_path)
+
+def _set_evicted(db: Session, paths: List[str], evicted: bool):
+    if paths:
+        db.query(models.Blob).filter(models.Blob.path.in_(paths)).update(
+            {models.Blob.evicted: evicted}, synchronize_session=False
+        )
+        db.commit()
+
+def _note(report: dict, kind: str, rel_path: str, detail: str = ""):
+    report["counts"][kind] += 1
+    if len(report["samples"][kind]) < REPORT_SAMPLE_SIZE:
+        report["samples"][kind].append(rel_path)
+    SCRUB_PROBLEMS.inc(kind=kind)
+    logger.warning(f"Scrub: {kind} {rel_path}{' (' + detail + ')' if detail else ''}")
+
+def _repaired(report: dict, kind: str, count: int = 1):
+    if count:
+        report["repaired"] += count
+        SCRUB_REPAIRS.inc(count, kind=kind)
+
+def _scrub_staging(report: dict, repair: bool):
+    """
+    中断的下载/上传会在 .staging 中留下不完整的临时文件
+    """
+    cutoff = time.time() - SCRUB_ORPHAN_GRACE_SECONDS
+    try:
+        with os.scandir(storage.STAGING_DIR) as it:
+            stale = [item for item in it if item.is_file(follow_symlinks=False)
+                     and item.stat(follow_symlinks=False).st_mtime < cutoff]
+    except FileNotFoundError:
+        return
+    for item in stale:
+        _note(report, "staging", f".staging/{item.name}")
+        if repair:
+            try:
+                os.remove(item.path)
+                _repaired(report, "staging")
+            except FileNotFoundError:
+                pass
+
+def scrub_shard(db: Session, shard: str, report: dict, repair: bool = SCRUB_REPAIR,
+                verify_hash: bool = SCRUB_VERIFY_HASH, pool: ThreadPoolExecutor = None):
+    """
+    对账一个分片，把发现的问题累加到 report 中
+    """
+    entries = _db_entries(db, shard)
+    files = _disk_files(shard)
+    report["files"] += len(files)
+    SCRUB_FILES_CHECKED.inc(len(files))
+    cutoff = time.time() - SCRUB_ORPHAN_GRACE_SECONDS
+
+    # 可以交给 tiering 在下次请求时重新下载的缺失原图
+    missing = []
+    # 被标记为淘汰但文件仍在盘上（淘汰时在删除文件前中断）
+    to_unevict = []
+
+    for rel_path, entry in entries.items():
+        if rel_path in files:
+            if entry.evicted:
+                _note(report, "stale_eviction", rel_path)
+                to_unevict.append(rel_path)
+            continue
+        if entry.evicted:
+            continue
+        _note(report, "missing", rel_path, "re-fetchable" if entry.refetchable and entry.has_blob else "unrecoverable")
+        if entry.refetchable and entry.has_blob:
+            missing.append(rel_path)
+
+    orphans = [rel_path for rel_path in files if rel_path not in entries]
+    for rel_path in orphans:
+        _note(report, "orphan", rel_path)
+    if repair:
+        for rel_path in orphans:
+            if files[rel_path].st_mtime < cutoff:
+                _remove(rel_path)
+                _repaired(report, "orphan")
+
+    # 只校验有 blob 记录（知道应有大小和哈希）的文件
+    checked = [(rel_path, entries[rel_path]) for rel_path in files
+               if rel_path in entries and entries[rel_path].has_blob]
+    corrupt = {}
+    for rel_path, entry in checked:
+        if entry.size is not None and files[rel_path].st_size != entry.size:
+            corrupt[rel_path] = f"size {files[rel_path].st_size} != {entry.size}"
+    if verify_hash:
+        # 哈希计算在线程池中进行，线程数限制了同时读盘的文件数
+        candidates = [rel_path for rel_path, entry in checked if entry.content_hash and rel_path not in corrupt]
+        digests = pool.map(_hash_or_none, candidates) if pool is not None else map(_hash_or_none, candidates)
+        for rel_path, digest in zip(candidates, digests):
+            if digest is not None and digest != entries[rel_path].content_hash:
+                corrupt[rel_path] = f"sha256 {digest}"
+    for rel_path, detail in corrupt.items():
+        _note(report, "corrupt", rel_path, detail)
+    # 损坏的可重新下载原图删除后按被淘汰处理，下次请求时重新下载并校验哈希
+    damaged = [rel_path for rel_path in corrupt if entries[rel_path].refetchable]
+
+    if repair:
+        for rel_path in damaged:
+            _remove(rel_path)
+        _set_evicted(db, missing + damaged, True)
+        _repaired(report, "missing", len(missing))
+        _repaired(report, "corrupt", len(damaged))
+        # 淘汰任务可能在扫描之后才删除文件，取消标记前再确认一次
+        to_unevict = [rel_path for rel_path in to_unevict
+                      if rel_path not in corrupt and os.path.exists(os.path.join(IMAGE_DIR, rel_path))]
+        _set_evicted(db, to_unevict, False)
+        _repaired(report, "stale_eviction", len(to_unevict))
+
+    if shard == "":
+        _scrub_staging(report, repair)
+
+def _get_state(db: Session) -> models.ScrubState:
+    state = db.get(models.ScrubState, 1)
+    if state is None:
+        state = models.ScrubState(id=1)
+        db.add(state)
+        db.flush()
+    return state
+
+def _load(value: Optional[str]) -> Optional[dict]:
+    return json.loads(value) if value else None
+
+def _merge(total: dict, part: dict):
+    total["files"] += part["files"]
+    total["repaired"] += part["repaired"]
+    for kind in PROBLEM_KINDS:
+        total["counts"][kind] += part["counts"][kind]
+        room = REPORT_SAMPLE_SIZE - len(total["samples"][kind])
+        total["samples"][kind].extend(part["samples"][kind][:max(room, 0)])
+
+def run_incremental(shards: int = None, repair: bool = None, verify_hash: bool = None) -> Optional[dict]:
+    """
+    从保存的游标继续扫描最多 shards 个分片；一遍扫描完成时把累计的报告保存为 last_report。
+    返回本次运行的报告，已有扫描在运行时返回 None
+    """
+    if not _running.acquire(blocking=False):
+        logger.info("Scrub already running, skipped")
+        return None
+    try:
+        return _run(shards, repair, verify_hash)
+    finally:
+        _running.release()
+
+def start_incremental(shards: int = None) -> bool:
+    """
+    在后台线程中运行一次 run_incremental，立即返回；已有扫描在运行时返回 False。
+    进度和报告通过 get_status 查看
+    """
+    if not _running.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            _run(shards, None, None)
+        except Exception as e:
+            logger.error(f"Scrub failed: {e}")
+        finally:
+            _running.release()
+
+    threading.Thread(target=run, name="scrub", daemon=True).start()
+    return True
+
+def _run(shards: Optional[int], repair: Optional[bool], verify_hash: Optional[bool]) -> dict:
+    shards = SCRUB_SHARDS_PER_RUN if shards is None else shards
+    repair = SCRUB_REPAIR if repair is None else repair
+    verify_hash = SCRUB_VERIFY_HASH if verify_hash is None else verify_hash
+    db = database.SessionLocal()
+    report = _empty_report()
+    try:
+        state = _get_state(db)
+        pending = [shard for shard in SHARDS if state.cursor is None or shard > state.cursor]
+        if state.cursor is None:
+            state.pass_started_at = datetime.now(timezone.utc)
+            state.current_report = None
+        db.commit()
+
+        with _hash_pool() as pool:
+            for shard in pending[:max(shards, 1)]:
+                shard_report = _empty_report()
+                scrub_shard(db, shard, shard_report, repair=repair, verify_hash=verify_hash, pool=pool)
+                _merge(report, shard_report)
+                # 每个分片完成后保存游标，中途停止时下次从下一个分片继续
+                state = _get_state(db)
+                total = _load(state.current_report) or _empty_report()
+                _merge(total, shard_report)
+                state.cursor = shard
+                state.updated_at = datetime.now(timezone.utc)
+                if shard == SHARDS[-1]:
+                    state.cursor = None
+                    state.last_report = json.dumps(total)
+                    state.last_finished_at = state.updated_at
+                    state.current_report = None
+                    logger.info(f"Scrub pass finished: {total['files']} files, {total['counts']}, {total['repaired']} repaired")
+                else:
+                    state.current_report = json.dumps(total)
+                db.commit()
+        logger.info(f"Scrubbed {min(len(pending), max(shards, 1))} shards: {report['files']} files, "
+                    f"{report['counts']}, {report['repaired']} repaired")
+        return report
+    finally:
+        db.close()
+
+def run_full(repair: bool = None, verify_hash: bool = None) -> dict:
+    """
+    从头完整扫描一遍（重置游标）
+    """
+    db = database.SessionLocal()
+    try:
+        _get_state(db).cursor = None
+        db.commit()
+    finally:
+        db.close()
+    return run_incremental(shards=len(SHARDS), repair=repair, verify_hash=verify_hash)
+
+def get_status(db: Session) -> dict:
+    state = db.get(models.ScrubState, 1)
+    if state is None:
+        return {"running": _running.locked(), "cursor": None, "shards_done": 0, "shards_total": len(SHARDS)}
+    return {
+        "running": _running.locked(),
+        "cursor": state.cursor,
+        "shards_done": 0 if state.cursor is None else SHARDS.index(state.cursor) + 1,
+        "shards_total": len(SHARDS),
+        "pass_started_at": state.pass_started_at,
+        "updated_at": state.updated_at,
+        "last_finished_at": state.last_finished_at,
+        "current": _load(state.current_report),
+        "last": _load(state.last_report),
+    }
+
+if __name__ == "__main__":
+    # 完整对账一遍：python -m app.scrubber scan [--repair] [--verify-hash]
+    # 查看进度和上一遍的报告：python -m app.scrubber status
+    if sys.argv[1:2] == ["scan"]:
+        logging.basicConfig(level=logging.INFO)
+        result = run_full(repair="--repair" in sys.argv, verify_hash="--verify-hash" in sys.argv)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    elif sys.argv[1:] == ["status"]:
+        db = database.SessionLocal()
+        try:
+            print(json.dumps(get_status(db), indent=2, default=str, ensure_ascii=False))
+        finally:
+            db.close()
+    else:
+        print("Usage: python -m app.scrubber scan [--repair] [--verify-hash] | status")
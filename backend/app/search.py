@@ -1,21 +1,143 @@
+import logging
+import re
+import sys
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
-from . import models
+from . import models, database
 
-def search_images(query: str, db: Session, limit: int = 20):
+logger = logging.getLogger(__name__)
+
+# 是否可用 FTS5 索引（启动时由 ensure_index 检测）
+FTS_ENABLED = False
+
+# 中日韩字符按字切分，其他字符按单词切分
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_WORD_RE = re.compile(r"[^\W_]+")
+
+_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(tokens, tokenize='unicode61')",
+    """CREATE TRIGGER IF NOT EXISTS images_fts_ai AFTER INSERT ON images BEGIN
+        INSERT INTO images_fts(rowid, tokens) VALUES (new.id, cjk_ngrams(new.title));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS images_fts_ad AFTER DELETE ON images BEGIN
+        DELETE FROM images_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS images_fts_au AFTER UPDATE OF title ON images BEGIN
+        UPDATE images_fts SET tokens = cjk_ngrams(new.title) WHERE rowid = new.id;
+    END""",
+]
+
+def _tokenize(value: str):
+    """
+    将标题切分为索引词：中文取单字和相邻双字（bigram），其他文字取小写单词
+    """
+    unigrams, bigrams, words = [], [], []
+    pos = 0
+    for match in _CJK_RE.finditer(value):
+        words.extend(_WORD_RE.findall(value[pos:match.start()].lower()))
+        run = match.group()
+        unigrams.extend(run)
+        bigrams.extend(run[i:i + 2] for i in range(len(run) - 1))
+        pos = match.end()
+    words.extend(_WORD_RE.findall(value[pos:].lower()))
+    return unigrams, bigrams, words
+
+def cjk_ngrams(title) -> str:
+    """
+    生成写入 FTS 表的分词文本，注册为 SQLite 函数供触发器调用
+    """
+    if not title:
+        return ""
+    unigrams, bigrams, words = _tokenize(title)
+    return " ".join(unigrams + bigrams + words)
+
+def build_match_query(query: str) -> str:
+    """
+    将用户输入转换为 FTS5 MATCH 表达式，所有词之间为 AND 关系
+    """
+    _, bigrams, words = _tokenize(query)
+    terms = []
+    # 两个字以上的中文片段用 bigram 匹配，单字片段直接用单字匹配
+    for run in _CJK_RE.findall(query):
+        if len(run) == 1:
+            terms.append(f'"{run}"')
+    terms.extend(f'"{gram}"' for gram in dict.fromkeys(bigrams))
+    # 英文/数字按前缀匹配，便于边输入边搜索
+    terms.extend(f'"{word}"*' for word in dict.fromkeys(words))
+    return " ".join(terms)
+
+@event.listens_for(database.engine, "connect")
+def _register_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function("cjk_ngrams", 1, cjk_ngrams, deterministic=True)
+
+def ensure_index(rebuild: bool = False):
+    """
+    创建 FTS5 虚拟表与同步触发器；新建或 rebuild 时从 images 表全量重建索引（幂等）
     """
-    使用直接文本搜索图片标题
+    global FTS_ENABLED
+    try:
+        with database.engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images_fts'")
+            ).first() is not None
+            if rebuild and exists:
+                conn.execute(text("DROP TABLE images_fts"))
+                exists = False
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                conn.execute(text(
+                    "INSERT INTO images_fts(rowid, tokens) SELECT id, cjk_ngrams(title) FROM images"
+                ))
+                logger.info("Built full-text search index")
+        FTS_ENABLED = True
+    except OperationalError as e:
+        logger.warning(f"FTS5 unavailable, falling back to LIKE search: {e}")
+        FTS_ENABLED = False
+
+def search_images(query: str, db: Session, limit: int = 20, offset: int = 0):
+    """
+    全文搜索图片标题，按相关度（bm25）排序（只有单字时按新旧排序），FTS5 不可用时退回 LIKE 子串匹配
     """
     if not query or not query.strip():
         return []
-    
-    # 直接使用 LIKE 进行子串匹配
-    search_pattern = f"%{query.strip()}%"
-    
-    # 查询数据库
-    results = db.query(models.Image).filter(
-        models.Image.title.like(search_pattern)
-    ).order_by(
-        models.Image.remote_id.desc()
-    ).limit(limit).all()
-    
-    return results
+
+    match_query = build_match_query(query.strip())
+    if not match_query:
+        return []
+
+    if not FTS_ENABLED:
+        search_pattern = f"%{query.strip()}%"
+        return db.query(models.Image).filter(
+            models.Image.title.like(search_pattern)
+        ).order_by(
+            models.Image.remote_id.desc()
+        ).offset(offset).limit(limit).all()
+
+    _, bigrams, words = _tokenize(query.strip())
+    if bigrams or words:
+        order = "ORDER BY rank, rowid DESC"
+    else:
+        # 只有单字的查询（最常见的 "猪" 之类）命中大半个目录，按 bm25 排序要给全部命中算分；
+        # 单字在短标题中的相关度差别不大，改按 rowid 倒序（新图在前），FTS5 读到 LIMIT 即停止
+        order = "ORDER BY rowid DESC"
+    ranked = text(
+        f"SELECT rowid FROM images_fts WHERE images_fts MATCH :q {order} LIMIT :limit OFFSET :offset"
+    )
+    ids = [row[0] for row in db.execute(ranked, {"q": match_query, "limit": limit, "offset": offset})]
+    if not ids:
+        return []
+
+    # 按 FTS 排名顺序返回 ORM 对象
+    images = {img.id: img for img in db.query(models.Image).filter(models.Image.id.in_(ids))}
+    return [images[i] for i in ids if i in images]
+
+if __name__ == "__main__":
+    # 一次性重建索引：python -m app.search rebuild
+    if sys.argv[1:] == ["rebuild"]:
+        logging.basicConfig(level=logging.INFO)
+        models.Base.metadata.create_all(bind=database.engine)
+        ensure_index(rebuild=True)
+    else:
+        print("Usage: python -m app.search rebuild")
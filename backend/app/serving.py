@@ -0,0 +1,370 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+import aiofiles
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from . import metrics, tiering
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，没有时只生成 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = "data/images"
+# 热点小文件的内存缓存：总字节预算和单文件上限
+IMAGE_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_BYTES", 64 * 1024 * 1024))
+IMAGE_CACHE_MAX_FILE_BYTES = int(os.getenv("IMAGE_CACHE_MAX_FILE_BYTES", 512 * 1024))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 内容寻址文件（及其衍生图）路径里带有内容哈希，内容永不改变
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+_CONTENT_ADDRESSED_RE = re.compile(r"^(?:derived/)?[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:_\d+)?\.\w+$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+# 前端构建产物：assets 下的文件名带内容哈希，可以长期缓存
+STATIC_DIR = "app/static"
+ASSETS_DIR = os.path.join(STATIC_DIR, "assets")
+# 预压缩：启动/构建时为文本类静态文件生成 .br / .gz，请求时按 Accept-Encoding 直接发送，不再每次压缩
+COMPRESSIBLE_EXTENSIONS = {".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".wasm"}
+PRECOMPRESS_MIN_BYTES = 1024
+# 按优先级排列的 (Content-Encoding, 文件后缀)
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")] if brotli is not None else [("gzip", ".gz")]
+
+router = APIRouter()
+
+class LRUFileCache:
+    """
+    按字节预算淘汰的 LRU 文件缓存，值为 (内容, ETag, Content-Type)
+    """
+
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, content: bytes, etag: str, media_type: str):
+        if len(content) > self.max_file_bytes or len(content) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (content, etag, media_type)
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+
+image_cache = LRUFileCache(IMAGE_CACHE_BYTES, IMAGE_CACHE_MAX_FILE_BYTES)
+metrics.register_cache_metrics("image_cache", lambda: (image_cache.hits, image_cache.misses))
+metrics.Gauge("image_cache_bytes", "Bytes held by the in-memory image cache", callback=lambda: image_cache.size)
+
+def invalidate(local_path: str):
+    """
+    文件被删除或替换后移出内存缓存
+    """
+    image_cache.invalidate(local_path)
+
+def _etag_for(rel_path: str, st: os.stat_result) -> str:
+    match = _CONTENT_ADDRESSED_RE.match(rel_path)
+    if match and not rel_path.startswith("derived/"):
+        return f'"{match.group(1)}"'
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def _cache_control_for(rel_path: str) -> str:
+    if _CONTENT_ADDRESSED_RE.match(rel_path):
+        return IMMUTABLE_CACHE_CONTROL
+    return DEFAULT_CACHE_CONTROL
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个 bytes 范围，返回闭区间 (start, end)；无 Range 头或多段范围返回 None，
+    无法满足的范围抛出 416
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        length = int(last)
+        if length == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        start, end = max(size - length, 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def _resolve(rel_path: str, base_dir: str = IMAGE_DIR) -> str:
+    # 拒绝路径穿越和隐藏目录（如 .staging 中未完成的下载）
+    parts = rel_path.split("/")
+    if not rel_path or any(part in ("", ".", "..") or part.startswith(".") for part in parts):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return os.path.join(base_dir, *parts)
+
+async def _iter_file(file_path: str, start: int, length: int):
+    async with aiofiles.open(file_path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _partial(content_or_path, is_path: bool, byte_range, size: int, headers: dict, media_type: str):
+    start, end = byte_range
+    headers = dict(headers)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if is_path:
+        return StreamingResponse(_iter_file(content_or_path, start, end - start + 1),
+                                 status_code=206, headers=headers, media_type=media_type)
+    return Response(content_or_path[start:end + 1], status_code=206, headers=headers, media_type=media_type)
+
+@router.api_route("/images/{rel_path:path}", methods=["GET", "HEAD"])
+async def serve_image(rel_path: str, request: Request):
+    """
+    图片服务：强 ETag + 304、内容寻址文件长期 immutable 缓存、单段 Range 请求、热点小文件内存缓存
+    """
+    cache_control = _cache_control_for(rel_path)
+    range_header = request.headers.get("range")
+    if_none_match = request.headers.get("if-none-match")
+
+    cached = image_cache.get(rel_path)
+    if cached is not None:
+        tiering.touch(rel_path)
+        content, etag, media_type = cached
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        byte_range = parse_range(range_header, len(content))
+        if byte_range is not None:
+            return _partial(content, False, byte_range, len(content), headers, media_type)
+        return Response(content, headers=headers, media_type=media_type)
+
+    file_path = _resolve(rel_path)
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        # 超出磁盘预算被淘汰的原图：从上游重新下载后再提供
+        if not await tiering.restore(rel_path):
+            raise HTTPException(status_code=404, detail="Not Found")
+        st = os.stat(file_path)
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Not Found")
+    tiering.touch(rel_path)
+
+    etag = _etag_for(rel_path, st)
+    media_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if st.st_size <= IMAGE_CACHE_MAX_FILE_BYTES:
+        async with aiofiles.open(file_path, "rb") as f:
+            content = await f.read()
+        image_cache.put(rel_path, content, etag, media_type)
+        byte_range = parse_range(range_header, len(content))
+        if byte_range is not None:
+            return _partial(content, False, byte_range, len(content), headers, media_type)
+        return Response(content, headers=headers, media_type=media_type)
+
+    byte_range = parse_range(range_header, st.st_size)
+    if byte_range is not None:
+        return _partial(file_path, True, byte_range, st.st_size, headers, media_type)
+    return FileResponse(file_path, headers=headers, media_type=media_type, stat_result=st)
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def accepted_encodings(header: Optional[str]) -> set:
+    """
+    解析 Accept-Encoding，返回可接受（q > 0）的编码名
+    """
+    accepted = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+def precompress_assets(directory: str = STATIC_DIR) -> int:
+    """
+    为目录下的文本类静态文件写入 .br / .gz 兄弟文件（幂等，已是最新的跳过，压缩后不更小的不写）。
+    返回新写入的文件数
+    """
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            if st.st_size < PRECOMPRESS_MIN_BYTES:
+                continue
+            data = None
+            for encoding, suffix in ENCODINGS:
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime_ns >= st.st_mtime_ns:
+                    continue
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                compressed = _compress(data, encoding)
+                if len(compressed) >= len(data):
+                    continue
+                tmp_path = f"{target}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(tmp_path, target)
+                written += 1
+    if written:
+        logger.info(f"Precompressed {written} static files under {directory}")
+    return written
+
+@router.api_route("/assets/{rel_path:path}", methods=["GET", "HEAD"])
+async def serve_asset(rel_path: str, request: Request):
+    """
+    前端构建产物：带哈希的文件名长期缓存，存在预压缩文件时按 Accept-Encoding 发送
+    """
+    file_path = _resolve(rel_path, ASSETS_DIR)
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Not Found")
+    media_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+
+    accepted = accepted_encodings(request.headers.get("accept-encoding"))
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(file_path + suffix):
+            file_path += suffix
+            headers["Content-Encoding"] = encoding
+            break
+
+    st = os.stat(file_path)
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers["ETag"] = etag
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file_path, headers=headers, media_type=media_type, stat_result=st)
+
+class StaticAsset:
+    """
+    启动时读入内存的小静态文件（index.html、pig.svg），请求时不再访问磁盘；
+    同时在内存中保存压缩后的版本，按 Accept-Encoding 发送
+    """
+
+    def __init__(self, path: str, media_type: str, cache_control: str):
+        self.path = path
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.content = None
+        self.etag = None
+        self.encoded = {}
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                self.content = f.read()
+        except FileNotFoundError:
+            self.content = None
+            return
+        self.etag = f'"{hashlib.sha256(self.content).hexdigest()[:32]}"'
+        self.encoded = {}
+        if len(self.content) >= PRECOMPRESS_MIN_BYTES:
+            for encoding, _ in ENCODINGS:
+                compressed = _compress(self.content, encoding)
+                if len(compressed) < len(self.content):
+                    self.encoded[encoding] = compressed
+
+    def response(self, request: Request) -> Optional[Response]:
+        if self.content is None:
+            return None
+        content, etag = self.content, self.etag
+        headers = {"Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        accepted = accepted_encodings(request.headers.get("accept-encoding"))
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.encoded:
+                content = self.encoded[encoding]
+                # 不同编码的表示需要不同的强 ETag
+                etag = f'{self.etag[:-1]}-{encoding}"'
+                headers["Content-Encoding"] = encoding
+                break
+        headers["ETag"] = etag
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content, headers=headers, media_type=self.media_type)
+
+# index.html 每次都要重新验证，以便新版本前端及时生效
+index_html = StaticAsset(os.path.join(STATIC_DIR, "index.html"), "text/html; charset=utf-8", "no-cache")
+pig_svg = StaticAsset(os.path.join(STATIC_DIR, "pig.svg"), "image/svg+xml", "public, max-age=86400")
+
+def load_static_assets():
+    index_html.load()
+    pig_svg.load()
+
+if __name__ == "__main__":
+    # 构建镜像时预压缩前端产物：python -m app.serving precompress
+    if sys.argv[1:] == ["precompress"]:
+        logging.basicConfig(level=logging.INFO)
+        precompress_assets()
+    else:
+        print("Usage: python -m app.serving precompress")
@@ -0,0 +1,226 @@
+import logging
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+from PIL import Image as PILImage
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from . import models, database
+
+logger = logging.getLogger(__name__)
+
+# 感知哈希（dHash）：缩放到 9x8 灰度图，比较相邻像素得到 64 位指纹，
+# 重新编码、缩放后的同一张图片汉明距离很小。
+# 64 位拆成 4 段 16 位分别建索引（multi-index hashing）：距离 ≤ r 的两张图片至少有一段
+# 的距离 ≤ r // 4，因此只需在每段索引中查找少量邻近值，无需两两比较。
+IMAGE_DIR = "data/images"
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# /similar 默认距离上限与允许的最大值（段内半径越大，候选越多）
+SIMILAR_MAX_DISTANCE = int(os.getenv("SIMILAR_MAX_DISTANCE", 8))
+SIMILAR_DISTANCE_LIMIT = 12
+# 重复图片报告的默认距离：≤ 3 时每段只需精确匹配
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", 3))
+BACKFILL_WORKERS = int(os.getenv("PHASH_WORKERS", os.cpu_count() or 2))
+
+_BAND_COLUMNS = [getattr(models.Image, f"phash_b{band}") for band in range(BANDS)]
+
+def dhash(im: PILImage.Image) -> int:
+    """
+    计算已打开图片（动图取当前帧）的 64 位 dHash，返回无符号整数
+    """
+    small = im.convert("L").resize((9, 8), PILImage.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hash_file(local_path: str) -> Optional[int]:
+    """
+    在子进程中计算文件的 dHash；无法解码时返回 None。
+    入库（衍生图生成）和 backfill 都经由这里，保证同一文件总是得到相同的哈希
+    """
+    try:
+        with PILImage.open(os.path.join(IMAGE_DIR, local_path)) as im:
+            # JPEG 可以直接按缩小尺寸解码，省去大部分解码开销
+            im.draft("L", (64, 64))
+            return dhash(im)
+    except Exception as e:
+        logger.warning(f"Cannot hash {local_path}: {e}")
+        return None
+
+def _to_signed(value: int) -> int:
+    # SQLite INTEGER 是有符号 64 位
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def to_unsigned(value: int) -> int:
+    return value & ((1 << HASH_BITS) - 1)
+
+def bands(value: int) -> List[int]:
+    return [(value >> (band * BAND_BITS)) & BAND_MASK for band in range(BANDS)]
+
+def distance(a: int, b: int) -> int:
+    return bin(to_unsigned(a) ^ to_unsigned(b)).count("1")
+
+def set_hash(image: models.Image, value: Optional[int]):
+    """
+    写入图片的 dHash 及分段索引列（value 为无符号整数）
+    """
+    if value is None:
+        return
+    image.phash = _to_signed(value)
+    image.phash_b0, image.phash_b1, image.phash_b2, image.phash_b3 = bands(value)
+
+def _neighbors(value: int, radius: int) -> List[int]:
+    """
+    与 value 汉明距离 ≤ radius 的所有 16 位值
+    """
+    result = [value]
+    for r in range(1, radius + 1):
+        for positions in combinations(range(BAND_BITS), r):
+            flipped = value
+            for position in positions:
+                flipped ^= 1 << position
+            result.append(flipped)
+    return result
+
+def find_similar(db: Session, image_id: int, max_distance: int = SIMILAR_MAX_DISTANCE,
+                 limit: int = 20) -> Optional[List[Tuple[models.Image, int]]]:
+    """
+    查找与指定图片汉明距离 ≤ max_distance 的图片，按距离排序。
+    图片不存在返回 None；尚未计算哈希时返回空列表
+    """
+    image = db.get(models.Image, image_id)
+    if image is None:
+        return None
+    if image.phash is None:
+        return []
+
+    value = to_unsigned(image.phash)
+    band_radius = max_distance // BANDS
+    conditions = [
+        column.in_(_neighbors(band_value, band_radius))
+        for column, band_value in zip(_BAND_COLUMNS, bands(value))
+    ]
+    candidates = db.query(models.Image.id, models.Image.phash).filter(
+        or_(*conditions), models.Image.id != image_id
+    ).all()
+
+    matches = sorted(
+        ((candidate_id, distance(value, phash)) for candidate_id, phash in candidates),
+        key=lambda item: (item[1], item[0])
+    )
+    matches = [(candidate_id, d) for candidate_id, d in matches if d <= max_distance][:limit]
+    if not matches:
+        return []
+    images = {i.id: i for i in db.query(models.Image).filter(models.Image.id.in_([m[0] for m in matches]))}
+    return [(images[candidate_id], d) for candidate_id, d in matches if candidate_id in images]
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while x != root:
+            self.parent[x], x = root, self.parent.get(x, x)
+        return root
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+def find_duplicate_clusters(db: Session, max_distance: int = DUPLICATE_MAX_DISTANCE,
+                            min_size: int = 2) -> List[Tuple[List[int], int]]:
+    """
+    把所有图片按 dHash 距离聚类（单链接），返回 [(图片 id 列表, 簇内最大边距离)]，按簇大小降序。
+    在内存中对每个分段建立倒排表，只比较至少一段足够接近的图片对
+    """
+    rows = db.query(models.Image.id, models.Image.phash).filter(models.Image.phash.isnot(None)).all()
+    hashes = {image_id: to_unsigned(phash) for image_id, phash in rows}
+    index = [defaultdict(list) for _ in range(BANDS)]
+    for image_id, value in hashes.items():
+        for band, band_value in enumerate(bands(value)):
+            index[band][band_value].append(image_id)
+
+    band_radius = max_distance // BANDS
+    clusters = _UnionFind()
+    edge_distance: Dict[int, int] = {}
+    for image_id, value in hashes.items():
+        seen = set()
+        for band, band_value in enumerate(bands(value)):
+            for neighbor in _neighbors(band_value, band_radius):
+                for other_id in index[band].get(neighbor, ()):
+                    # 每对只比较一次
+                    if other_id <= image_id or other_id in seen:
+                        continue
+                    seen.add(other_id)
+                    d = bin(value ^ hashes[other_id]).count("1")
+                    if d <= max_distance:
+                        clusters.union(image_id, other_id)
+                        edge_distance[image_id] = max(edge_distance.get(image_id, 0), d)
+                        edge_distance[other_id] = max(edge_distance.get(other_id, 0), d)
+
+    groups = defaultdict(list)
+    for image_id in edge_distance:
+        groups[clusters.find(image_id)].append(image_id)
+    result = [
+        (sorted(members), max(edge_distance[m] for m in members))
+        for members in groups.values() if len(members) >= min_size
+    ]
+    result.sort(key=lambda item: (-len(item[0]), item[0][0]))
+    return result
+
+def _save_hashes(db: Session, results: Iterable[Tuple[int, Optional[int]]]):
+    for image_id, value in results:
+        image = db.get(models.Image, image_id)
+        if image is not None:
+            set_hash(image, value)
+
+def backfill(batch_size: int = 500, rehash: bool = False):
+    """
+    为尚未计算感知哈希的图片并行计算 dHash（进程池，每批提交一次）；rehash=True 时重新计算全部图片
+    """
+    db = database.SessionLocal()
+    done = 0
+    last_id = 0
+    try:
+        with ProcessPoolExecutor(max_workers=BACKFILL_WORKERS) as pool:
+            while True:
+                rows = db.query(models.Image.id, models.Image.local_path).filter(
+                    models.Image.id > last_id,
+                    models.Image.local_path.isnot(None),
+                    *([] if rehash else [models.Image.phash.is_(None)])
+                ).order_by(models.Image.id).limit(batch_size).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                values = pool.map(hash_file, [local_path for _, local_path in rows], chunksize=16)
+                _save_hashes(db, zip([image_id for image_id, _ in rows], values))
+                db.commit()
+                done += len(rows)
+                logger.info(f"Hashed {done} images")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # 为已有图片计算感知哈希：python -m app.similarity backfill [--all]
+    if sys.argv[1:2] == ["backfill"] and set(sys.argv[2:]) <= {"--all"}:
+        logging.basicConfig(level=logging.INFO)
+        models.Base.metadata.create_all(bind=database.engine)
+        from . import migrations
+        migrations.upgrade(database.engine)
+        backfill(rehash="--all" in sys.argv)
+    else:
+        print("Usage: python -m app.similarity backfill [--all]")
@@ -0,0 +1,227 @@
+import hashlib
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+import aiofiles
+import aiofiles.os
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from . import models, database, derivatives, serving, catalog
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = "data/images"
+# 下载/上传中的临时文件，与 IMAGE_DIR 在同一文件系统上以保证原子重命名
+STAGING_DIR = os.path.join(IMAGE_DIR, ".staging")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def new_hasher():
+    return hashlib.sha256()
+
+def blob_path(digest: str, ext: str) -> str:
+    """
+    内容寻址路径（相对 IMAGE_DIR）：ab/cd/<sha256><ext>
+    相同内容总是得到相同的路径，URL 不可变，可以长期缓存
+    """
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+def new_staging_path(ext: str = "") -> str:
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    return os.path.join(STAGING_DIR, f"{uuid.uuid4()}{ext}")
+
+async def store_staged_file(staged_path: str, digest: str, ext: str) -> str:
+    """
+    把已算好哈希的临时文件移动到内容寻址位置，返回相对路径。
+    目标已存在时用相同内容原子覆盖，不会产生第二份拷贝。
+    """
+    local_path = blob_path(digest, ext)
+    dest_path = os.path.join(IMAGE_DIR, local_path)
+    await aiofiles.os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    await aiofiles.os.replace(staged_path, dest_path)
+    return local_path
+
+# 上传限制：单个文件大小、单次批量上传的文件数与请求总大小
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", 50))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", 200 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+class UploadRejected(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    根据文件头魔数判断图片类型，返回扩展名；不是支持的图片时返回 None
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return ".avif"
+    if head.startswith(b"BM"):
+        return ".bmp"
+    return None
+
+async def save_upload(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[str, str, int]:
+    """
+    分块读取上传文件写入临时文件（不在内存中保留整个文件），同时嗅探类型、计算哈希、限制大小，
+    完成后移动到内容寻址位置。返回 (local_path, content_hash, size)
+    """
+    head = await upload.read(UPLOAD_CHUNK_SIZE)
+    ext = sniff_image_type(head)
+    if ext is None:
+        raise UploadRejected(f"{upload.filename} is not a supported image", 415)
+
+    staged_path = new_staging_path(ext)
+    hasher = new_hasher()
+    size = 0
+    try:
+        async with aiofiles.open(staged_path, "wb") as f:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f"{upload.filename} exceeds limit of {max_bytes} bytes", 413)
+                hasher.update(chunk)
+                await f.write(chunk)
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        if os.path.exists(staged_path):
+            await aiofiles.os.remove(staged_path)
+        raise
+
+    content_hash = hasher.hexdigest()
+    local_path = await store_staged_file(staged_path, content_hash, ext)
+    return local_path, content_hash, size
+
+def acquire(db: Session, local_path: str, content_hash: str, size: Optional[int] = None):
+    """
+    为一个 Image 引用增加 blob 引用计数（在调用方事务中，随其提交）
+    """
+    if size is None:
+        size = os.path.getsize(os.path.join(IMAGE_DIR, local_path))
+    stmt = insert(models.Blob).values(
+        path=local_path, content_hash=content_hash, size=size, refcount=1,
+        last_access=int(time.time()), evicted=False
+    )
+    # 调用方刚写入了这个文件，之前被淘汰的 blob 也重新在盘上
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Blob.path],
+        set_={"refcount": models.Blob.refcount + 1, "evicted": False}
+    )
+    db.execute(stmt)
+
+def release(db: Session, image: models.Image) -> bool:
+    """
+    释放 Image 对文件的引用。返回 True 表示这是最后一个引用，
+    调用方应在提交后通过 unlink_blob 删除文件及衍生图。
+    """
+    if not image.local_path:
+        return False
+    if not image.content_hash:
+        # 迁移前的旧文件没有 blob 记录，每个文件只属于一张图片
+        return True
+    blob = db.get(models.Blob, image.local_path)
+    if blob is None:
+        return True
+    blob.refcount -= 1
+    if blob.refcount <= 0:
+        db.delete(blob)
+        return True
+    return False
+
+def unlink_blob(image: models.Image):
+    """
+    删除原图文件和衍生图（仅在最后一个引用释放并提交后调用）
+    """
+    file_path = os.path.join(IMAGE_DIR, image.local_path)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    serving.invalidate(image.local_path)
+    for variant in image.variants or []:
+        serving.invalidate(variant["path"])
+    derivatives.remove_variants(image)
+
+def discard_if_unreferenced(db: Session, local_path: str):
+    """
+    丢弃没有被任何 Image 引用的文件（例如插入失败的重复下载）
+    """
+    if db.get(models.Blob, local_path) is None:
+        file_path = os.path.join(IMAGE_DIR, local_path)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def hash_file(file_path: str) -> str:
+    hasher = new_hasher()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def migrate_existing(batch_size: int = 200, workers: int = 4):
+    """
+    把旧的 {remote_id}_{uuid}.ext / upload_{uuid}.ext 文件迁移到内容寻址布局：
+    计算哈希、移动到 ab/cd/<hash>.ext、建立引用计数，重复内容只保留一份。
+    旧的衍生图会被删除，迁移结束后按新路径重新生成。
+    """
+    db = database.SessionLocal()
+    migrated = 0
+    last_id = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                images = db.query(models.Image).filter(
+                    models.Image.id > last_id,
+                    models.Image.content_hash.is_(None)
+                ).order_by(models.Image.id).limit(batch_size).all()
+                if not images:
+                    break
+                last_id = images[-1].id
+
+                paths = [os.path.join(IMAGE_DIR, image.local_path or "") for image in images]
+                digests = pool.map(lambda p: hash_file(p) if os.path.isfile(p) else None, paths)
+                for image, old_path, digest in zip(images, paths, digests):
+                    if digest is None:
+                        logger.warning(f"Image {image.id}: file {image.local_path} missing, skipped")
+                        continue
+                    ext = os.path.splitext(image.local_path)[1]
+                    local_path = blob_path(digest, ext)
+                    dest_path = os.path.join(IMAGE_DIR, local_path)
+                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                    size = os.path.getsize(old_path)
+                    os.replace(old_path, dest_path)
+
+                    derivatives.remove_variants(image)
+                    image.variants = None
+                    image.local_path = local_path
+                    image.content_hash = digest
+                    acquire(db, local_path, digest, size)
+                    migrated += 1
+                catalog.bump_version(db)
+                db.commit()
+                logger.info(f"Migrated {migrated} images to content-addressed storage")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # 迁移已有图片目录：python -m app.storage migrate
+    if sys.argv[1:] == ["migrate"]:
+        logging.basicConfig(level=logging.INFO)
+        models.Base.metadata.create_all(bind=database.engine)
+        from . import migrations
+        migrations.upgrade(database.engine)
+        migrate_existing()
+        derivatives.backfill()
+    else:
+        print("Usage: python -m app.storage migrate")
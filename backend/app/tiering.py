@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urljoin
+import aiofiles.os
+from sqlalchemy import bindparam, func
+from sqlalchemy.orm import Session
+from . import models, database, metrics, http_client
+
+logger = logging.getLogger(__name__)
+
+# 原图的磁盘预算（字节，0 表示不限制）。超出时按最近访问时间淘汰最久未访问的原图：
+# 保留数据库记录和衍生图，文件在下次被请求时从上游 thumbnail_url 重新下载。
+# 只淘汰能重新下载的文件（至少被一张爬取来的图片引用），用户上传的图片始终保留。
+IMAGE_DIR = "data/images"
+STORAGE_BUDGET_BYTES = int(os.getenv("STORAGE_BUDGET_BYTES", 0))
+# 淘汰到预算的这个比例为止，避免每次检查只腾出一点空间
+STORAGE_LOW_WATER_RATIO = float(os.getenv("STORAGE_LOW_WATER_RATIO", 0.9))
+STORAGE_CHECK_MINUTES = int(os.getenv("STORAGE_CHECK_MINUTES", 10))
+# 访问时间在内存中累积，按此间隔批量写回
+ACCESS_FLUSH_SECONDS = int(os.getenv("ACCESS_FLUSH_SECONDS", 60))
+EVICT_BATCH_SIZE = 500
+
+STORAGE_USED_BYTES = metrics.Gauge("storage_used_bytes", "Bytes of originals on disk at the last budget check")
+STORAGE_EVICTIONS = metrics.Counter("storage_evictions_total", "Originals evicted to stay within the disk budget")
+STORAGE_EVICTED_BYTES = metrics.Counter("storage_evicted_bytes_total", "Bytes freed by evicting originals")
+STORAGE_REFETCHES = metrics.Counter("storage_refetches_total", "Lazy re-downloads of evicted originals", ("result",))
+
+# 内容寻址原图路径 -> 最近访问时间（只在事件循环线程中读写）
+_accessed: Dict[str, int] = {}
+_flush_task: Optional[asyncio.Task] = None
+# 正在重新下载的文件，同一文件的并发请求共享一次下载
+_restoring: Dict[str, asyncio.Task] = {}
+
+def touch(rel_path: str):
+    """
+    记录一次原图访问（衍生图不参与淘汰）
+    """
+    if not rel_path.startswith("derived/"):
+        _accessed[rel_path] = int(time.time())
+
+_update_access = models.Blob.__table__.update().where(
+    models.Blob.path == bindparam("blob_path")
+).values(last_access=bindparam("accessed_at"))
+
+def _write_access(db: Session, accessed: Dict[str, int]):
+    db.execute(_update_access, [{"blob_path": path, "accessed_at": ts} for path, ts in accessed.items()])
+
+async def flush_access():
+    global _accessed
+    accessed, _accessed = _accessed, {}
+    if not accessed:
+        return
+    try:
+        await database.run_write(_write_access, accessed)
+    except Exception as e:
+        logger.error(f"Failed to record access times for {len(accessed)} files: {e}")
+        for path, ts in accessed.items():
+            _accessed.setdefault(path, ts)
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(ACCESS_FLUSH_SECONDS)
+        await flush_access()
+
+def start():
+    """
+    启动访问时间写回任务（每个 worker 都要运行，需在事件循环中调用）
+    """
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_loop())
+
+async def stop():
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    await flush_access()
+
+def used_bytes(db: Session) -> int:
+    return db.query(func.coalesce(func.sum(models.Blob.size), 0)).filter(models.Blob.evicted == False).scalar()
+
+def _refetchable():
+    # 至少有一张爬取来的图片（remote_id > 0）引用该文件并记录了上游地址
+    return models.Image.__table__.select().where(
+        models.Image.local_path == models.Blob.path,
+        models.Image.remote_id > 0,
+        models.Image.thumbnail_url.isnot(None)
+    ).exists()
+
+def enforce_budget(budget: int = None) -> int:
+    """
+    已用空间超过预算时淘汰最久未访问的可重新下载原图，直到低于 budget * STORAGE_LOW_WATER_RATIO。
+    返回淘汰的文件数。只应在一个进程中运行（由 leader 的调度器调用）
+    """
+    from . import serving
+    budget = STORAGE_BUDGET_BYTES if budget is None else budget
+    if budget <= 0:
+        return 0
+    db = database.SessionLocal()
+    evicted = 0
+    try:
+        used = used_bytes(db)
+        STORAGE_USED_BYTES.set(used)
+        if used <= budget:
+            return 0
+        target = int(budget * STORAGE_LOW_WATER_RATIO)
+        logger.info(f"Storage {used} bytes exceeds budget {budget}, evicting down to {target}")
+        while used > target:
+            blobs = db.query(models.Blob).filter(
+                models.Blob.evicted == False, _refetchable()
+            ).order_by(
+                func.coalesce(models.Blob.last_access, 0), models.Blob.path
+            ).limit(EVICT_BATCH_SIZE).all()
+            if not blobs:
+                logger.warning(f"Storage {used} bytes still exceeds budget {budget}, nothing left to evict")
+                break
+            victims = []
+            freed = 0
+            for blob in blobs:
+                if used - freed <= target:
+                    break
+                blob.evicted = True
+                victims.append(blob.path)
+                freed += blob.size or 0
+            # 先提交标记再删除文件：中途崩溃最多留下被标记但仍在盘上的文件，访问时照常提供
+            db.commit()
+            for path in victims:
+                try:
+                    os.remove(os.path.join(IMAGE_DIR, path))
+                except FileNotFoundError:
+                    pass
+                serving.invalidate(path)
+            evicted += len(victims)
+            STORAGE_EVICTIONS.inc(len(victims))
+            STORAGE_EVICTED_BYTES.inc(freed)
+            used -= freed
+        STORAGE_USED_BYTES.set(used)
+        logger.info(f"Evicted {evicted} originals, {used} bytes in use")
+        return evicted
+    finally:
+        db.close()
+
+def _refetch_source(db: Session, rel_path: str) -> Optional[Tuple[str, str]]:
+    """
+    返回已淘汰文件的 (上游地址, 内容哈希)；文件不是被淘汰的原图时返回 None
+    """
+    from . import crawler
+    blob = db.get(models.Blob, rel_path)
+    if blob is None or not blob.evicted:
+        return None
+    row = db.query(models.Image.thumbnail_url, models.SourceURL.url).outerjoin(
+        models.SourceURL, models.SourceURL.id == models.Image.source_id
+    ).filter(
+        models.Image.local_path == rel_path,
+        models.Image.remote_id > 0,
+        models.Image.thumbnail_url.isnot(None)
+    ).order_by(models.Image.id).first()
+    if row is None or not row.thumbnail_url:
+        return None
+    thumbnail_url, source_url = row
+    # 相对地址按图片所属源的主机解析，与爬取时 crawler.download_image 的拼接方式一致
+    base_url = urljoin(source_url, "/") if source_url else crawler.BASE_URL
+    url = thumbnail_url if thumbnail_url.startswith("http") else urljoin(base_url, thumbnail_url)
+    return url, blob.content_hash
+
+def _mark_restored(db: Session, rel_path: str):
+    blob = db.get(models.Blob, rel_path)
+    if blob is not None:
+        blob.evicted = False
+        blob.last_access = int(time.time())
+
+async def _restore(rel_path: str) -> bool:
+    from . import crawler, storage
+    source = await database.run_read(_refetch_source, rel_path)
+    if source is None:
+        return False
+    url, content_hash = source
+    staged_path = storage.new_staging_path(os.path.splitext(rel_path)[1])
+    try:
+        _, digest = await crawler.fetch_with_retry(http_client.get_client(), url, staged_path)
+    except Exception as e:
+        STORAGE_REFETCHES.inc(result="failed")
+        logger.error(f"Failed to re-fetch evicted {rel_path} from {url}: {e}")
+        return False
+    if digest != content_hash:
+        # 上游内容已变化，不能放到按旧哈希命名的不可变路径上
+        await aiofiles.os.remove(staged_path)
+        STORAGE_REFETCHES.inc(result="changed")
+        logger.warning(f"Upstream content of {rel_path} changed ({digest}), not restoring")
+        return False
+    dest_path = os.path.join(IMAGE_DIR, rel_path)
+    await aiofiles.os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    await aiofiles.os.replace(staged_path, dest_path)
+    await database.run_write(_mark_restored, rel_path)
+    STORAGE_REFETCHES.inc(result="ok")
+    logger.info(f"Restored evicted {rel_path} from {url}")
+    return True
+
+async def restore(rel_path: str) -> bool:
+    """
+    重新下载被淘汰的原图，成功返回 True。同一文件的并发请求等待同一次下载
+    """
+    if rel_path.startswith("derived/"):
+        return False
+    task = _restoring.get(rel_path)
+    if task is None:
+        task = asyncio.create_task(_restore(rel_path))
+        _restoring[rel_path] = task
+        task.add_done_callback(lambda _: _restoring.pop(rel_path, None))
+    # 客户端断开时不取消下载，其他等待者仍能拿到结果
+    return await asyncio.shield(task)
+
+if __name__ == "__main__":
+    # 立即按预算淘汰：python -m app.tiering enforce [预算字节数]
+    if sys.argv[1:2] == ["enforce"]:
+        logging.basicConfig(level=logging.INFO)
+        enforce_budget(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    else:
+        print("Usage: python -m app.tiering enforce [budget_bytes]")
@@ -0,0 +1,3 @@
+"""
+性能基准与压测工具：python -m bench.run --help（在 backend 目录下运行）
+"""
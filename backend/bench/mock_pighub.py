@@ -0,0 +1,106 @@
+"""
+本地模拟的 Pighub 服务：提供 /api/all-images、/api/images 列表与 /thumbs/{id}.jpg 图片，
+可配置响应延迟和错误率，用于测量爬虫吞吐而不访问真实站点。
+"""
+import asyncio
+import io
+import random
+import socket
+import threading
+import time
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from PIL import Image as PILImage
+
+def _base_jpeg() -> bytes:
+    buf = io.BytesIO()
+    PILImage.new("RGB", (240, 240), (255, 182, 193)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+def create_app(first_id: int, count: int, latency_ms: float = 0, error_rate: float = 0, seed_value: int = 42) -> FastAPI:
+    rng = random.Random(seed_value)
+    base = _base_jpeg()
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.errors = 0
+
+    def _entry(remote_id: int) -> dict:
+        return {
+            "id": remote_id,
+            "title": f"猪猪 {remote_id}",
+            "thumbnail": f"/thumbs/{remote_id}.jpg",
+            "filename": f"{remote_id}.jpg",
+            "view_count": remote_id % 1000,
+            "download_count": remote_id % 100,
+            "duration": "图片",
+            "image_type": "static",
+            "mtime": int(time.time()),
+        }
+
+    async def _delay():
+        if latency_ms:
+            # ±50% 抖动，模拟真实网络的长尾
+            await asyncio.sleep(latency_ms / 1000 * rng.uniform(0.5, 1.5))
+
+    # 列表内容只取决于图片范围，用它作为 ETag，支持条件请求
+    listing_etag = f'"{first_id}-{count}"'
+    app.state.listing_requests = 0
+    app.state.not_modified = 0
+
+    def _listing(request: Request, images: list):
+        app.state.listing_requests += 1
+        if request.headers.get("if-none-match") == listing_etag:
+            app.state.not_modified += 1
+            return Response(status_code=304, headers={"ETag": listing_etag})
+        return JSONResponse({"images": images}, headers={"ETag": listing_etag})
+
+    @app.get("/api/all-images")
+    async def all_images(request: Request):
+        await _delay()
+        return _listing(request, [_entry(i) for i in range(first_id + count - 1, first_id - 1, -1)])
+
+    @app.get("/api/images")
+    async def images(request: Request, limit: int = 20, page: int = 1, sort: str = "latest"):
+        await _delay()
+        top = first_id + count - 1 - (page - 1) * limit
+        return _listing(request, [_entry(i) for i in range(top, max(top - limit, first_id - 1), -1)])
+
+    @app.get("/thumbs/{remote_id}.jpg")
+    async def thumbnail(remote_id: int):
+        app.state.requests += 1
+        await _delay()
+        if rng.random() < error_rate:
+            app.state.errors += 1
+            return Response(status_code=503)
+        # JPEG 结束标记之后追加 id，使每张图片内容（哈希）不同
+        return Response(base + str(remote_id).encode(), media_type="image/jpeg")
+
+    return app
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class MockPighubServer:
+    """
+    在后台线程中运行模拟服务：with MockPighubServer(app) as server: server.base_url
+    """
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
@@ -0,0 +1,221 @@
+"""
+基准测试入口（在 backend 目录下运行）：
+
+    python -m bench.run --rows 100000 --files 500 --requests 2000 --concurrency 32 \
+        --crawl-images 2000 --latency-ms 20 --error-rate 0.01 --output bench-result.json
+
+在临时工作目录中生成合成数据库，用 httpx 在进程内驱动 FastAPI 应用测量各接口延迟，
+再用本地模拟的 Pighub 服务测量全量同步吞吐。结果以 JSON 输出，便于不同版本之间比较。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_SCENARIOS = ("list_page", "list_cursor", "search", "serve_image")
+ALL_SCENARIOS = API_SCENARIOS + ("crawl",)
+WARMUP_REQUESTS = 20
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def peak_rss_mib() -> float:
+    # Linux 上 ru_maxrss 单位是 KiB，macOS 上是字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+async def drive(client, make_path, total: int, concurrency: int, rng: random.Random) -> dict:
+    """
+    以固定并发发送 total 个请求，返回延迟分位数、吞吐和状态码分布
+    """
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            path = make_path(rng)
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+def _path_factories(rows: int, local_paths: list, limit: int):
+    from bench.seed import TITLE_WORDS
+    max_page = max(1, rows // limit)
+    return {
+        "list_page": lambda rng: f"/api/images?page={rng.randint(1, max_page)}&limit={limit}",
+        "list_cursor": lambda rng: f"/api/images?after_remote_id={rng.randint(limit + 1, max(rows, limit + 1))}&limit={limit}",
+        "search": lambda rng: "/api/search?q=" + quote(" ".join(rng.sample(TITLE_WORDS, rng.randint(1, 2)))) + "&limit=50",
+        "serve_image": lambda rng: f"/images/{rng.choice(local_paths)}",
+    }
+
+async def run_api(scenarios, rows: int, local_paths: list, args) -> dict:
+    import httpx
+    from app import main
+
+    rng = random.Random(args.seed)
+    factories = _path_factories(rows, local_paths, args.limit)
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in scenarios:
+            await drive(client, factories[name], WARMUP_REQUESTS, 1, rng)
+            results[name] = await drive(client, factories[name], args.requests, args.concurrency, rng)
+            logging.getLogger("bench").warning(f"{name}: {json.dumps(results[name], ensure_ascii=False)}")
+    return results
+
+def _last_crawl_log():
+    from app import models, database
+    db = database.SessionLocal()
+    try:
+        return db.query(models.CrawlLog).order_by(models.CrawlLog.id.desc()).first()
+    finally:
+        db.close()
+
+async def run_crawl(rows: int, args) -> dict:
+    from app import crawler, http_client
+    from bench.mock_pighub import MockPighubServer, create_app
+
+    mock = create_app(rows + 1, args.crawl_images, args.latency_ms, args.error_rate, args.seed)
+    with MockPighubServer(mock) as server:
+        crawler.BASE_URL = server.base_url
+        started = time.perf_counter()
+        try:
+            await crawler.crawl_all_images()
+        finally:
+            await http_client.close()
+        elapsed = time.perf_counter() - started
+
+    log = _last_crawl_log()
+    downloaded = log.images_downloaded if log else 0
+    return {
+        "images": args.crawl_images,
+        "downloaded": downloaded,
+        "status": log.status if log else None,
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(downloaded / elapsed, 1) if elapsed else 0.0,
+        "upstream_requests": mock.state.requests,
+        "upstream_errors": mock.state.errors,
+        "latency_ms": args.latency_ms,
+        "error_rate": args.error_rate,
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pighub Mirror benchmark suite")
+    parser.add_argument("--rows", type=int, default=10000, help="synthetic Image rows to seed")
+    parser.add_argument("--files", type=int, default=200, help="distinct image files (rows reference them cyclically)")
+    parser.add_argument("--file-size", type=int, default=256, help="synthetic image width/height in pixels")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per API scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--limit", type=int, default=20, help="page size for list scenarios")
+    parser.add_argument("--crawl-images", type=int, default=500, help="images served by the mock Pighub")
+    parser.add_argument("--latency-ms", type=float, default=10, help="mock Pighub mean response latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of thumbnail requests answered with 503")
+    parser.add_argument("--crawl-rps", type=float, default=0, help="HOST_REQUESTS_PER_SECOND for the crawl (0 = unlimited)")
+    parser.add_argument("--scenarios", default=",".join(ALL_SCENARIOS), help="comma separated: " + ",".join(ALL_SCENARIOS))
+    parser.add_argument("--no-response-cache", action="store_true", help="disable the /api response cache")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="directory for the synthetic data/ (default: a temp dir, removed afterwards)")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(ALL_SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # 应用使用相对路径 data/...，必须在导入 app 之前切换到隔离的工作目录
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="pighub-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.environ["HOST_REQUESTS_PER_SECOND"] = str(args.crawl_rps)
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(workdir)
+
+    # 先配置日志，crawler 模块中的 basicConfig 随后不再生效，避免逐张下载日志影响测量
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from app import bootstrap, cache
+    from bench import seed
+
+    try:
+        bootstrap.run()
+        seeded = seed.seed(args.rows, args.files, args.file_size, args.seed)
+        if args.no_response_cache:
+            cache.set_backend(cache.MemoryBackend(0, 0))
+
+        api_scenarios = [s for s in scenarios if s in API_SCENARIOS]
+        results = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "args": vars(args),
+            },
+            "seed": {k: v for k, v in seeded.items() if k != "local_paths"},
+            "api": asyncio.run(run_api(api_scenarios, args.rows, seeded["local_paths"], args)) if api_scenarios else {},
+        }
+        if "crawl" in scenarios:
+            results["crawl"] = asyncio.run(run_crawl(args.rows, args))
+        results["peak_rss_mib"] = peak_rss_mib()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
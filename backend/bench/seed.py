@@ -0,0 +1,109 @@
+"""
+生成合成数据集：在当前工作目录的 data/ 下写入指定数量的 Image 行和图片文件。
+需在导入 app 之前切换到独立的工作目录（见 bench.run），以免污染真实数据。
+"""
+import io
+import logging
+import os
+import random
+import time
+from PIL import Image as PILImage
+from sqlalchemy import insert, update
+from app import models, database, catalog, storage
+
+logger = logging.getLogger(__name__)
+
+# 标题词表：中文词便于测试 FTS 的二元分词，英文词测试前缀匹配
+TITLE_WORDS = [
+    "猪猪", "小猪", "可爱", "睡觉", "吃饭", "表情包", "开心", "生气", "哭哭", "跑步",
+    "粉色", "胖胖", "打滚", "晚安", "早安", "加油", "摸鱼", "上班", "周末", "猪头",
+    "pig", "cute", "happy", "sleepy", "angry", "meme", "pink", "oink",
+]
+INSERT_BATCH_SIZE = 10000
+
+def random_title(rng: random.Random) -> str:
+    return " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(2, 4)))
+
+def _make_file(rng: random.Random, size: int) -> bytes:
+    # 随机色块加噪点，使 JPEG 体积接近真实图片而不是几百字节
+    im = PILImage.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    im.putdata([tuple(rng.randrange(256) for _ in range(3)) if rng.random() < 0.3 else px for px in im.getdata()])
+    buf = io.BytesIO()
+    im.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+def write_files(count: int, size: int, rng: random.Random):
+    """
+    写入 count 个不同内容的文件到内容寻址存储，返回 [(local_path, content_hash, size)]
+    """
+    files = []
+    for _ in range(count):
+        content = _make_file(rng, size)
+        hasher = storage.new_hasher()
+        hasher.update(content)
+        digest = hasher.hexdigest()
+        local_path = storage.blob_path(digest, ".jpg")
+        file_path = os.path.join(storage.IMAGE_DIR, local_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(content)
+        files.append((local_path, digest, len(content)))
+    return files
+
+def seed(rows: int, file_count: int, file_size: int = 256, seed_value: int = 42) -> dict:
+    """
+    插入 rows 行图片（remote_id 为 1..rows），循环引用 file_count 个文件，并同步 blob 引用计数和统计行。
+    返回生成信息 {rows, files, seconds, local_paths}
+    """
+    rng = random.Random(seed_value)
+    started = time.perf_counter()
+    files = write_files(max(1, file_count), file_size, rng)
+    refcounts = [0] * len(files)
+    now = int(time.time())
+
+    with database.engine.begin() as conn:
+        for batch_start in range(1, rows + 1, INSERT_BATCH_SIZE):
+            batch = []
+            for remote_id in range(batch_start, min(batch_start + INSERT_BATCH_SIZE, rows + 1)):
+                index = remote_id % len(files)
+                refcounts[index] += 1
+                local_path, digest, _ = files[index]
+                animated = rng.random() < 0.2
+                batch.append({
+                    "remote_id": remote_id,
+                    "title": random_title(rng),
+                    "view_count": rng.randrange(10000),
+                    "download_count": rng.randrange(1000),
+                    "thumbnail_url": f"/thumbs/{remote_id}.jpg",
+                    "local_path": local_path,
+                    "content_hash": digest,
+                    "filename": f"{remote_id}.jpg",
+                    "duration": "GIF" if animated else "图片",
+                    "image_type": "animated" if animated else "static",
+                    "mtime": now - rng.randrange(365 * 86400),
+                })
+            conn.execute(insert(models.Image), batch)
+            logger.info(f"Seeded {min(batch_start + INSERT_BATCH_SIZE - 1, rows)}/{rows} images")
+
+        conn.execute(insert(models.Blob), [
+            {"path": local_path, "content_hash": digest, "size": size, "refcount": refcount}
+            for (local_path, digest, size), refcount in zip(files, refcounts) if refcount
+        ])
+
+    db = database.SessionLocal()
+    try:
+        catalog.init_stats(db)
+        db.execute(update(models.CatalogStat).where(
+            models.CatalogStat.key == catalog.IMAGE_COUNT
+        ).values(value=rows))
+        catalog.bump_version(db)
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "rows": rows,
+        "files": len(files),
+        "seconds": round(time.perf_counter() - started, 2),
+        "local_paths": [f[0] for f in files],
+    }
@@ -0,0 +1,21 @@
+# Multi-worker profile: gunicorn -c gunicorn.conf.py app.main:app
+# Each worker is a uvicorn event loop; the leader lock (app/leader.py) makes sure only one of them
+# runs the crawl scheduler and the full sync.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Large uploads and slow clients: give requests time before the worker is recycled
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+def on_starting(server):
+    # Create tables, run migrations and the initial user once, before any worker is forked
+    from app import bootstrap, database
+    bootstrap.run()
+    # Don't let forked workers inherit the master's SQLite connections
+    database.engine.dispose()
@@ -0,0 +1,86 @@
+"""
+测试共用的夹具（在 backend 目录下运行 python -m pytest）。
+
+应用使用相对路径 data/...，与 bench/run.py 一样，必须在导入 app 之前切换到隔离的工作目录。
+每个测试开始前把数据库恢复为初始化好的副本，图片文件放在各自的临时目录中，互不影响。
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="pighub-tests-"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app import auth, bootstrap, cache, catalog, counters, database, derivatives, main, models  # noqa: E402
+
+# SQLAlchemy 在创建引擎时就把相对路径解析为绝对路径，数据库文件固定在导入时的工作目录中
+DB_PATH = os.path.abspath("data/app.db")
+
+@pytest.fixture(scope="session")
+def template_db() -> str:
+    # 建表、迁移、初始用户（bcrypt）只执行一次，之后每个测试开始前用这份副本覆盖数据库
+    bootstrap.run()
+    database.engine.dispose()
+    template = DB_PATH + ".template"
+    shutil.copy(DB_PATH, template)
+    return template
+
+@pytest.fixture(autouse=True)
+def workdir(template_db, tmp_path, monkeypatch):
+    database.engine.dispose()
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    shutil.copy(template_db, DB_PATH)
+    # 图片文件使用每个测试自己的 data/images
+    os.makedirs(tmp_path / "data" / "images")
+    monkeypatch.chdir(tmp_path)
+    cache.backend.clear()
+    counters._take_pending()
+    # 衍生图队列不在测试中运行
+    monkeypatch.setattr(derivatives, "enqueue", lambda image_ids: None)
+    yield tmp_path
+    database.engine.dispose()
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def client():
+    main.app.dependency_overrides[auth.get_current_user] = lambda: models.User(username="tester")
+    try:
+        # 不进入 with 块：不触发 startup 事件（调度器、全量同步等后台任务）
+        yield TestClient(main.app)
+    finally:
+        main.app.dependency_overrides.clear()
+
+@pytest.fixture
+def add_images(db):
+    """
+    插入若干条抓取的图片记录（不写文件），返回按插入顺序的 Image 列表
+    """
+    def add(count: int, start: int = 1, source_id: int = 1, **fields):
+        images = []
+        for remote_id in range(start, start + count):
+            values = {
+                "title": f"image {remote_id}", "view_count": 0, "download_count": 0, "thumbnail_url": "",
+                "local_path": f"{remote_id}.png", "filename": f"{remote_id}.png", "duration": "图片",
+                "image_type": "static", "mtime": 1700000000 + remote_id,
+            }
+            values.update(fields)
+            images.append(models.Image(remote_id=remote_id, source_id=source_id, **values))
+        db.add_all(images)
+        catalog.adjust_image_count(db, len(images))
+        db.commit()
+        return images
+    return add
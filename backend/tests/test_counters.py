@@ -0,0 +1,70 @@
+import asyncio
+
+from app import catalog, counters, models
+
+def _flush():
+    asyncio.run(counters.flush())
+
+def test_flush_writes_accumulated_increments(client, db, add_images):
+    first, second = add_images(2)
+    for _ in range(3):
+        assert client.post(f"/api/images/{first.id}/view").status_code == 204
+    client.post(f"/api/images/{second.id}/download")
+
+    # 请求路径只在内存中累加
+    db.expire_all()
+    assert db.get(models.Image, first.id).view_count == 0
+
+    _flush()
+
+    db.expire_all()
+    assert db.get(models.Image, first.id).view_count == 3
+    assert (db.get(models.Image, second.id).view_count, db.get(models.Image, second.id).download_count) == (0, 1)
+
+def test_flush_bumps_only_the_counter_version(db, add_images):
+    image, = add_images(1)
+    catalog_version = catalog.get_version(db)
+    counter_version = catalog.get_version(db, catalog.COUNTER_VERSION)
+
+    counters.record_view(image.id)
+    _flush()
+
+    db.expire_all()
+    assert catalog.get_version(db) == catalog_version
+    assert catalog.get_version(db, catalog.COUNTER_VERSION) == counter_version + 1
+
+def test_flush_invalidates_popular_listing_but_keeps_latest_etag(client, add_images):
+    first, second = add_images(2)
+    latest = client.get("/api/images")
+    popular = client.get("/api/images", params={"sort": "popular"})
+    assert [image["remote_id"] for image in popular.json()["data"]] == [2, 1]
+
+    counters.record_view(first.id)
+    _flush()
+
+    assert client.get("/api/images", headers={"If-None-Match": latest.headers["etag"]}).status_code == 304
+    refreshed = client.get("/api/images", params={"sort": "popular"}, headers={"If-None-Match": popular.headers["etag"]})
+    assert refreshed.status_code == 200
+    assert [image["remote_id"] for image in refreshed.json()["data"]] == [1, 2]
+
+def test_failed_flush_keeps_increments_for_the_next_one(db, add_images, monkeypatch):
+    image, = add_images(1)
+    counters.record_view(image.id)
+
+    write = counters._write
+    calls = []
+
+    def fail_once(session, pending):
+        calls.append(dict(pending))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        write(session, pending)
+
+    monkeypatch.setattr(counters, "_write", fail_once)
+    _flush()
+    counters.record_view(image.id)
+    _flush()
+
+    assert calls == [{image.id: [1, 0]}, {image.id: [2, 0]}]
+    db.expire_all()
+    assert db.get(models.Image, image.id).view_count == 2
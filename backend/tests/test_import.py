@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+
+from app import bulk, catalog, models, storage
+
+def _write_file(local_path: str, data: bytes) -> str:
+    file_path = os.path.join(storage.IMAGE_DIR, local_path)
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "wb") as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+def _record(remote_id: int, local_path: str, source_id=1, **fields) -> dict:
+    record = {
+        "remote_id": remote_id, "source_id": source_id, "local_path": local_path, "title": f"image {remote_id}",
+        "view_count": 0, "download_count": 0, "thumbnail_url": "", "filename": local_path,
+        "duration": "图片", "image_type": "static", "mtime": 0,
+    }
+    record.update(fields)
+    return record
+
+def _import(client, lines) -> dict:
+    body = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+    response = client.post("/api/admin/import", content=body.encode())
+    assert response.status_code == 200
+    return response.json()
+
+def _images(db):
+    db.expire_all()
+    return db.query(models.Image).order_by(models.Image.id).all()
+
+def test_export_then_import_updates_in_place(client, db, add_images):
+    add_images(3)
+    exported = client.get("/api/admin/export").text.splitlines()
+    edited = [json.loads(line) for line in exported]
+    edited[0]["title"] = "renamed"
+
+    result = _import(client, edited)
+
+    assert result == {"created": 0, "updated": 3, "failed": 0, "errors": []}
+    assert [image.title for image in _images(db)] == ["renamed", "image 2", "image 3"]
+    assert catalog.get_image_count(db) == 3
+
+def test_new_crawled_record_is_created_with_a_blob_reference(client, db):
+    digest = _write_file("new.png", b"new")
+
+    result = _import(client, [_record(7, "new.png", content_hash=digest)])
+
+    assert result["created"] == 1
+    image, = _images(db)
+    assert (image.source_id, image.remote_id, image.content_hash) == (1, 7, digest)
+    assert db.get(models.Blob, "new.png").refcount == 1
+    assert catalog.get_image_count(db) == 1
+
+def test_record_without_content_hash_is_hashed_and_refcounted(client, db):
+    digest = _write_file("nohash.png", b"payload")
+
+    _import(client, [_record(8, "nohash.png")])
+
+    image, = _images(db)
+    assert image.content_hash == digest
+    assert db.get(models.Blob, "nohash.png").refcount == 1
+
+def test_missing_file_and_invalid_lines_are_reported(client, db):
+    result = _import(client, [_record(9, "absent.png"), "{not json", _record(10, "absent2.png")])
+
+    assert result["created"] == 0
+    assert result["failed"] == 3
+    assert len(result["errors"]) == 3
+    assert _images(db) == []
+
+def test_uploads_are_matched_by_content_hash_not_remote_id(client, db):
+    local_digest = _write_file("local.png", b"local upload")
+    db.add(models.Image(remote_id=-1, source_id=None, title="local", local_path="local.png", content_hash=local_digest))
+    storage.acquire(db, "local.png", local_digest)
+    catalog.adjust_image_count(db, 1)
+    db.commit()
+    foreign_digest = _write_file("foreign.png", b"foreign upload")
+
+    # 另一个库导出的上传图片也用 -1，但内容不同
+    result = _import(client, [
+        _record(-1, "foreign.png", source_id=None, title="foreign", content_hash=foreign_digest),
+        _record(-5, "local.png", source_id=None, title="local renamed", content_hash=local_digest),
+    ])
+
+    assert (result["created"], result["updated"]) == (1, 1)
+    local, foreign = _images(db)
+    assert (local.remote_id, local.title) == (-1, "local renamed")
+    assert (foreign.remote_id, foreign.title) == (-2, "foreign")
+    # 之后的上传从导入分配的 id 继续，不会重复
+    assert catalog.allocate_upload_remote_id(db) == -3
+
+def test_reimporting_uploads_does_not_duplicate_them(client, db):
+    digest = _write_file("up.png", b"upload")
+    records = [_record(-3, "up.png", source_id=None, content_hash=digest)] * 2
+
+    assert _import(client, records)["created"] == 2
+    assert _import(client, records) == {"created": 0, "updated": 2, "failed": 0, "errors": []}
+    assert len(_images(db)) == 2
+    assert db.get(models.Blob, "up.png").refcount == 2
+
+def test_conflicting_batch_falls_back_to_row_by_row(client, db, monkeypatch):
+    digest = _write_file("a.png", b"a")
+    calls = []
+    original = bulk._import_batch
+
+    def conflict_once(session, records):
+        calls.append(len(records))
+        if len(calls) == 1:
+            # 模拟与并发写入的行冲突：整批失败
+            session.add(models.Image(remote_id=1, source_id=1, local_path="a.png"))
+            session.add(models.Image(remote_id=1, source_id=1, local_path="a.png"))
+            session.flush()
+        return original(session, records)
+
+    monkeypatch.setattr(bulk, "_import_batch", conflict_once)
+    result = _import(client, [_record(1, "a.png", content_hash=digest), _record(2, "a.png", content_hash=digest)])
+
+    assert calls == [2, 1, 1]
+    assert (result["created"], result["failed"]) == (2, 0)
+    assert [image.remote_id for image in _images(db)] == [1, 2]
@@ -0,0 +1,82 @@
+import base64
+import json
+
+import pytest
+
+def _cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def _walk(client, **params):
+    """
+    按 next_cursor 翻完所有页，返回 (各页的 remote_id 列表, 第一页的 total)
+    """
+    pages = []
+    response = client.get("/api/images", params=params).json()
+    total = response["total"]
+    while True:
+        pages.append([image["remote_id"] for image in response["data"]])
+        if response["next_cursor"] is None:
+            return pages, total
+        response = client.get("/api/images", params={**params, "cursor": response["next_cursor"]}).json()
+
+def test_cursor_walk_returns_every_image_once_newest_first(client, add_images):
+    add_images(25)
+    pages, total = _walk(client, limit=10)
+
+    assert total == 25
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == list(range(25, 0, -1))
+
+def test_cursor_matches_offset_pages(client, add_images):
+    add_images(30)
+    first = client.get("/api/images", params={"limit": 10}).json()
+    by_cursor = client.get("/api/images", params={"limit": 10, "cursor": first["next_cursor"]}).json()
+    by_page = client.get("/api/images", params={"limit": 10, "page": 2}).json()
+
+    assert by_cursor["data"] == by_page["data"]
+
+def test_popular_cursor_breaks_ties_by_id(client, add_images):
+    add_images(6, view_count=5)
+    add_images(3, start=7, view_count=9)
+    pages, _ = _walk(client, sort="popular", limit=4)
+
+    # 浏览数相同的图片按 id 倒序，翻页时既不重复也不遗漏
+    assert sum(pages, []) == [9, 8, 7, 6, 5, 4, 3, 2, 1]
+
+def test_after_remote_id_seeks_below_the_given_id(client, add_images):
+    add_images(10)
+    response = client.get("/api/images", params={"after_remote_id": 6, "limit": 3}).json()
+
+    assert [image["remote_id"] for image in response["data"]] == [5, 4, 3]
+
+def test_after_remote_id_is_rejected_for_popularity_sorts(client, add_images):
+    add_images(3)
+    response = client.get("/api/images", params={"sort": "popular", "after_remote_id": 2})
+
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!",
+    _cursor([1]),
+    _cursor("1,2"),
+    _cursor(["x", 1]),
+    "WzFlOTk5LDFd",  # [1e999,1]
+    _cursor([10 ** 20, 1]),
+])
+def test_invalid_cursor_is_rejected(client, cursor):
+    assert client.get("/api/images", params={"cursor": cursor}).status_code == 400
+
+def test_out_of_range_after_remote_id_is_rejected(client):
+    assert client.get("/api/images", params={"after_remote_id": 10 ** 20}).status_code == 400
+
+@pytest.mark.parametrize("params", [{"limit": 0}, {"limit": 101}, {"page": 0}])
+def test_page_bounds_are_validated(client, params):
+    assert client.get("/api/images", params=params).status_code == 422
+
+def test_total_follows_facet_filters(client, add_images):
+    add_images(4)
+    add_images(3, start=5, image_type="animated", duration="GIF")
+
+    assert client.get("/api/images", params={"image_type": "animated"}).json()["total"] == 3
+    assert client.get("/api/images", params={"image_type": "static", "mtime_min": 1700000003}).json()["total"] == 2
+    assert client.get("/api/images/facets").json()["image_type"] == {"static": 4, "animated": 3}
@@ -0,0 +1,57 @@
+from app import search
+
+def _search(client, q, **params):
+    response = client.get("/api/search", params={"q": q, **params})
+    assert response.status_code == 200
+    return [image["title"] for image in response.json()]
+
+def test_tokenize_splits_cjk_into_unigrams_and_bigrams():
+    unigrams, bigrams, words = search._tokenize("可爱小猪 Cute_pig2")
+
+    assert unigrams == ["可", "爱", "小", "猪"]
+    assert bigrams == ["可爱", "爱小", "小猪"]
+    assert words == ["cute", "pig2"]
+
+def test_match_query_uses_bigrams_for_runs_and_unigrams_for_single_characters():
+    assert search.build_match_query("猪") == '"猪"'
+    assert search.build_match_query("小猪") == '"小猪"'
+    assert search.build_match_query("小猪 跳 go") == '"跳" "小猪" "go"*'
+    assert search.build_match_query("!!!") == ""
+
+def test_bigram_query_needs_adjacent_characters(client, add_images):
+    add_images(1, title="一只小猪")
+    add_images(1, start=2, title="小的猪")
+
+    assert _search(client, "小猪") == ["一只小猪"]
+
+def test_single_character_query_returns_newest_first(client, add_images):
+    add_images(1, title="猪")
+    add_images(1, start=2, title="狗")
+    add_images(1, start=3, title="小猪跳舞")
+    add_images(1, start=4, title="猪猪")
+
+    assert _search(client, "猪") == ["猪猪", "小猪跳舞", "猪"]
+    assert _search(client, "猪", limit=1, page=2) == ["小猪跳舞"]
+
+def test_words_match_by_prefix_case_insensitively(client, add_images):
+    add_images(1, title="Happy Pig")
+    add_images(1, start=2, title="happiness")
+    add_images(1, start=3, title="sad pig")
+
+    assert sorted(_search(client, "HAPP")) == ["Happy Pig", "happiness"]
+    assert _search(client, "happ pig") == ["Happy Pig"]
+
+def test_index_follows_renames_and_deletes(client, add_images):
+    image, = add_images(1, title="开心")
+
+    client.put(f"/api/images/{image.id}/rename", json={"title": "生气"})
+    assert _search(client, "开心") == []
+    assert _search(client, "生气") == ["生气"]
+
+    client.delete(f"/api/images/{image.id}")
+    assert _search(client, "生气") == []
+
+def test_blank_query_returns_nothing(client, add_images):
+    add_images(2)
+
+    assert _search(client, "   ") == []
@@ -0,0 +1,76 @@
+import hashlib
+import io
+import os
+
+from PIL import Image as PILImage
+
+from app import models, storage
+
+def _png(color: str) -> bytes:
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (8, 8), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+def _upload(client, data: bytes, name: str = "a.png") -> dict:
+    response = client.post("/api/upload", files={"file": (name, data, "image/png")}, data={"title": name})
+    assert response.status_code == 200
+    return response.json()
+
+def _blob(db, local_path: str):
+    db.expire_all()
+    return db.get(models.Blob, local_path)
+
+def test_identical_uploads_share_one_content_addressed_file(client, db):
+    data = _png("red")
+    first = _upload(client, data, "a.png")
+    second = _upload(client, data, "b.png")
+
+    assert first["local_path"] == second["local_path"]
+    assert first["local_path"] == storage.blob_path(hashlib.sha256(data).hexdigest(), ".png")
+    assert _blob(db, first["local_path"]).refcount == 2
+
+def test_file_is_removed_only_with_the_last_reference(client, db):
+    data = _png("blue")
+    first = _upload(client, data, "a.png")
+    second = _upload(client, data, "b.png")
+    file_path = os.path.join(storage.IMAGE_DIR, first["local_path"])
+
+    assert client.delete(f"/api/images/{first['id']}").status_code == 200
+    assert os.path.exists(file_path)
+    assert _blob(db, first["local_path"]).refcount == 1
+
+    assert client.delete(f"/api/images/{second['id']}").status_code == 200
+    assert not os.path.exists(file_path)
+    assert _blob(db, first["local_path"]) is None
+
+def test_different_content_gets_separate_blobs(client, db):
+    first = _upload(client, _png("red"))
+    second = _upload(client, _png("green"))
+
+    assert first["local_path"] != second["local_path"]
+    assert _blob(db, first["local_path"]).refcount == 1
+    assert _blob(db, second["local_path"]).refcount == 1
+
+def test_acquire_counts_crawled_and_uploaded_references_together(client, db, add_images):
+    data = _png("white")
+    uploaded = _upload(client, data)
+    crawled, = add_images(1, local_path=uploaded["local_path"], content_hash=hashlib.sha256(data).hexdigest())
+    storage.acquire(db, crawled.local_path, crawled.content_hash)
+    db.commit()
+    assert _blob(db, uploaded["local_path"]).refcount == 2
+
+    assert storage.release(db, crawled) is False
+    db.commit()
+    assert _blob(db, uploaded["local_path"]).refcount == 1
+
+def test_images_without_blob_rows_own_their_file(db, add_images):
+    # 迁移前的旧图片没有 content_hash，删除时直接删除文件
+    legacy, = add_images(1, content_hash=None)
+
+    assert storage.release(db, legacy) is True
+
+def test_rejected_upload_leaves_no_file(client):
+    response = client.post("/api/upload", files={"file": ("a.txt", b"not an image", "text/plain")}, data={"title": "x"})
+
+    assert response.status_code == 415
+    assert not os.path.isdir(storage.STAGING_DIR) or os.listdir(storage.STAGING_DIR) == []
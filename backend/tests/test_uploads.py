@@ -0,0 +1,72 @@
+import io
+import threading
+
+from PIL import Image as PILImage
+
+from app import catalog, database
+
+def _png(color: str) -> bytes:
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (8, 8), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+def _allocate() -> int:
+    session = database.SessionLocal()
+    try:
+        value = catalog.allocate_upload_remote_id(session)
+        session.commit()
+        return value
+    finally:
+        session.close()
+
+def test_upload_ids_continue_below_existing_uploads(client, add_images):
+    add_images(1, start=-7, source_id=None)
+    add_images(2, start=1)
+
+    response = client.post("/api/upload", files={"file": ("a.png", _png("red"), "image/png")}, data={"title": "a"})
+
+    assert response.status_code == 200
+    assert response.json()["remote_id"] == -8
+    assert _allocate() == -9
+
+def test_concurrent_allocations_are_unique():
+    values = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(20):
+            value = _allocate()
+            with lock:
+                values.append(value)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(values) == list(range(-160, 0))
+
+def test_batch_upload_reports_each_file(client):
+    response = client.post("/api/upload/batch", files=[
+        ("files", ("a.png", _png("red"), "image/png")),
+        ("files", ("b.txt", b"plain text", "text/plain")),
+        ("files", ("c.png", _png("blue"), "image/png")),
+    ])
+
+    results = response.json()
+    assert [(result["filename"], result["ok"]) for result in results] == [("a.png", True), ("b.txt", False), ("c.png", True)]
+    assert [result["image"]["remote_id"] for result in results if result["ok"]] == [-1, -2]
+
+def test_part_without_filename_is_rejected_with_400(client):
+    boundary = "boundary"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nt\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"\r\nContent-Type: image/png\r\n\r\n"
+    ).encode() + _png("red") + f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post("/api/upload", content=body,
+                           headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+
+    assert response.status_code == 400
+    assert "filename" in response.json()["detail"]
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
-import { Card, List, Pagination, Spin, Typography, Input, Button, message, Space } from 'antd';
+import { Card, List, Pagination, Spin, Typography, Input, Button, message, Space, Segmented } from 'antd';
 import { DownloadOutlined, FileImageOutlined } from '@ant-design/icons';
-import { getImages, getImageUrl, searchImages, type Image } from '../services/api';
+import { getFacets, getImages, getImageUrl, getSrcSet, searchImages, recordDownload, recordView, type Image, type ImageFacets, type ImageSort } from '../services/api';
 
 const { Title } = Typography;
 const { Search } = Input;
@@ -12,12 +12,15 @@ const Gallery: React.FC = () => {
     const [total, setTotal] = useState(0);
     const [page, setPage] = useState(1);
     const [searchQuery, setSearchQuery] = useState('');
+    const [sort, setSort] = useState<ImageSort>('latest');
+    const [imageType, setImageType] = useState('');
+    const [facets, setFacets] = useState<ImageFacets | null>(null);
     const pageSize = 20;
 
     const fetchData = async (p: number) => {
         setLoading(true);
         try {
-            const data = await getImages(p, pageSize);
+            const data = await getImages(p, pageSize, sort, imageType || undefined);
             setImages(data.data);
             setTotal(data.total);
         } catch (error) {
@@ -49,6 +52,7 @@ const Gallery: React.FC = () => {
     };
 
     const handleCardClick = async (item: Image) => {
+        recordView(item.id);
         try {
             const url = getImageUrl(item.local_path);
             const response = await fetch(url);
@@ -101,6 +105,7 @@ const Gallery: React.FC = () => {
 
     const handleCopyBase64 = async (item: Image, e: React.MouseEvent) => {
         e.stopPropagation();
+        recordView(item.id);
         try {
             if (!navigator.clipboard || !navigator.clipboard.writeText) {
                 message.error('剪贴板功能不可用，请使用 HTTPS 访问');
@@ -129,6 +134,7 @@ const Gallery: React.FC = () => {
 
     const handleDownload = (item: Image, e: React.MouseEvent) => {
         e.stopPropagation();
+        recordDownload(item.id);
         const url = getImageUrl(item.local_path);
         const link = document.createElement('a');
         link.href = url;
@@ -143,7 +149,13 @@ const Gallery: React.FC = () => {
         if (!searchQuery) {
             fetchData(page);
         }
-    }, [page]);
+    }, [page, sort, imageType]);
+
+    useEffect(() => {
+        getFacets().then(setFacets).catch((error) => console.error('Failed to fetch facets', error));
+    }, []);
+
+    const typeCount = (value: string) => (facets ? ` (${facets.image_type[value] ?? 0})` : '');
 
     return (
         <div style={{ padding: '24px', backgroundColor: '#ffffff', minHeight: '100vh' }}>
@@ -161,6 +173,36 @@ const Gallery: React.FC = () => {
                 />
             </div>
 
+            {!searchQuery && (
+                <div style={{ textAlign: 'center', marginBottom: '24px' }}>
+                    <Segmented
+                        value={sort}
+                        options={[
+                            { label: '最新', value: 'latest' },
+                            { label: '最热', value: 'popular' },
+                            { label: '最多下载', value: 'downloads' },
+                        ]}
+                        onChange={(value) => {
+                            setSort(value as ImageSort);
+                            setPage(1);
+                        }}
+                    />
+                    <Segmented
+                        style={{ marginLeft: '16px' }}
+                        value={imageType}
+                        options={[
+                            { label: '全部', value: '' },
+                            { label: `静态${typeCount('static')}`, value: 'static' },
+                            { label: `动图${typeCount('animated')}`, value: 'animated' },
+                        ]}
+                        onChange={(value) => {
+                            setImageType(value as string);
+                            setPage(1);
+                        }}
+                    />
+                </div>
+            )}
+
             {loading ? (
                 <div style={{ textAlign: 'center', padding: '50px' }}>
                     <Spin size="large" />
@@ -177,11 +219,28 @@ const Gallery: React.FC = () => {
                                     onClick={() => handleCardClick(item)}
                                     cover={
                                         <div style={{ height: 200, overflow: 'hidden', backgroundColor: '#f5f5f5' }}>
-                                            <img
-                                                alt={item.title}
-                                                src={getImageUrl(item.local_path)}
-                                                style={{ width: '100%', height: '100%', objectFit: 'cover' }}
-                                            />
+                                            <picture>
+                                                {getSrcSet(item, 'avif') && (
+                                                    <source
+                                                        type="image/avif"
+                                                        srcSet={getSrcSet(item, 'avif')}
+                                                        sizes="(max-width: 576px) 100vw, 320px"
+                                                    />
+                                                )}
+                                                {getSrcSet(item, 'webp') && (
+                                                    <source
+                                                        type="image/webp"
+                                                        srcSet={getSrcSet(item, 'webp')}
+                                                        sizes="(max-width: 576px) 100vw, 320px"
+                                                    />
+                                                )}
+                                                <img
+                                                    alt={item.title}
+                                                    src={getImageUrl(item.local_path)}
+                                                    loading="lazy"
+                                                    style={{ width: '100%', height: '100%', objectFit: 'cover' }}
+                                                />
+                                            </picture>
                                         </div>
                                     }
                                     style={{ backgroundColor: '#fff', border: '1px solid #e8e8e8' }}
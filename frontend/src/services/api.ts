@@ -25,6 +25,12 @@ api.interceptors.response.use(
     }
 );
 
+export interface ImageVariant {
+    width: number;
+    format: string;
+    path: string;
+}
+
 export interface Image {
     id: number;
     remote_id: number;
@@ -37,6 +43,9 @@ export interface Image {
     duration: string;
     image_type: string;
     mtime: number;
+    variants: ImageVariant[];
+    width: number | null;
+    height: number | null;
     created_at: string;
 }
 
@@ -49,11 +58,33 @@ export interface CrawlLog {
     created_at: string;
 }
 
-export const getImages = async (page: number = 1, limit: number = 20) => {
-    const response = await api.get(`/api/images?page=${page}&limit=${limit}`);
+export type ImageSort = 'latest' | 'popular' | 'downloads';
+
+export interface ImageFacets {
+    image_type: Record<string, number>;
+    duration: Record<string, number>;
+}
+
+export const getImages = async (page: number = 1, limit: number = 20, sort: ImageSort = 'latest', imageType?: string) => {
+    const typeParam = imageType ? `&image_type=${encodeURIComponent(imageType)}` : '';
+    const response = await api.get(`/api/images?page=${page}&limit=${limit}&sort=${sort}${typeParam}`);
+    return response.data;
+};
+
+export const getFacets = async (): Promise<ImageFacets> => {
+    const response = await api.get('/api/images/facets');
     return response.data;
 };
 
+// Fire-and-forget usage tracking; the server batches these in memory
+export const recordView = (id: number) => {
+    api.post(`/api/images/${id}/view`).catch(() => undefined);
+};
+
+export const recordDownload = (id: number) => {
+    api.post(`/api/images/${id}/download`).catch(() => undefined);
+};
+
 export const login = async (formData: FormData) => {
     const response = await api.post('/token', formData);
     return response.data;
@@ -83,6 +114,23 @@ export const getImageUrl = (localPath: string) => {
     return `${API_URL}/images/${localPath}`;
 };
 
+// Thumbnails of one format as a srcset string; the original stays the fallback src.
+// Descriptors use the real variant width (older rows recorded the target width, so clamp
+// to the original), and variants that collapse to the same width are listed once.
+export const getSrcSet = (image: Image, format: 'webp' | 'avif' = 'webp') => {
+    const seen = new Set<number>();
+    return image.variants
+        .filter((v) => v.format === format)
+        .map((v) => ({ ...v, width: image.width ? Math.min(v.width, image.width) : v.width }))
+        .filter((v) => {
+            if (seen.has(v.width)) return false;
+            seen.add(v.width);
+            return true;
+        })
+        .map((v) => `${getImageUrl(v.path)} ${v.width}w`)
+        .join(', ');
+};
+
 export const uploadImage = async (file: File, title: string) => {
     const formData = new FormData();
     formData.append('file', file);